@@ -0,0 +1,257 @@
+"""
+Keeps the audio of frequently played songs on disk, so replays don't stream them
+from YouTube again.
+"""
+# pylint: disable=too-many-instance-attributes
+
+import collections
+import concurrent.futures
+import logging
+import os
+import re
+import tempfile
+import threading
+import urllib.request
+
+from media_cache import AudioStream
+
+
+class AudioFileCache:
+    """
+    Size bounded directory of the Opus/WebM audio of songs, one file per video.
+
+    A song's audio is downloaded in the background once it has been played
+    `min_plays` times, after which it is played from the file instead of its
+    stream URL. When the files take up more than `max_bytes`, the ones played the
+    fewest times are removed, least recently played first. Play counts are aged
+    (LFU with dynamic aging): every file's priority is its plays plus the
+    priority of the last file evicted when it was last played. Songs that were
+    popular long ago therefore don't keep new downloads from staying, and an
+    evicted song keeps its play count. Files which are pinned, because they are
+    playing or about to play, are never removed.
+
+    Files are written under a temporary name and renamed once complete, so a
+    file with the final name is never partial, even after a crash. All methods
+    are thread-safe.
+    """
+
+    DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+    DEFAULT_MIN_PLAYS = 3
+    # Number of videos whose plays are counted before they are cached
+    MAX_TRACKED = 4096
+    CHUNK_BYTES = 64 * 1024
+    DOWNLOAD_TIMEOUT_SECONDS = 30
+    EXTENSION = ".webm"
+    PARTIAL_EXTENSION = ".part"
+    video_id_regex = re.compile(r"^[\w-]{11}$")
+
+    def __init__(
+        self,
+        directory,
+        max_bytes=DEFAULT_MAX_BYTES,
+        min_plays=DEFAULT_MIN_PLAYS,
+        executor=None,
+    ):
+        """
+        Arguments:
+          directory: Directory the audio files are kept in, created if needed.
+            Files already in it are served and counted towards max_bytes.
+          max_bytes: Size budget of all files together.
+          min_plays: Number of plays after which a song's audio is downloaded.
+          executor: Executor the downloads run in. A single thread by default, so
+            that downloads don't compete with playback for bandwidth.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="audio-cache"
+        )
+        self.hits = 0
+        self.downloads = 0
+
+        self._lock = threading.Lock()
+        self._plays = collections.OrderedDict()  # video id -> plays, not cached
+        # Cached files by when they were last played, oldest first
+        self._files = collections.OrderedDict()  # video id -> [size, plays, priority]
+        self._downloading = set()
+        self._futures = set()  # Downloads which haven't finished
+        self._pins = {}  # owner -> video ids it uses
+        # Priority of the last evicted file, added to the plays of new files
+        self._age = 0
+        self.size = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Pick up the files left by an earlier run, oldest first"""
+        found = []
+        for entry in os.scandir(self.directory):
+            name, extension = os.path.splitext(entry.name)
+            if extension == self.PARTIAL_EXTENSION:
+                # Left behind by a download which didn't finish
+                os.remove(entry.path)
+            elif extension == self.EXTENSION and self.video_id_regex.match(name):
+                stat = entry.stat()
+                found.append((stat.st_mtime, name, stat.st_size))
+        for _, video_id, size in sorted(found):
+            # Only songs played min_plays times were cached in the first place
+            self._files[video_id] = [size, self.min_plays, self.min_plays]
+            self.size += size
+        self._evict()
+        logging.info("Audio cache has %d files, %d bytes", len(self._files), self.size)
+
+    def path(self, video_id):
+        """Path the audio of video_id is kept at"""
+        return os.path.join(self.directory, video_id + self.EXTENSION)
+
+    def get(self, video_id):
+        """
+        Returns an AudioStream playing the cached file of video_id, or None if it
+        isn't cached
+        """
+        with self._lock:
+            if video_id not in self._files:
+                return None
+            self._files.move_to_end(video_id)
+            self.hits += 1
+        return AudioStream(self.path(video_id), "opus")
+
+    def played(self, video_id, audio_stream):
+        """
+        Count a play of video_id, and download its audio from audio_stream in the
+        background once it has been played often enough. Returns the future of the
+        download if one was started, otherwise None.
+        """
+        if not self.video_id_regex.match(video_id):
+            return None
+        with self._lock:
+            if video_id in self._files:
+                entry = self._files[video_id]
+                entry[1] += 1
+                entry[2] = entry[1] + self._age
+                return None
+            plays = self._plays.pop(video_id, 0) + 1
+            self._plays[video_id] = plays
+            while len(self._plays) > self.MAX_TRACKED:
+                self._plays.popitem(last=False)
+            # Only Opus streams can be stored as they are and passed through
+            if (
+                plays < self.min_plays
+                or audio_stream.codec != "opus"
+                or video_id in self._downloading
+            ):
+                return None
+            self._downloading.add(video_id)
+        future = self.executor.submit(self._download, video_id, audio_stream.url)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future):
+        """Stop tracking a download once it has finished or been cancelled"""
+        with self._lock:
+            self._futures.discard(future)
+
+    def _download(self, video_id, url):
+        """Download url to the file of video_id. Runs in the executor."""
+        try:
+            size = self._fetch(video_id, url)
+        except (OSError, ValueError) as err:
+            logging.warning("Unable to cache audio of %s: %s", video_id, err)
+            return False
+        finally:
+            with self._lock:
+                self._downloading.discard(video_id)
+        if size is None:
+            return False
+
+        with self._lock:
+            plays = self._plays.pop(video_id, self.min_plays)
+            self._files[video_id] = [size, plays, plays + self._age]
+            self.size += size
+            self.downloads += 1
+            self._evict()
+        logging.info("Cached audio of %s, %d bytes", video_id, size)
+        return True
+
+    def _fetch(self, video_id, url):
+        """
+        Write the audio at url to the file of video_id, returning its size, or None
+        if it doesn't fit in the budget
+        """
+        request = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
+        descriptor, partial_path = tempfile.mkstemp(
+            prefix=video_id, suffix=self.PARTIAL_EXTENSION, dir=self.directory
+        )
+        try:
+            size = 0
+            with os.fdopen(descriptor, "wb") as partial, urllib.request.urlopen(
+                request, timeout=self.DOWNLOAD_TIMEOUT_SECONDS
+            ) as response:
+                while True:
+                    chunk = response.read(self.CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        logging.info("Audio of %s is too big to cache", video_id)
+                        return None
+                    partial.write(chunk)
+                partial.flush()
+                os.fsync(partial.fileno())
+            os.replace(partial_path, self.path(video_id))
+            partial_path = None
+            return size
+        finally:
+            if partial_path is not None:
+                os.remove(partial_path)
+
+    def pin(self, owner, video_ids):
+        """
+        Keep the files of video_ids from being evicted, replacing what `owner`
+        pinned before. Pass no video ids to unpin everything of owner.
+        """
+        with self._lock:
+            if video_ids:
+                self._pins[owner] = set(video_ids)
+            else:
+                self._pins.pop(owner, None)
+
+    def _evict(self):
+        """Remove files until they fit in the budget. Call with the lock held."""
+        pinned = set().union(*self._pins.values())
+        while self.size > self.max_bytes:
+            # Lowest priority first, the least recently played of those on ties
+            video_id = min(
+                (key for key in self._files if key not in pinned),
+                key=lambda key: self._files[key][2],
+                default=None,
+            )
+            if video_id is None:
+                # Evicted once they are unpinned and another file is added
+                logging.info("Audio cache is over budget, all files are in use")
+                return
+            size, plays, priority = self._files.pop(video_id)
+            self.size -= size
+            self._age = priority
+            # Counted on, so that it is downloaded again if it stays popular
+            self._plays[video_id] = plays
+            while len(self._plays) > self.MAX_TRACKED:
+                self._plays.popitem(last=False)
+            try:
+                os.remove(self.path(video_id))
+            except OSError as err:
+                logging.warning("Unable to remove cached audio %s: %s", video_id, err)
+            logging.info("Evicted cached audio of %s", video_id)
+
+    def shutdown(self):
+        """Stop the downloads which haven't started"""
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            # Only succeeds for the downloads which are still waiting
+            future.cancel()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,466 @@
+"""
+End to end benchmarks of the bot, run against a simulated Discord gateway.
+
+Messages are delivered to a real BotDispatcher the way discord.py delivers them,
+using the stand-ins of tests/test_bot.py for messages, authors and voice clients.
+YouTube, youtube-dl and Spotify are replaced by a fake media backend which sleeps
+for a configurable latency in each lookup, so the results depend on the bot
+rather than on the network.
+
+Measures:
+  command_throughput: Commands handled per second with 1, 100 and 1000 guilds
+    sending commands at the same time.
+  playlist_ingestion: Wall time of adding a YouTube and a Spotify playlist to the
+    queue, and the time until the first song plays.
+  song_transition: Time from the end of a song until the next one plays, with the
+    next stream prefetched and with it resolved on demand.
+  memory_per_guild: Memory held by the state of one guild with a short queue.
+
+The results are written as JSON, so that runs can be compared by a script.
+
+Usage: python benchmarks/bot_benchmarks.py [--output results.json] [--quick]
+"""
+# pylint: disable=import-error,wrong-import-position,wrong-import-order
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+import bot
+from media_queue import QueueEntry
+from youtube_ingest import YouTubeIngest
+from test_bot import (
+    MockVoiceClient,
+    create_mock_author,
+    create_mock_message,
+    create_mock_spotify,
+    create_mock_track,
+    create_mock_voice_channel,
+    create_mock_voice_state,
+)
+
+YOUTUBE_PLAYLIST_URL = "https://www.youtube.com/playlist?list=PLbenchmark"
+SPOTIFY_PLAYLIST_URL = "https://open.spotify.com/playlist/benchmark"
+
+
+class FakeStream:
+    """Audio stream of a FakeMedia, as returned by pafy's getbestaudio()"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, videoid):
+        self.url = f"https://rr1.googlevideo.com/videoplayback?id={videoid}"
+        self.extension = "webm"
+
+
+class FakeMedia:
+    """Holds what the bot reads from a pafy object"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, videoid, length=200):
+        self.videoid = videoid
+        self.title = f"Song {videoid}"
+        self.length = length
+        self.expiry = time.time() + 6 * 60 * 60
+
+    def getbestaudio(self, preftype=None):  # pylint: disable=unused-argument
+        """Returns the stream of the media"""
+        return FakeStream(self.videoid)
+
+
+class FakeMediaBackend:
+    """
+    Stands in for YouTube search, youtube-dl, YouTube playlists and Spotify. Every
+    lookup sleeps for `latency` seconds on the calling thread, like a network
+    round trip.
+    """
+
+    def __init__(self, latency, playlist_size=0):
+        self.latency = latency
+        self.playlist_size = playlist_size
+        self.lookups = 0
+        self._lock = threading.Lock()
+        self.spotify = create_mock_spotify(None)
+        self.spotify.playlist_items = mock.Mock(side_effect=self.spotify_page)
+
+    def _wait(self):
+        with self._lock:
+            self.lookups += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def youtube_search(self, search_str):
+        """The result of a YouTube search, the id is derived from the term"""
+        self._wait()
+        video_id = "".join(char for char in search_str if char.isalnum())[-11:]
+        return {"result": [{"id": video_id.rjust(11, "0")}]}
+
+    def pafy_search(self, youtube_link_or_id):
+        """The media of a video link or id"""
+        self._wait()
+        return FakeMedia(youtube_link_or_id[-11:])
+
+    def youtube_page(self, start):
+        """A page of the videos of a YouTube playlist and the start of the next"""
+        self._wait()
+        end = min(start + FakeYouTubeIngest.PAGE_SIZE, self.playlist_size)
+        tracks = [
+            {"videoid": f"{index:011d}", "title": f"video{index}", "length": 200}
+            for index in range(start, end)
+        ]
+        return tracks, (end if end < self.playlist_size else None)
+
+    def youtube_ingest(self, url):
+        """Lists a YouTube playlist from this backend"""
+        return FakeYouTubeIngest(url, self)
+
+    def spotify_page(self, _url, limit, offset, **_kwargs):
+        """A page of the items of a Spotify playlist"""
+        self._wait()
+        end = min(offset + limit, self.playlist_size)
+        return {
+            "items": [
+                {"track": create_mock_track(f"track{index}", f"artist{index}")}
+                for index in range(offset, end)
+            ],
+            "total": self.playlist_size,
+        }
+
+    @contextlib.contextmanager
+    def installed(self):
+        """Make every MusicBot use this backend, and create no FFmpeg processes"""
+        with contextlib.ExitStack() as stack:
+            for name, value in (
+                ("youtube_search", staticmethod(self.youtube_search)),
+                ("pafy_search", staticmethod(self.pafy_search)),
+                ("youtube_ingest", staticmethod(self.youtube_ingest)),
+                ("get_spotify_client", lambda _self: self.spotify),
+                ("create_audio_source", mock.Mock()),
+            ):
+                stack.enter_context(mock.patch.object(bot.MusicBot, name, value))
+            yield self
+
+
+class FakeYouTubeIngest(YouTubeIngest):
+    """YouTubeIngest which fetches its pages from a FakeMediaBackend"""
+
+    PAGE_SIZE = 100
+
+    def __init__(self, url, backend):
+        super().__init__(url)
+        self.backend = backend
+
+    def first_page(self):
+        tracks, self.continuation = self.backend.youtube_page(0)
+        self.total = self.backend.playlist_size
+        return tracks
+
+    def fetch_page(self):
+        tracks, self.continuation = self.backend.youtube_page(self.continuation)
+        return tracks
+
+
+class TimedVoiceClient(MockVoiceClient):
+    """MockVoiceClient which records when audio sources start playing"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self):
+        super().__init__()
+        self.started = asyncio.Event()
+        self.start_time = None
+
+    def play(self, audio_source, after=None):
+        """Start playing and record the time"""
+        super().play(audio_source, after)
+        self.start_time = time.perf_counter()
+        self.started.set()
+
+
+class Guild:
+    """Minimal Discord guild, lighter than a Mock so it doesn't skew memory"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, guild_id):
+        self.id = guild_id  # pylint: disable=invalid-name
+
+    def get_channel(self, _channel_id):
+        """No channels are known, the bot remembers the ones it has seen"""
+        return None
+
+
+class SimulatedGateway:
+    """
+    Delivers messages to a BotDispatcher like the Discord gateway does, each in its
+    own task
+    """
+
+    def __init__(self, **dispatcher_options):
+        self.dispatcher = bot.BotDispatcher(
+            cache_db=None, idle_eviction_seconds=0, **dispatcher_options
+        )
+        self.user = create_mock_author(name="bot")
+        # The dispatcher never logs in, so set the user it would have logged in as
+        self.dispatcher._connection.user = self.user  # pylint: disable=protected-access
+        self.authors = {}
+
+    def author(self, guild, voice_client_factory=MockVoiceClient):
+        """Returns a user of `guild` who is in a voice channel"""
+        if guild not in self.authors:
+            voice_client = voice_client_factory()
+            voice_channel = create_mock_voice_channel()
+            voice_channel.connect.return_value = voice_client
+            voice_client.channel = voice_channel
+            self.authors[guild] = create_mock_author(
+                name=f"user{guild.id}",
+                voice_state=create_mock_voice_state(channel=voice_channel),
+            )
+        return self.authors[guild]
+
+    def message(self, guild, contents):
+        """Create a message sent in `guild` by its user"""
+        message = create_mock_message(contents=contents, author=self.author(guild))
+        message.guild = guild
+        return message
+
+    async def deliver(self, messages):
+        """Deliver messages concurrently and wait until they are handled"""
+        await asyncio.gather(
+            *(self.dispatcher.on_message(message) for message in messages)
+        )
+
+    async def close(self):
+        """Stop the dispatcher's workers"""
+        await self.dispatcher.close()
+
+
+def percentiles(samples):
+    """Summary of a list of durations in seconds, in milliseconds"""
+    samples = sorted(samples)
+    return {
+        "p50_ms": statistics.median(samples) * 1000,
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+async def command_throughput(n_guilds, commands_per_guild, latency):
+    """
+    Every guild plays a song, then sends a mix of commands, all guilds at once.
+    Returns the number of commands handled per second.
+    """
+    command_mix = ["-queue", "-nowplaying", "-play song {}", "-hello"]
+    backend = FakeMediaBackend(latency)
+    with backend.installed():
+        gateway = SimulatedGateway()
+        guilds = [Guild(guild_id) for guild_id in range(n_guilds)]
+        await gateway.deliver(gateway.message(guild, "-play first") for guild in guilds)
+        messages = [
+            gateway.message(guild, command_mix[index % len(command_mix)].format(index))
+            for index in range(commands_per_guild)
+            for guild in guilds
+        ]
+
+        start = time.perf_counter()
+        await gateway.deliver(messages)
+        elapsed = time.perf_counter() - start
+        await gateway.close()
+    return {
+        "guilds": n_guilds,
+        "commands": len(messages),
+        "seconds": elapsed,
+        "commands_per_second": len(messages) / elapsed,
+    }
+
+
+async def playlist_ingestion(kind, playlist_size, latency):
+    """
+    Time until the first song of a playlist plays, and until all of it is queued
+    """
+    backend = FakeMediaBackend(latency, playlist_size=playlist_size)
+    with backend.installed():
+        gateway = SimulatedGateway()
+        guild = Guild(1)
+        url = YOUTUBE_PLAYLIST_URL if kind == "youtube" else SPOTIFY_PLAYLIST_URL
+        message = gateway.message(guild, f"-play {url}")
+
+        start = time.perf_counter()
+        await gateway.deliver([message])
+        first_song = time.perf_counter() - start
+        music_bot = gateway.dispatcher.get_music_bot(guild)
+        await asyncio.gather(*list(music_bot.playlist_tasks))
+        elapsed = time.perf_counter() - start
+        queued = len(music_bot.media_deque) + 1
+        await gateway.close()
+    assert queued == playlist_size, queued
+    return {
+        "kind": kind,
+        "tracks": playlist_size,
+        "first_song_seconds": first_song,
+        "seconds": elapsed,
+        "tracks_per_second": playlist_size / elapsed,
+    }
+
+
+async def song_transition(n_songs, latency, prefetched):
+    """
+    Time from the end of a song until the next one plays. Unless `prefetched`, the
+    stream of the next song is dropped before the song ends, so it is resolved
+    while the listeners wait.
+    """
+    backend = FakeMediaBackend(latency)
+    with backend.installed():
+        gateway = SimulatedGateway()
+        guild = Guild(1)
+        voice_client = TimedVoiceClient()
+        gateway.author(guild, lambda: voice_client)
+        for index in range(n_songs + 1):
+            await gateway.deliver([gateway.message(guild, f"-play song {index}")])
+        music_bot = gateway.dispatcher.get_music_bot(guild)
+        await asyncio.sleep(0.1)
+
+        samples = []
+        for _ in range(n_songs):
+            if not prefetched:
+                music_bot.prefetcher.invalidate()
+                music_bot.stream_cache.invalidate(music_bot.media_deque[0].videoid)
+            voice_client.started.clear()
+            start = time.perf_counter()
+            voice_client.finish_audio_source()
+            await voice_client.started.wait()
+            samples.append(voice_client.start_time - start)
+            # Give the prefetcher time to prepare the next song
+            await asyncio.sleep(latency * 2 + 0.01)
+        await gateway.close()
+    return {"songs": n_songs, "prefetched": prefetched, **percentiles(samples)}
+
+
+async def memory_per_guild(n_guilds, queue_length):
+    """
+    Bytes held per guild by a MusicBot which handled a command and has
+    `queue_length` songs in its queue
+    """
+    backend = FakeMediaBackend(0)
+    with backend.installed():
+        gateway = SimulatedGateway()
+        guilds = [Guild(guild_id) for guild_id in range(n_guilds)]
+        messages = [gateway.message(guild, "-hello") for guild in guilds]
+        gc.collect()
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        await gateway.deliver(messages)
+        for guild in guilds:
+            music_bot = gateway.dispatcher.get_music_bot(guild)
+            for index in range(queue_length):
+                music_bot.media_deque.append(
+                    QueueEntry(f"{index:011d}", f"Song {index}", 200, 1, 2)
+                )
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        await gateway.close()
+    return {
+        "guilds": n_guilds,
+        "queue_length": queue_length,
+        "bytes_per_guild": (after - before) / n_guilds,
+    }
+
+
+async def run(options):
+    """Run every benchmark and return the results"""
+    results = {
+        "command_throughput": [
+            await command_throughput(
+                n_guilds, options.commands_per_guild, options.latency
+            )
+            for n_guilds in options.guilds
+        ],
+        "playlist_ingestion": [
+            await playlist_ingestion(kind, options.playlist_size, options.latency)
+            for kind in ("youtube", "spotify")
+        ],
+        "song_transition": [
+            await song_transition(options.transitions, options.latency, prefetched)
+            for prefetched in (True, False)
+        ],
+        "memory_per_guild": [await memory_per_guild(max(options.guilds), 10)],
+    }
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.time(),
+        "options": vars(options),
+        "results": results,
+    }
+
+
+def parse():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--output", help="File to write the results to, or stdout")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.005,
+        help="Seconds each lookup of the fake media backend takes (default: 0.005)",
+    )
+    parser.add_argument(
+        "--guilds",
+        type=lambda value: [int(count) for count in value.split(",")],
+        default=[1, 100, 1000],
+        help="Comma separated guild counts for command_throughput "
+        "(default: 1,100,1000)",
+    )
+    parser.add_argument("--commands-per-guild", type=int, default=8)
+    parser.add_argument("--playlist-size", type=int, default=300)
+    parser.add_argument("--transitions", type=int, default=20)
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="Smaller workloads, for checking that the benchmarks still run",
+    )
+    options = parser.parse_args()
+    if options.quick:
+        options.guilds = [1, 10]
+        options.commands_per_guild = 4
+        options.playlist_size = 30
+        options.transitions = 3
+    return options
+
+
+def write_report(report, path):
+    """Write the results as JSON to the file `path`, or stdout if it is None"""
+    text = json.dumps(report, indent=2)
+    if path:
+        with open(path, "w", encoding="utf-8") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+
+
+def main():
+    """Run the benchmarks and write the results"""
+    options = parse()
+    logging.basicConfig(level=logging.ERROR)
+    write_report(asyncio.run(run(options)), options.output)
+
+
+if __name__ == "__main__":
+    main()
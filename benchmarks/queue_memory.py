@@ -0,0 +1,117 @@
+"""
+Compares the memory used by a queue of pafy objects with a queue of QueueEntry objects.
+
+The pafy objects are stand-ins carrying an info dictionary shaped like the one
+youtube-dl returns for a typical music video.
+
+Usage: python benchmarks/queue_memory.py [number of songs]
+"""
+
+import collections
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from media_queue import QueueEntry  # pylint: disable=import-error,wrong-import-position
+
+N_FORMATS = 24
+N_THUMBNAILS = 8
+
+
+class FakePafy:
+    """Holds the same kind of data as a pafy object fetched with youtube-dl"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, index):
+        self.videoid = f"{index:011d}"
+        self.title = f"Artist {index} - Song {index} (Official Video)"
+        self.length = 200 + index % 100
+        self.duration = "00:03:20"
+        self._ydl_info = {
+            "id": self.videoid,
+            "title": self.title,
+            "description": f"Official video for song {index}. " * 60,
+            "tags": [f"tag {tag} {index}" for tag in range(20)],
+            "thumbnails": [
+                {
+                    "url": f"https://i.ytimg.com/vi/{self.videoid}/{size}.jpg?sqp=-"
+                    + "x" * 80,
+                    "width": size,
+                    "height": size,
+                }
+                for size in range(N_THUMBNAILS)
+            ],
+            "formats": [
+                {
+                    "format_id": str(format_id),
+                    "url": f"https://rr{format_id}.googlevideo.com/videoplayback?"
+                    + "expire=1&ei=x&ip=y&id="
+                    + self.videoid
+                    + "&"
+                    + "z" * 900,
+                    "ext": "webm",
+                    "acodec": "opus",
+                    "vcodec": "none",
+                    "abr": 160,
+                    "filesize": 3_000_000 + format_id,
+                    "http_headers": {
+                        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64)",
+                        "Accept": "text/html,application/xhtml+xml",
+                        "Accept-Language": "en-us,en;q=0.5",
+                    },
+                }
+                for format_id in range(N_FORMATS)
+            ],
+        }
+
+
+class FakeMessage:
+    """Minimal Discord message, with the ids QueueEntry needs"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self):
+        self.author = collections.namedtuple("Author", "id")(1234)
+        self.channel = collections.namedtuple("Channel", "id")(5678)
+
+
+def measure(build, n_songs):
+    """Returns the number of bytes allocated by build(n_songs) that stay alive"""
+    tracemalloc.start()
+    queue = build(n_songs)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(queue) == n_songs
+    return size
+
+
+def build_pafy_queue(n_songs):
+    """The queue as it used to be, pafy objects and the requesting messages"""
+    message = FakeMessage()
+    return collections.deque((FakePafy(index), message) for index in range(n_songs))
+
+
+def build_entry_queue(n_songs):
+    """The queue of entries, the pafy objects are dropped once the entry is made"""
+    message = FakeMessage()
+    return collections.deque(
+        QueueEntry.from_media(FakePafy(index), message) for index in range(n_songs)
+    )
+
+
+def main():
+    """Run the benchmark and print the results"""
+    n_songs = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    pafy_size = measure(build_pafy_queue, n_songs)
+    entry_size = measure(build_entry_queue, n_songs)
+    print(f"Queue of {n_songs} songs")
+    print(f"  pafy objects:  {pafy_size / 2**20:8.2f} MiB")
+    print(f"  queue entries: {entry_size / 2**20:8.2f} MiB")
+    print(f"  reduction:     {pafy_size / entry_size:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
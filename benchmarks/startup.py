@@ -0,0 +1,135 @@
+"""
+Measures how long the bot takes to start.
+
+Every run is a fresh interpreter, which reports:
+  import_seconds: Time to import bot.
+  ready_seconds: Time from before the import until the dispatcher has been
+    created, has run on_ready and has answered its first command, delivered by
+    the simulated gateway of bot_benchmarks.py. Importing the simulation itself
+    isn't counted.
+  modules: The integrations which are loaded at that point. They should only be
+    loaded once they are used.
+
+The time to import each integration on its own is measured as well, as that is
+the cost which is paid on first use instead. The results are written as JSON.
+
+Usage: python benchmarks/startup.py [--runs N] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+INTEGRATIONS = [
+    "jokeapi",
+    "youtubesearchpython",
+    "pytube",
+    "requests",
+    "spotipy",
+    "pafy_fixed.pafy_fixed",
+]
+
+# Runs in the child interpreter, prints its measurements as JSON
+CHILD = """
+import time
+start = time.perf_counter()
+import bot
+imported = time.perf_counter()
+
+import asyncio, json, sys
+sys.path.insert(0, "benchmarks")
+from bot_benchmarks import Guild, SimulatedGateway
+harness = time.perf_counter()
+
+async def first_command():
+    gateway = SimulatedGateway()
+    await gateway.dispatcher.on_ready()
+    await gateway.deliver([gateway.message(Guild(1), "-hello")])
+    ready = time.perf_counter()
+    await gateway.close()
+    return ready
+
+ready = asyncio.run(first_command())
+print(json.dumps({
+    "import_seconds": imported - start,
+    "ready_seconds": (imported - start) + (ready - harness),
+    "modules": [name for name in INTEGRATIONS if name in sys.modules],
+}))
+"""
+
+IMPORT_CHILD = """
+import time
+start = time.perf_counter()
+import {}
+print(time.perf_counter() - start)
+"""
+
+
+def run_child(code):
+    """Run code in a fresh interpreter and return what it printed"""
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+
+
+def summary(samples):
+    """Median and spread of a list of durations in seconds"""
+    return {
+        "median_seconds": statistics.median(samples),
+        "min_seconds": min(samples),
+        "max_seconds": max(samples),
+    }
+
+
+def measure(runs):
+    """Start the bot `runs` times and return the results"""
+    child = f"INTEGRATIONS = {INTEGRATIONS!r}\n" + CHILD
+    reports = [json.loads(run_child(child)) for _ in range(runs)]
+    first_use = {
+        name: summary(
+            [float(run_child(IMPORT_CHILD.format(name))) for _ in range(runs)]
+        )
+        for name in INTEGRATIONS
+    }
+    return {
+        "import": summary([report["import_seconds"] for report in reports]),
+        "first_ready": summary([report["ready_seconds"] for report in reports]),
+        "modules_loaded_at_ready": reports[-1]["modules"],
+        "first_use_import": first_use,
+    }
+
+
+def main():
+    """Run the benchmark and write the results"""
+    parser = argparse.ArgumentParser(description="Measure the startup of the bot")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="File to write the results to, or stdout")
+    options = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.time(),
+        "options": vars(options),
+        "results": measure(options.runs),
+    }
+    # Imported here, as it imports the bot
+    # pylint: disable=import-outside-toplevel,import-error
+    from bot_benchmarks import write_report
+
+    write_report(report, options.output)
+
+
+if __name__ == "__main__":
+    main()
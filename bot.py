@@ -19,14 +19,33 @@ import traceback
 import time
 import argparse
 import abc
+import itertools
+import threading
+import functools
+import weakref
 
 import discord
-import jokeapi
-import youtubesearchpython
-import pytube
-import spotipy
 
-import pafy_fixed.pafy_fixed as pafy
+from lazy import LazyModule
+from resolver import MediaResolver
+from audio_cache import AudioFileCache
+from media_cache import CachedMedia, MetadataCache, StreamUrlCache
+from media_queue import MediaQueue, QueueEntry, format_duration
+from queue_store import QueueStore
+from prefetch import Prefetcher
+from shards import ShardSupervisor
+from scheduler import IdleScheduler
+from spotify_ingest import SpotifyIngest
+from youtube_ingest import YouTubeIngest
+import metrics
+
+# Integrations which are slow to import are loaded on first use. pafy_fixed alone
+# pulls in youtube-dl with every one of its extractors.
+jokeapi = LazyModule("jokeapi")
+youtubesearchpython = LazyModule("youtubesearchpython")
+requests = LazyModule("requests")
+spotipy = LazyModule("spotipy")
+pafy = LazyModule("pafy_fixed.pafy_fixed")
 
 LOG_FMT = (
     "%(asctime)s - "
@@ -36,6 +55,38 @@ LOG_FMT = (
     "%(message)s"
 )
 
+COMMAND_SECONDS = metrics.REGISTRY.histogram(
+    "bot_command_seconds", "Time spent handling a command", labelnames=("handler",)
+)
+COMMAND_LOCK_WAIT_SECONDS = metrics.REGISTRY.histogram(
+    "bot_command_lock_wait_seconds", "Time guarded commands wait for the command lock"
+)
+GET_MEDIA_SECONDS = metrics.REGISTRY.histogram(
+    "bot_get_media_seconds", "Time spent looking up the media of a song"
+)
+PAFY_SEARCH_SECONDS = metrics.REGISTRY.histogram(
+    "bot_pafy_search_seconds", "Time spent fetching video metadata with pafy"
+)
+YOUTUBE_SEARCH_SECONDS = metrics.REGISTRY.histogram(
+    "bot_youtube_search_seconds", "Time spent searching YouTube"
+)
+NEXT_IN_QUEUE_SECONDS = metrics.REGISTRY.histogram(
+    "bot_next_in_queue_seconds", "Time spent switching to the next song"
+)
+PLAYBACK_GAP_SECONDS = metrics.REGISTRY.histogram(
+    "bot_playback_gap_seconds",
+    "Time between a song ending and the next one starting to play",
+)
+PLAYLIST_SECONDS = metrics.REGISTRY.histogram(
+    "bot_playlist_seconds", "Time until the play command for a playlist returns"
+)
+PLAYLIST_TRACKS = metrics.REGISTRY.counter(
+    "bot_playlist_tracks_total", "Playlist tracks looked up", labelnames=("result",)
+)
+ATTEMPT_DISCONNECT_SECONDS = metrics.REGISTRY.histogram(
+    "bot_attempt_disconnect_seconds", "Time spent in idle disconnect attempts"
+)
+
 
 class SongList:
     """
@@ -43,12 +94,26 @@ class SongList:
     having length
     """
 
-    def __init__(self, tracks, get_media):
+    # Whether fetch() looks the track up, so it has to run on the resolver
+    needs_lookup = True
+
+    def __init__(self, tracks, get_media, total=None, pages=None):
+        """
+        Arguments:
+          tracks: The tracks known so far.
+          get_media: Function looking up the media of a track.
+          total: Total number of tracks, if more are still to come.
+          pages: Async iterable of lists of the tracks which are still to come.
+        """
         self.tracks = tracks
         self.get_media = get_media
+        self.total = total
+        self.pages = pages
         self.index = 0
 
     def __len__(self):
+        if self.total is not None:
+            return self.total
         return len(self.tracks)
 
     def __iter__(self):
@@ -60,11 +125,24 @@ class SongList:
         raise NotImplementedError
 
     def __getitem__(self, index):
-        logging.info(
-            "Fetching DIRECTLY item at index %d/%d", self.index, len(self.tracks)
-        )
+        logging.info("Fetching DIRECTLY item at index %d/%d", index, len(self.tracks))
         return self.fetch(self.tracks[index])
 
+    async def indices(self):
+        """
+        Async generator yielding the index of every track, waiting for the pages
+        which are still being fetched
+        """
+        for index in range(len(self.tracks)):
+            yield index
+        if self.pages is None:
+            return
+        async for page in self.pages:
+            start = len(self.tracks)
+            self.tracks.extend(page)
+            for index in range(start, len(self.tracks)):
+                yield index
+
     def __next__(self):
         logging.info("Fetching NEXT item at index %d/%d", self.index, len(self.tracks))
         if self.index >= len(self.tracks):
@@ -110,28 +188,261 @@ class YouTubeList(SongList):
         return youtube_track
 
 
+class YouTubePlaylist(SongList):
+    """
+    Implementation of SongList for YouTube playlists listed by YouTubeIngest. The
+    media is made from the listing, so nothing is looked up.
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    needs_lookup = False
+
+    def fetch(self, track):
+        return self.get_media(track)
+
+
 class BotDispatcher(discord.Client):
     """
     Dispatcher for client instances
     """
 
-    def __init__(self, *args, **kwargs):
+    SHARD_METRICS_INTERVAL_SECONDS = 15
+    DEFAULT_IDLE_EVICTION_SECONDS = 60 * 60
+    # Queue changes are written to the queue database in batches this far apart
+    QUEUE_SAVE_INTERVAL_SECONDS = 2
+
+    def __init__(
+        self,
+        *args,
+        resolver_workers=None,
+        resolve_timeout=None,
+        playlist_concurrency=None,
+        guild_lookup_limit=None,
+        cache_db=None,
+        prefetch_depth=Prefetcher.DEFAULT_DEPTH,
+        prefetch_warm=False,
+        metrics_queue=None,
+        idle_eviction_seconds=DEFAULT_IDLE_EVICTION_SECONDS,
+        queue_db=None,
+        metrics_port=None,
+        audio_cache_dir=None,
+        audio_cache_bytes=AudioFileCache.DEFAULT_MAX_BYTES,
+        audio_cache_min_plays=AudioFileCache.DEFAULT_MIN_PLAYS,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
         self.clients = {}  # guild -> discord.Client instance
+        # Queue to report metrics on when running as a shard of a ShardSupervisor
+        self.metrics_queue = metrics_queue
+        self.metrics_task = None
+        # MusicBots without a voice connection are dropped after being idle for
+        # this long, and rebuilt when their guild sends the next message
+        self.idle_eviction_seconds = idle_eviction_seconds
+        self.eviction_task = None
+        self.metadata_cache = MetadataCache(path=cache_db)
+        self.stream_cache = StreamUrlCache()
+        # Audio of frequently played songs, kept on disk. Every shard has its own
+        # directory, as the size budget is per process.
+        self.audio_cache = None
+        if audio_cache_dir:
+            self.audio_cache = AudioFileCache(
+                os.path.join(audio_cache_dir, f"shard{self.shard_id or 0}"),
+                max_bytes=audio_cache_bytes,
+                min_plays=audio_cache_min_plays,
+            )
+        # Queues are saved here so that they survive restarts
+        self.queue_store = QueueStore(queue_db) if queue_db else None
+        self.saved_queue_states = {}  # guild id -> queue state when last saved
+        self.queue_save_task = None
+        # Port to serve metrics on, offset by the shard id
+        self.metrics_port = metrics_port
+        self.metrics_runner = None
+        metrics.REGISTRY.gauge(
+            "bot_music_bots", "Guilds with a MusicBot", lambda: len(self.clients)
+        )
+        metrics.REGISTRY.gauge(
+            "bot_voice_clients",
+            "Voice channels the bot is connected to",
+            lambda: len(self.voice_clients),
+        )
+        # One timer for the idle disconnects of all guilds
+        self.idle_scheduler = IdleScheduler(self.loop)
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_warm = prefetch_warm
+        # Shared by all guilds so that the number of concurrent lookups is bounded
+        # for the whole process.
+        self.resolver = MediaResolver(
+            self.loop,
+            max_workers=resolver_workers,
+            timeout=resolve_timeout,
+            concurrency=playlist_concurrency,
+            guild_limit=guild_lookup_limit,
+        )
 
     async def on_ready(self):
         """
         Login and loading handling
         """
         logging.info("we have logged in as %s", self.user)
+        if self.metrics_queue is not None and self.metrics_task is None:
+            self.metrics_task = self.loop.create_task(self.report_shard_metrics())
+        if self.idle_eviction_seconds and self.eviction_task is None:
+            self.eviction_task = self.loop.create_task(self.evict_idle_clients_loop())
+        if self.metrics_port and self.metrics_runner is None:
+            self.metrics_runner = await metrics.REGISTRY.start_server(
+                self.metrics_port + (self.shard_id or 0)
+            )
+        if self.queue_store is not None and self.queue_save_task is None:
+            self.queue_save_task = self.loop.create_task(self.save_queues_loop())
+            await self.restore_queues()
+
+    def evict_idle_clients(self):
+        """
+        Drop the MusicBots which have been idle for longer than
+        idle_eviction_seconds. Returns the number of evicted MusicBots.
+        """
+        now = time.time()
+        idle_guilds = [
+            guild
+            for guild, client in self.clients.items()
+            if client.is_idle(now, self.idle_eviction_seconds)
+        ]
+        for guild in idle_guilds:
+            self.clients.pop(guild).close()
+        if idle_guilds:
+            logging.info(
+                "Evicted %d idle guilds, %d remaining",
+                len(idle_guilds),
+                len(self.clients),
+            )
+        return len(idle_guilds)
+
+    async def evict_idle_clients_loop(self):
+        """
+        Periodically evict idle MusicBots
+        """
+        interval = min(self.idle_eviction_seconds, 60)
+        while not self.is_closed():
+            await asyncio.sleep(interval)
+            self.evict_idle_clients()
+
+    def shard_metrics(self):
+        """
+        Returns a dictionary of metrics describing the load of this shard
+        """
+        return {
+            "shard_id": self.shard_id or 0,
+            "pid": os.getpid(),
+            "guilds": len(self.guilds),
+            "music_bots": len(self.clients),
+            "voice_clients": len(self.voice_clients),
+            "latency": self.latency,
+        }
+
+    async def report_shard_metrics(self):
+        """
+        Periodically report the shard's metrics to the supervisor
+        """
+        while not self.is_closed():
+            self.metrics_queue.put(self.shard_metrics())
+            await asyncio.sleep(self.SHARD_METRICS_INTERVAL_SECONDS)
+
+    def snapshot_queues(self):
+        """
+        Returns snapshots of the queues which changed since they were last saved, in
+        the format QueueStore.save() takes, and the states of those queues. Guilds
+        which have been evicted since are included with a snapshot of None, and
+        without a state.
+        """
+        snapshots = {}
+        states = {}
+        for guild, client in self.clients.items():
+            state = client.queue_state()
+            if self.saved_queue_states.get(guild.id) != state:
+                states[guild.id] = state
+                snapshots[guild.id] = client.queue_snapshot()
+        guild_ids = {guild.id for guild in self.clients}
+        for guild_id in self.saved_queue_states:
+            if guild_id not in guild_ids:
+                snapshots[guild_id] = None
+        return snapshots, states
+
+    async def save_queues(self):
+        """
+        Save the queues which have changed. They are only marked as saved once the
+        write has succeeded, so a failed save is retried the next time.
+        """
+        snapshots, states = self.snapshot_queues()
+        if not snapshots:
+            return
+        await self.resolver.run(self.queue_store.save, snapshots)
+        for guild_id in snapshots:
+            if guild_id in states:
+                self.saved_queue_states[guild_id] = states[guild_id]
+            else:
+                self.saved_queue_states.pop(guild_id, None)
+
+    async def save_queues_loop(self):
+        """
+        Periodically save the queues which have changed
+        """
+        while not self.is_closed():
+            await asyncio.sleep(self.QUEUE_SAVE_INTERVAL_SECONDS)
+            try:
+                await self.save_queues()
+            except Exception as err:  # pylint: disable=broad-except
+                # E.g. the database is locked by another shard, retried next time
+                logging.error("Unable to save queues: %s", err)
+
+    async def restore_queues(self):
+        """
+        Restore the queues saved before the last restart, and resume playing in
+        the voice channels the bot was in
+        """
+        saved = await self.resolver.run(self.queue_store.load)
+        for guild_id, (voice_channel_id, entries) in saved.items():
+            guild = self.get_guild(guild_id)
+            if guild is None:
+                # Served by another shard
+                continue
+            client = self.get_music_bot(guild)
+            # Make sure the queue is saved again, or removed if it is gone
+            self.saved_queue_states[guild_id] = None
+            voice_channel = None
+            if voice_channel_id is not None:
+                voice_channel = guild.get_channel(voice_channel_id)
+            logging.info("Restoring %d songs in guild %s", len(entries), guild_id)
+            try:
+                await client.restore_queue(entries, voice_channel)
+            except Exception as err:  # pylint: disable=broad-except
+                # Restoring one guild shouldn't keep the others from being restored
+                logging.error("Unable to resume playing in %s: %s", guild_id, err)
+
+    def get_music_bot(self, guild):
+        """
+        Returns the MusicBot of a guild, creating it if there isn't one
+        """
+        if guild not in self.clients:
+            self.clients[guild] = MusicBot(
+                guild,
+                self.loop,
+                self.user,
+                resolver=self.resolver,
+                metadata_cache=self.metadata_cache,
+                stream_cache=self.stream_cache,
+                audio_cache=self.audio_cache,
+                prefetch_depth=self.prefetch_depth,
+                prefetch_warm=self.prefetch_warm,
+                idle_scheduler=self.idle_scheduler,
+            )
+        return self.clients[guild]
 
     async def on_message(self, message):
         """
         Login and loading handling
         """
-        if message.guild not in self.clients:
-            self.clients[message.guild] = MusicBot(message.guild, self.loop, self.user)
-        await self.clients[message.guild].handle_message(message)
+        await self.get_music_bot(message.guild).handle_message(message)
 
     async def on_error(
         self, event_name, *args, **kwargs
@@ -147,6 +458,25 @@ class BotDispatcher(discord.Client):
             print(traceback.format_exc())
             await message.channel.send(":robot: Something came up!")
 
+    async def close(self):
+        """
+        Shut down the resolver workers along with the client
+        """
+        self.resolver.shutdown()
+        self.metadata_cache.close()
+        if self.audio_cache is not None:
+            self.audio_cache.shutdown()
+        if self.queue_store is not None:
+            try:
+                self.queue_store.save(self.snapshot_queues()[0])
+            except Exception as err:  # pylint: disable=broad-except
+                # The rest still has to be shut down, the last changes are lost
+                logging.error("Unable to save queues on close: %s", err)
+            self.queue_store.close()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        await super().close()
+
 
 class AfterInterrupt:
     """
@@ -170,6 +500,70 @@ class AfterInterrupt:
             self.voice_client.play(self.source, after=after)
 
 
+class ProgressReporter:
+    """
+    Class for showing progress in a status message without spamming edits
+
+    The message is edited at most once every `min_interval` seconds, and only when
+    the progress has moved by at least `min_step`. Edits run in the background, so
+    the caller is never slowed down by Discord's rate limits, and progress made
+    while an edit is in flight is only shown by the next edit.
+    """
+
+    MIN_INTERVAL_SECONDS = 2
+    MIN_STEP = 0.05
+
+    def __init__(
+        self,
+        loop,
+        message,
+        status_fmt,
+        min_interval=MIN_INTERVAL_SECONDS,
+        min_step=MIN_STEP,
+    ):
+        self.loop = loop
+        self.message = message
+        self.status_fmt = status_fmt
+        self.min_interval = min_interval
+        self.min_step = min_step
+        self.last_edit_time = 0
+        self.last_fraction = 0
+        self.edit_task = None
+
+    def update(self, done, total):
+        """Report that `done` out of `total` items are done"""
+        # The total is only an estimate for playlists fetched page by page
+        fraction = min(done / total, 1) if total else 1
+        if self.edit_task is not None and not self.edit_task.done():
+            return
+        if time.time() - self.last_edit_time < self.min_interval:
+            return
+        if fraction - self.last_fraction < self.min_step:
+            return
+        self.last_edit_time = time.time()
+        self.last_fraction = fraction
+        self.edit_task = self.loop.create_task(
+            self.message.edit(content=self.status_fmt.format(f"{fraction:.0%}"))
+        )
+
+    async def finish(self, content):
+        """
+        Replace the status with `content` once the pending edit is done. If the
+        status message can't be edited, e.g. because it was deleted, `content` is
+        sent as a new message instead.
+        """
+        if self.edit_task is not None:
+            try:
+                await self.edit_task
+            except discord.DiscordException as err:
+                logging.warning("Unable to show progress: %s", err)
+        try:
+            await self.message.edit(content=content)
+        except discord.DiscordException as err:
+            logging.warning("Unable to edit status message: %s", err)
+            await self.message.channel.send(content)
+
+
 class MusicBot:
     """
     The main bot functionality
@@ -182,37 +576,78 @@ class MusicBot:
     TEXTWIDTH = 60
     SYNTAX_LANGUAGE = "arm"
     N_PLAYLIST_SHOW = 10
+    QUEUE_PAGE_SIZE = 15
 
     END_OF_QUEUE_MSG = ":sparkles: End of queue"
 
-    def __init__(self, guild, loop, dispatcher_user):
+    url_regex = re.compile(
+        r"http[s]?://"
+        r"(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*(),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+"
+    )
+    playlist_regex = re.compile(r"\b(?:play)?list(/|\=(\w+))")
+    youtube_playlist_regex = re.compile(
+        r"^https://(www\.)?youtu(be\.com|.be)/(playlist|watch\?v\=\w+&list\=)"
+    )
+    spotify_regex = re.compile(r"^https?://(\w+\.)*spotify.com")
+    spotify_playlist_regex = re.compile(r"^https?://(\w+\.)*spotify.com/playlist")
+    spotify_album_regex = re.compile(r"^https?://(\w+\.)*spotify.com/album")
+    spotify_track_regex = re.compile(r"^https?://(\w+\.)*spotify.com/track")
+
+    # Filled in by register_commands(). command name -> (method name, guarded)
+    commands = {}
+    help_messages = {}
+
+    _shared_spotify = None
+    _shared_spotify_created = False
+    _shared_spotify_lock = threading.Lock()
+    # Audio sources created by all guilds, to count the FFmpeg processes
+    audio_sources = weakref.WeakSet()
+
+    def __init__(
+        self,
+        guild,
+        loop,
+        dispatcher_user,
+        resolver=None,
+        metadata_cache=None,
+        stream_cache=None,
+        audio_cache=None,
+        prefetch_depth=Prefetcher.DEFAULT_DEPTH,
+        prefetch_warm=False,
+        idle_scheduler=None,
+    ):
         self.guild = guild
         self.loop = loop
         self.dispatcher_user = dispatcher_user
+        self.resolver = resolver or MediaResolver(loop)
+        self.metadata_cache = metadata_cache
+        self.stream_cache = stream_cache or StreamUrlCache()
+        self.audio_cache = audio_cache
+        self.idle_scheduler = idle_scheduler or IdleScheduler(loop)
+        # Prepares the next songs in the queue so that they start without a gap
+        self.prefetcher = Prefetcher(
+            loop,
+            self.resolve_audio_stream,
+            create_source=self.create_stream_audio_source if prefetch_warm else None,
+            depth=prefetch_depth,
+        )
+        # Keeps one guild's playlists from taking over every resolver worker
+        self.playlist_limiter = self.resolver.guild_limiter()
 
-        self.handlers = {}
-        self.help_messages = {}
-        self.media_deque = collections.deque()
+        self.media_deque = MediaQueue()
+        # Text channels songs were queued from, so entries only need their id
+        self.text_channels = {}
         self.voice_client = None
         self.current_media = None
+        self.current_media_started = None
+        # When the last song ended on its own, to measure the gap until the next
+        self.song_finished_time = None
         self.last_text_channel = None
         self.last_played_time = None
-        self.continue_adding_to_playlist = None
-
-        self.url_regex = re.compile(
-            r"http[s]?://"
-            r"(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*(),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+"
-        )
-        self.playlist_regex = re.compile(r"\b(?:play)?list(/|\=(\w+))")
-        self.youtube_playlist_regex = re.compile(
-            r"^https://(www\.)?youtu(be\.com|.be)/(playlist|watch\?v\=\w+&list\=)"
-        )
-        self.spotify_regex = re.compile(r"^https?://(\w+\.)*spotify.com")
-        self.spotify_playlist_regex = re.compile(
-            r"^https?://(\w+\.)*spotify.com/playlist"
-        )
-        self.spotify_album_regex = re.compile(r"^https?://(\w+\.)*spotify.com/album")
-        self.spotify_track_regex = re.compile(r"^https?://(\w+\.)*spotify.com/track")
+        self.last_command_time = time.time()
+        # Background tasks adding playlists to the queue, oldest first, mapped to
+        # the number of their tracks which are yet to be added
+        self.playlist_tasks = {}
 
         # Boolean to control whether the after callback is called
         self.after_callback_blocked = False
@@ -222,127 +657,158 @@ class MusicBot:
         self.command_lock = asyncio.Lock()
         self.interrupt_play_stack = collections.deque()
 
-        self.spotify = self.get_spotify_client()
-        self.register_command(
+        # The Spotify client is shared by all guilds, see get_spotify_client
+        self._spotify = None
+
+    @classmethod
+    def register_commands(cls):
+        """
+        Register all commands. The command table is shared by every MusicBot, so
+        this is done once when the module is loaded.
+        """
+        cls.register_command(
             "play",
             help_message="Play audio from URL",
-            handler=self.play,
-            # guarded_by=self.command_lock,
+            handler=cls.play,
+            # guarded=True,
             argument_name="term/url",
         )
-        self.register_command(
+        cls.register_command(
             "cancel",
             help_message="Stop a playlist from fetching more songs",
-            handler=self.cancel,
-            # guarded_by=self.command_lock,
+            handler=cls.cancel,
+            # guarded=True,
             argument_name="term/url",
         )
-        self.register_command(
+        cls.register_command(
             "playnext",
             help_message="Put a song at the front of the queue",
-            handler=self.play_next,
-            # guarded_by=self.command_lock,
+            handler=cls.play_next,
+            # guarded=True,
             argument_name="term/url",
         )
-        self.register_command(
+        cls.register_command(
             "stop",
             help_message="Stop and remove current song from queue",
-            handler=self.stop,
-            guarded_by=self.command_lock,
+            handler=cls.stop,
+            guarded=True,
         )
-        self.register_command(
+        cls.register_command(
             "pause",
             help_message="Pause current song",
-            handler=self.pause,
-            guarded_by=self.command_lock,
+            handler=cls.pause,
+            guarded=True,
         )
-        self.register_command(
+        cls.register_command(
             "resume",
             help_message="Resume current song",
-            handler=self.resume,
-            guarded_by=self.command_lock,
+            handler=cls.resume,
+            guarded=True,
         )
-        self.register_command(
+        cls.register_command(
             "skip",
             help_message="Skip to next song",
-            handler=self.skip,
-            guarded_by=self.command_lock,
+            handler=cls.skip,
+            guarded=True,
         )
-        self.register_command(
+        cls.register_command(
             "next",
             help_message="Skip to next song",
-            handler=self.skip,
-            guarded_by=self.command_lock,
+            handler=cls.skip,
+            guarded=True,
         )
-        self.register_command(
+        cls.register_command(
             "disconnect",
             help_message="Disconnect from the current voice client",
-            handler=self.disconnect,
-            guarded_by=self.command_lock,
+            handler=cls.disconnect,
+            guarded=True,
         )
-        self.register_command(
+        cls.register_command(
             "clear",
             help_message="Clear the current queue",
-            handler=self.clear_queue,
-            guarded_by=self.command_lock,
+            handler=cls.clear_queue,
+            guarded=True,
         )
-        self.register_command(
+        cls.register_command(
             "queue",
-            help_message="Show the current queue",
-            handler=self.show_queue,
-            guarded_by=self.command_lock,
+            help_message="Show a page of the current queue",
+            handler=cls.show_queue,
+            guarded=True,
+            argument_name="page",
         )
-        self.register_command(
+        cls.register_command(
             "nowplaying",
             help_message="Show the currently playing song",
-            handler=self.show_current,
+            handler=cls.show_current,
         )
-        self.register_command(
+        cls.register_command(
             "source",
             help_message="Show the link to the currently playing song",
-            handler=self.show_source,
+            handler=cls.show_source,
         )
-        self.register_command(
+        cls.register_command(
             "help",
             help_message="Show this help message or help for given command",
-            handler=self.show_help,
+            handler=cls.show_help,
             argument_name="command",
         )
-        self.register_command(
+        cls.register_command(
             "move",
-            help_message="Move the bot to your voice channel",
-            handler=self.move,
-            guarded_by=self.command_lock,
+            help_message="Move the bot to your voice channel, or a song in the queue",
+            handler=cls.move,
+            guarded=True,
+            argument_name="from to",
+        )
+        cls.register_command(
+            "remove",
+            help_message="Remove a song from the queue",
+            handler=cls.remove,
+            guarded=True,
+            argument_name="n",
+        )
+        cls.register_command(
+            "skipto",
+            help_message="Skip to a song in the queue",
+            handler=cls.skip_to,
+            guarded=True,
+            argument_name="n",
+        )
+        cls.register_command(
+            "shuffle",
+            help_message="Shuffle the queue",
+            handler=cls.shuffle,
+            guarded=True,
         )
 
-        self.register_command(
+        cls.register_command(
             "hello",
             help_message="Say hello",
-            handler=self.hello,
+            handler=cls.hello,
         )
-        self.register_command(
+        cls.register_command(
             "countdown",
             help_message="Count down from 10 and explode",
-            handler=self.countdown,
+            handler=cls.countdown,
         )
-        self.register_command(
+        cls.register_command(
             "dinkster",
             help_message="Ring the dinkster in your voice channel",
-            handler=self.dinkster,
-            guarded_by=self.command_lock,
+            handler=cls.dinkster,
+            guarded=True,
         )
-        self.register_command(
+        cls.register_command(
             "joke",
             help_message="Tell a joke",
-            handler=self.joke,
+            handler=cls.joke,
         )
 
+    @classmethod
     def register_command(
-        self,
+        cls,
         command_name,
         help_message: str,
         handler=None,
-        guarded_by: asyncio.Lock = None,
+        guarded: bool = False,
         argument_name: str = "",
     ):
         """
@@ -351,38 +817,42 @@ class MusicBot:
         Arguments:
           command_name: String. The name of the command to register. This is
             what users should use to run the command.
-          handler: A function. This function should accept two arguments:
+          handler: A MusicBot method. This method should accept two arguments:
             discord.Message and a string. The messageris the message being
             processed by the handler and command_content is the string
-            contents of the command passed by the user.
-          guarded_by: A lock which will be acquired before each call to the
-            handler passed.
+            contents of the command passed by the user. It is looked up by name
+            on the MusicBot handling the command.
+          guarded: If True, the bot's command_lock will be acquired before each
+            call to the handler.
           help_message: A string describing how to use the given handler.
             Maximum 100 characters.
           argument_name: Name of argument used in help message.
              Requires length command_name+argument_name+3 < 20
         """
         assert handler
-        assert command_name not in self.handlers
+        assert command_name not in cls.commands
         assert len(help_message) < 100
         assert len(command_name) + len(argument_name) + 3 < 20
 
         if len(argument_name) > 0:
             argument_name = f"<{argument_name}>"
-        help_prefix = f"{self.COMMAND_PREFIX}{command_name} {argument_name}"
+        help_prefix = f"{cls.COMMAND_PREFIX}{command_name} {argument_name}"
         help_prefix = f"{help_prefix:<20}"
 
-        self.help_messages[command_name] = f"{help_prefix}{help_message}"
+        cls.help_messages[command_name] = f"{help_prefix}{help_message}"
+        cls.commands[command_name] = (handler.__name__, guarded)
 
-        if guarded_by:
+    def _guarded(self, handler):
+        """Wrap handler so that it is called with command_lock acquired"""
 
-            async def guarded_handler(*args):
-                async with guarded_by:
-                    return await handler(*args)
+        @functools.wraps(handler)
+        async def guarded_handler(*args):
+            start = time.perf_counter()
+            async with self.command_lock:
+                COMMAND_LOCK_WAIT_SECONDS.observe(time.perf_counter() - start)
+                return await handler(*args)
 
-            self.handlers[command_name] = guarded_handler
-        else:
-            self.handlers[command_name] = handler
+        return guarded_handler
 
     def get_command_handler(self, message_content):
         """
@@ -420,10 +890,14 @@ class MusicBot:
         if len(content_split) == 2:
             command_content = content_split[1]
 
-        if command_name not in self.handlers:
+        if command_name not in self.commands:
             return None, None, f"Command {command_name} not recognized."
 
-        return self.handlers[command_name], command_content, None
+        handler_name, guarded = self.commands[command_name]
+        handler = getattr(self, handler_name)
+        if guarded:
+            handler = self._guarded(handler)
+        return handler, command_content, None
 
     async def handle_message(self, message):
         """
@@ -440,6 +914,7 @@ class MusicBot:
             # Message not attempting to be a command.
             return
 
+        self.last_command_time = time.time()
         handler, command_content, error_msg = self.get_command_handler(message.content)
 
         # The command was not recognized
@@ -447,30 +922,86 @@ class MusicBot:
             return await message.channel.send(f":robot: {error_msg}")
 
         # Execute the command.
-        await handler(message, command_content)
+        start = time.perf_counter()
+        try:
+            await handler(message, command_content)
+        finally:
+            COMMAND_SECONDS.labels(handler.__name__).observe(
+                time.perf_counter() - start
+            )
+
+    def is_idle(self, now, timeout):
+        """
+        Returns True if the bot has had no voice connection and no commands for
+        `timeout` seconds, in which case it can be evicted.
+        """
+        if self.voice_client is not None:
+            return False
+        last_active = max(self.last_command_time, self.last_played_time or 0)
+        return now - last_active >= timeout
+
+    def close(self):
+        """
+        Release the resources held by the bot before it is dropped
+        """
+        self.cancel_playlists()
+        self.idle_scheduler.cancel(self)
+        self.prefetcher.invalidate()
+        self.media_deque.clear()
+        if self.audio_cache is not None:
+            self.audio_cache.pin(self, ())
+
+    @property
+    def spotify(self):
+        """The Spotify client, created on first use"""
+        if self._spotify is None:
+            self._spotify = self.get_spotify_client()
+        return self._spotify
 
     def get_spotify_client(self):
-        """Get Spotify client"""
-        try:
-            creds = spotipy.oauth2.SpotifyClientCredentials()
-        except spotipy.SpotifyOauthError:
-            logging.warning(
-                "No spotipy credentials found. Running without spotify capabilities."
+        """
+        Get the Spotify client. It is created once per process and shared by all
+        guilds, with a connection pool large enough for the resolver workers.
+        """
+        with MusicBot._shared_spotify_lock:
+            if MusicBot._shared_spotify_created:
+                return MusicBot._shared_spotify
+            MusicBot._shared_spotify_created = True
+            try:
+                creds = spotipy.oauth2.SpotifyClientCredentials()
+            except spotipy.SpotifyOauthError:
+                logging.warning(
+                    "No spotipy credentials found. Running without spotify "
+                    "capabilities."
+                )
+                return None
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_maxsize=MediaResolver.DEFAULT_WORKERS
             )
-            return None
-        return spotipy.Spotify(auth_manager=creds)
+            session.mount("https://", adapter)
+            MusicBot._shared_spotify = spotipy.Spotify(
+                auth_manager=creds, requests_session=session
+            )
+            return MusicBot._shared_spotify
 
     def after_callback(self, _):
         """
         Plays the next item in queue if after_callback_blocked == False, otherwise stops
-        the music. Used as a callback for play().
+        the music. Used as a callback for play(), so it runs on the audio player's
+        thread rather than the event loop.
         """
         if not self.after_callback_blocked:
-            self.loop.create_task(self.attempt_disconnect())
-            self.loop.create_task(self.next_in_queue())
+            self.song_finished_time = time.perf_counter()
+            self.loop.call_soon_threadsafe(self.song_finished)
         else:
             self.after_callback_blocked = False
 
+    def song_finished(self):
+        """Move on to the next item in queue. Run on the event loop."""
+        self.schedule_disconnect()
+        self.loop.create_task(self.next_in_queue())
+
     def _stop(self):
         """
         A helper function that stops playing music
@@ -480,10 +1011,36 @@ class MusicBot:
         if len(self.media_deque) == 0:
             self.current_media = None
 
-    def create_audio_source(self, audio_url):
-        """Creates an audio sorce from an audio url"""
-        return discord.FFmpegPCMAudio(audio_url)
+    def create_audio_source(self, audio_url, codec=None):
+        """
+        Creates an audio sorce from an audio url.
 
+        Opus streams are passed through to Discord as they are, anything else is
+        decoded to PCM and encoded to Opus by discord.py.
+        """
+        if codec == "opus":
+            audio_source = discord.FFmpegOpusAudio(audio_url, codec=codec)
+        else:
+            audio_source = discord.FFmpegPCMAudio(audio_url)
+        MusicBot.audio_sources.add(audio_source)
+        return audio_source
+
+    @classmethod
+    def count_ffmpeg_processes(cls):
+        """Returns the number of FFmpeg processes which are running"""
+        # pylint: disable=protected-access
+        return sum(
+            1
+            for audio_source in list(cls.audio_sources)
+            if audio_source._process is not None
+            and audio_source._process.poll() is None
+        )
+
+    def create_stream_audio_source(self, audio_stream):
+        """Creates an audio source from an AudioStream"""
+        return self.create_audio_source(audio_stream.url, codec=audio_stream.codec)
+
+    @metrics.timed(NEXT_IN_QUEUE_SECONDS)
     async def next_in_queue(self):
         """
         Switch to next song in queue
@@ -498,29 +1055,129 @@ class MusicBot:
             self.voice_client.stop()
             return
 
-        media, message = self.media_deque.popleft()
+        entry = self.media_deque.popleft()
+        channel = self.text_channel(entry.channel_id)
 
-        logging.info("Fetching audio URL for '%s'", media.title)
-        self.current_media = media
-        if media.duration == "00:00:00":
+        logging.info("Fetching audio URL for '%s'", entry.title)
+        self.current_media = entry
+        self.pin_audio()
+        if entry.length == 0:
             self.loop.create_task(
-                message.channel.send("Sorry, I can't play livestreams :sob:")
+                self.send_to(channel, "Sorry, I can't play livestreams :sob:")
             )
             await self.next_in_queue()
             return
 
-        audio_url = media.getbestaudio().url
-        audio_source = self.create_audio_source(audio_url)
+        audio_stream, audio_source = await self.prefetcher.take(entry) or (None, None)
+        if audio_stream is None:
+            audio_stream = await self.resolve_audio_stream(entry)
+        if audio_stream is None:
+            # E.g. the video was taken down or made private since it was queued
+            self.loop.create_task(
+                self.send_to(channel, f":robot: Unable to play {entry.title} :worried:")
+            )
+            await self.next_in_queue()
+            return
+        if audio_source is None:
+            audio_source = self.create_stream_audio_source(audio_stream)
 
         if self.voice_client.is_playing():
             self._stop()
 
         logging.info("Playing audio source")
         self.voice_client.play(audio_source, after=self.after_callback)
+        if self.song_finished_time is not None:
+            PLAYBACK_GAP_SECONDS.observe(time.perf_counter() - self.song_finished_time)
+            self.song_finished_time = None
+        self.current_media_started = time.time()
         logging.info("Audio source started")
+        if self.audio_cache is not None:
+            self.audio_cache.played(entry.videoid, audio_stream)
+        self.schedule_prefetch()
+
+        await self.send_to(
+            channel, f":notes: Now Playing :notes:\n```\n{entry.title}\n```"
+        )
+
+    async def resolve_audio_stream(self, entry):
+        """
+        Returns the best AudioStream of a queue entry, or None if it couldn't be
+        resolved. The video is only fetched again if its stream isn't cached.
+        Songs in the audio cache are played from their file instead.
+        """
+        if self.audio_cache is not None:
+            audio_stream = self.audio_cache.get(entry.videoid)
+            if audio_stream is not None:
+                return audio_stream
+        media = CachedMedia(
+            entry.videoid, entry.title, entry.length, self.coalesced_pafy_search
+        )
+        return await self.resolve_media(self.stream_cache.get_or_resolve, media)
+
+    def make_entry(self, media, message):
+        """Make a queue entry for media requested by message"""
+        self.text_channels[message.channel.id] = message.channel
+        return QueueEntry.from_media(media, message)
+
+    def text_channel(self, channel_id):
+        """
+        Returns the text channel with the given id. If it doesn't exist anymore,
+        e.g. for a restored queue, returns the first channel of the guild which the
+        bot can send messages to, or None if there is none.
+        """
+        channel = self.text_channels.get(channel_id)
+        if channel is None:
+            channel = self.guild.get_channel(channel_id)
+        if channel is None:
+            channel = next(
+                (
+                    text_channel
+                    for text_channel in self.guild.text_channels
+                    if text_channel.permissions_for(self.guild.me).send_messages
+                ),
+                None,
+            )
+        return channel
+
+    async def send_to(self, channel, content):
+        """Send content to a text channel, if there is one"""
+        if channel is None:
+            logging.warning("No channel to send '%s' to", content)
+            return
+        await channel.send(content)
+
+    def schedule_prefetch(self):
+        """
+        Start prefetching the next songs in the queue. Should be called whenever the
+        front of the queue or the currently playing song changes.
+        """
+        self.pin_audio()
+        warm_delay = 0
+        warming = self.prefetcher.create_source is not None
+        if (
+            warming
+            and self.current_media is not None
+            and self.current_media_started is not None
+        ):
+            remaining = self.current_media.length - (
+                time.time() - self.current_media_started
+            )
+            warm_delay = max(0, remaining - Prefetcher.WARM_AHEAD_SECONDS)
+        self.prefetcher.schedule(
+            itertools.islice(self.media_deque, self.prefetcher.depth), warm_delay
+        )
 
-        await message.channel.send(
-            f":notes: Now Playing :notes:\n```\n{media.title}\n```"
+    def pin_audio(self):
+        """
+        Keep the cached audio of the current song and of the songs being
+        prefetched from being evicted while they are used
+        """
+        if self.audio_cache is None:
+            return
+        entries = [self.current_media]
+        entries += itertools.islice(self.media_deque, self.prefetcher.depth)
+        self.audio_cache.pin(
+            self, [entry.videoid for entry in entries if entry is not None]
         )
 
     async def create_or_get_voice_client(self, message):
@@ -549,48 +1206,153 @@ class MusicBot:
 
         # Create a new voice client.
         logging.info("Connecting to voice channel %s", message.author.voice.channel)
-        self.voice_client = await requesting_user.voice.channel.connect()
+        await self.connect(requesting_user.voice.channel)
         logging.info("Connected to voice channel for user %s", message.author)
+
+        return self.voice_client
+
+    async def connect(self, voice_channel):
+        """Connect to a voice channel, deafened"""
+        self.voice_client = await voice_channel.connect()
         await self.voice_client.guild.change_voice_state(
-            channel=requesting_user.voice.channel, self_deaf=True
+            channel=voice_channel, self_deaf=True
         )
         logging.info("Deafened bot")
 
-        return self.voice_client
+    def queue_state(self):
+        """
+        Returns a value which changes whenever the queue, the current song or the
+        voice channel changes
+        """
+        voice_channel = self.voice_client.channel if self.voice_client else None
+        return (self.media_deque.version, self.current_media, voice_channel)
 
+    def queue_snapshot(self):
+        """
+        Returns (voice channel id, entries) of the bot's queue for saving it. The
+        current song is the first entry, so it is played again after a restart.
+        """
+        entries = list(self.media_deque)
+        if isinstance(self.current_media, QueueEntry):
+            entries.insert(0, self.current_media)
+        voice_channel_id = None
+        if self.voice_client is not None and self.voice_client.channel is not None:
+            voice_channel_id = self.voice_client.channel.id
+        return voice_channel_id, entries
+
+    async def restore_queue(self, entries, voice_channel):
+        """
+        Put saved entries in the queue and start playing them in voice_channel, if
+        it isn't None
+        """
+        self.media_deque.extend(entries)
+        if voice_channel is None or self.voice_client is not None:
+            return
+        await self.connect(voice_channel)
+        async with self.command_lock:
+            if not self.voice_client.is_playing():
+                await self.next_in_queue()
+
+    @metrics.timed(PAFY_SEARCH_SECONDS)
     def pafy_search(self, youtube_link_or_id):
-        """Search for youtube link with pafy"""
-        media = pafy.new(youtube_link_or_id)
-        if media.dislikes == 0:
-            logging.info("Ignoring dislike count in new media")
+        """
+        Search for youtube link with pafy. Only what is needed for playing the video
+        is fetched.
+        """
+        return pafy.new(youtube_link_or_id, playback_only=True)
 
+    def coalesced_pafy_search(self, youtube_link_or_id):
+        """
+        Like pafy_search, but shares the lookup with any other one for the same
+        video which is running at the same time, in any guild
+        """
+        try:
+            key = pafy.extract_video_id(youtube_link_or_id)
+        except ValueError:
+            key = youtube_link_or_id
+        return self.resolver.single_flight.run(
+            ("pafy", key), self.pafy_search, youtube_link_or_id
+        )
+
+    def cached_pafy_search(self, youtube_link_or_id):
+        """
+        Like pafy_search, but returns cached metadata for the video if there is any
+        """
+        if self.metadata_cache is None:
+            logging.info("Fetching video metadata with pafy")
+            return self.remember_stream(self.coalesced_pafy_search(youtube_link_or_id))
+
+        try:
+            video_id = pafy.extract_video_id(youtube_link_or_id)
+        except ValueError:
+            # Not a plain video link, let pafy deal with it
+            return self.remember_stream(self.coalesced_pafy_search(youtube_link_or_id))
+
+        media = self.metadata_cache.get_metadata(video_id, self.coalesced_pafy_search)
+        if media is None:
+            logging.info("Fetching video metadata with pafy")
+            media = self.coalesced_pafy_search(video_id)
+            self.metadata_cache.put_metadata(media)
+            self.remember_stream(media)
+        return media
+
+    def remember_stream(self, media):
+        """
+        Put the stream URL of a freshly fetched pafy object in the stream cache.
+        Queue entries don't keep the pafy object around, and this way it doesn't
+        have to be fetched again when the song plays, as long as the URL is valid.
+        Returns media.
+        """
+        try:
+            self.stream_cache.get_or_resolve(media)
+        except Exception as err:  # pylint: disable=broad-except
+            logging.warning("Unable to get stream of '%s': %s", media.title, err)
         return media
 
+    def coalesced_youtube_search(self, search_str):
+        """
+        Like youtube_search, but shares the search with any other one for the same
+        normalized term which is running at the same time
+        """
+        return self.resolver.single_flight.run(
+            ("search", MetadataCache.normalize(search_str)),
+            self.youtube_search,
+            search_str,
+        )
+
+    @metrics.timed(YOUTUBE_SEARCH_SECONDS)
     def youtube_search(self, search_str):
         """Search for search_str on youtube"""
         return youtubesearchpython.VideosSearch(search_str).result()
 
-    async def attempt_disconnect(self):
+    def schedule_disconnect(self):
         """
         Should be called whenever a song finishes playing, or when media is paused or
-        stopped. Attempts to disconnect the voice client after a set amount of time by
-        checking whether anything is currently playing.
+        stopped. Schedules attempt_disconnect to run after a set amount of time,
+        replacing any attempt scheduled before.
         """
         logging.info(
             "Will attempt to disconnect in %s seconds",
-            MusicBot.DISCONNECT_TIMER_SECONDS,
+            self.DISCONNECT_TIMER_SECONDS,
         )
         self.last_played_time = time.time()
-        await asyncio.sleep(MusicBot.DISCONNECT_TIMER_SECONDS)
+        self.idle_scheduler.schedule(
+            self, self.DISCONNECT_TIMER_SECONDS, self.attempt_disconnect
+        )
 
-        if self.voice_client.is_playing():
+    @metrics.timed(ATTEMPT_DISCONNECT_SECONDS)
+    async def attempt_disconnect(self):
+        """
+        Disconnects the voice client unless something is currently playing. Run by
+        the idle scheduler, see schedule_disconnect.
+        """
+        if not self.voice_client or self.voice_client.is_playing():
             return
 
-        if time.time() - self.last_played_time < self.DISCONNECT_TIMER_SECONDS:
-            return
         logging.info("Disconnecting from voice chat due to inactivity")
 
         self._stop()
+        self.prefetcher.invalidate()
         await self.voice_client.disconnect()
         self.voice_client = None
 
@@ -606,6 +1368,7 @@ class MusicBot:
             return True
         return False
 
+    @metrics.timed(GET_MEDIA_SECONDS)
     def get_media(self, search_term):
         """
         Fetches youtube result for link or search term and returns the pafy media
@@ -615,12 +1378,18 @@ class MusicBot:
         try:
             url = self.url_regex.search(search_term)
             if url:
-                logging.info("Fetching video metadata with pafy")
-                media = self.pafy_search(url.group())
+                media = self.cached_pafy_search(url.group())
             else:
-                logging.info("Fetching search results with pafy")
-                search_result = self.youtube_search(search_term)
-                media = self.pafy_search(search_result["result"][0]["id"])
+                video_id = None
+                if self.metadata_cache is not None:
+                    video_id = self.metadata_cache.get_video_id(search_term)
+                if video_id is None:
+                    logging.info("Fetching search results with pafy")
+                    search_result = self.coalesced_youtube_search(search_term)
+                    video_id = search_result["result"][0]["id"]
+                    if self.metadata_cache is not None:
+                        self.metadata_cache.put_video_id(search_term, video_id)
+                media = self.cached_pafy_search(video_id)
         except KeyError as err:
             # In rare cases we get an error processing media, e.g. when vid has no likes
             # KeyError: 'like_count'
@@ -628,62 +1397,124 @@ class MusicBot:
 
         return media
 
+    async def resolve_media(self, func, *args):
+        """
+        Run the blocking lookup func(*args) on the resolver workers.
+
+        Returns None if the lookup times out or fails, in the same way get_media
+        does when it is unable to process the media.
+        """
+        try:
+            return await self.resolver.run(func, *args)
+        except asyncio.TimeoutError:
+            return None
+        except Exception as err:  # pylint: disable=broad-except
+            # pafy and youtube-dl raise all sorts of errors for unavailable videos
+            logging.warning("Lookup failed: %s", err)
+            return None
+
     def _get_spotify_tracks(self, url):
         """
         Fetch list of spotify tracks in album/playlist or single track
 
-        Each returned track is a dictionary of title, artist, length
+        Each returned track is a dictionary of title, artist, length. Only the first
+        page of an album/playlist is fetched here, the rest arrive while the list
+        is iterated with indices().
         """
         if self.spotify is None:
             logging.error(
                 "Spotify capabilities not enabled. See docs to enable spotify"
             )
             return None
-        tracks = []
+        kind = None
         if re.search(self.spotify_track_regex, url):
-            tracks.append(self.spotify.track(url))
-
-        if re.search(self.spotify_album_regex, url):
-            tracks = self.spotify.album(url)["tracks"]["items"]
-
-        if re.search(self.spotify_playlist_regex, url):
-            tracks = [
-                item["track"] for item in self.spotify.playlist(url)["tracks"]["items"]
-            ]
+            kind = "track"
+        elif re.search(self.spotify_album_regex, url):
+            kind = "album"
+        elif re.search(self.spotify_playlist_regex, url):
+            kind = "playlist"
+        if kind is None:
+            return SpotifyList([], self.get_media)
+
+        ingest = SpotifyIngest(self.spotify, kind, url)
+        tracks = ingest.first_page()
+        return SpotifyList(
+            tracks,
+            self.get_media,
+            total=ingest.total,
+            pages=ingest.pages(self.resolver),
+        )
 
-        return SpotifyList(tracks, self.get_media)
+    def youtube_ingest(self, url):
+        """Returns the YouTubeIngest listing the videos of a YouTube playlist"""
+        return YouTubeIngest(url)
 
-    def pytube_playlist(self, url):
-        """Get playlist info from pytube"""
-        return pytube.Playlist(url)
+    def listed_media(self, track):
+        """
+        Media of a video listed in a playlist, made from the listing. The video is
+        only looked up once its stream is needed, i.e. shortly before it plays.
+        """
+        return CachedMedia(
+            track["videoid"],
+            track["title"],
+            track["length"],
+            self.coalesced_pafy_search,
+        )
 
     def _get_youtube_tracks(self, url):
         """
         Fetch list of youtube tracks in playlist
+
+        Playlist videos are queued straight from the pages of the playlist. Only
+        the first page is fetched here, the rest arrive while the list is iterated
+        with indices().
         """
-        links = None
-        if re.search(self.playlist_regex, url):
-            # Get list of URLs to individual videos in playlist
-            links = self.pytube_playlist(url)
-        else:
-            links = [url]
+        if not re.search(self.playlist_regex, url):
+            return YouTubeList([url], self.get_media)
+
+        ingest = self.youtube_ingest(url)
+        tracks = ingest.first_page()
+        return YouTubePlaylist(
+            tracks,
+            self.listed_media,
+            total=ingest.total,
+            pages=ingest.pages(self.resolver),
+        )
 
-        return YouTubeList(links, self.get_media)
+    @property
+    def playlist_remaining(self):
+        """Number of playlist tracks which are yet to be added to the queue"""
+        return sum(self.playlist_tasks.values())
+
+    def cancel_playlists(self):
+        """Cancel every playlist which is being added to the queue"""
+        for task in list(self.playlist_tasks):
+            task.cancel()
 
     async def cancel(self, message, _command_content):
         """Stop adding new songs to queue"""
-        self.continue_adding_to_playlist = False
+        self.cancel_playlists()
         await message.add_reaction(MusicBot.REACTION_EMOJI)
 
+    @metrics.timed(PLAYLIST_SECONDS)
     async def playlist(self, message, command_content):
-        """Play a playlist, youtube, or spotify"""
+        """
+        Play a playlist, youtube, or spotify
+
+        The playlist is added to the queue by a background task, so this returns as
+        soon as the first song is in the queue. Playlists requested while another
+        one is being added are added after it, in order.
+        """
         logging.info("Fetching playlist for user %s", message.author)
         playlist = None
-        self.continue_adding_to_playlist = True
         if re.search(self.spotify_regex, command_content):
-            playlist = self._get_spotify_tracks(command_content)
+            playlist = await self.resolve_media(
+                self._get_spotify_tracks, command_content
+            )
         elif re.search(self.youtube_playlist_regex, command_content):
-            playlist = self._get_youtube_tracks(command_content)
+            playlist = await self.resolve_media(
+                self._get_youtube_tracks, command_content
+            )
 
         if playlist is None:
             await message.add_reaction("👎")
@@ -691,48 +1522,128 @@ class MusicBot:
             return
 
         await message.add_reaction(MusicBot.REACTION_EMOJI)
-        added = []
+        status_fmt = "Fetching playlist... {}"
+        reply = await message.channel.send(status_fmt.format(""))
+        progress_reporter = ProgressReporter(self.loop, reply, status_fmt)
+
+        previous = next(reversed(self.playlist_tasks), None)
+        started = asyncio.Event()
+        task = self.loop.create_task(
+            self.add_playlist(playlist, message, progress_reporter, previous, started)
+        )
+        self.playlist_tasks[task] = len(playlist)
+
+        def done(task):
+            del self.playlist_tasks[task]
+            started.set()
+
+        task.add_done_callback(done)
+        if previous is None:
+            await started.wait()
+
+    async def add_playlist(
+        self, playlist, message, progress_reporter, previous, started
+    ):
+        """
+        Add the songs of a playlist to the queue as they are looked up.
+
+        Arguments:
+          playlist: The SongList to add.
+          message: The message which requested the playlist.
+          progress_reporter: ProgressReporter for the playlist's status message.
+          previous: Task adding the playlist requested before this one, or None.
+            This playlist is added once it is done.
+          started: Event which is set once the first song has been added, or once
+            it is clear that no song will be.
+        """
+        shown = []  # The first few songs, for the summary
+        n_added = 0
         n_failed = 0
         progress = 0
         total = len(playlist)
-        status_fmt = "Fetching playlist... {}"
-        reply = await message.channel.send(status_fmt.format(""))
-        for media in playlist:
-            if not self.continue_adding_to_playlist:
-                break
-            await reply.edit(content=status_fmt.format(f"{progress/total:.0%}"))
-            progress += 1
-            self.media_deque.append((media, message))
-            logging.info("Added song '%s' from playlist", media.title)
-            added.append(media)
-            if len(added) == 1 and not self.voice_client.is_playing():
+        resolution = None
+        task = asyncio.current_task()
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            if playlist.needs_lookup:
+                # Tracks are looked up concurrently, as soon as their page has
+                # arrived, but handed out in playlist order
+                resolution = self.resolver.map_ordered(
+                    playlist.__getitem__,
+                    playlist.indices(),
+                    limiter=self.playlist_limiter,
+                )
+                playlist_media = resolution
+            else:
+                playlist_media = (playlist[index] async for index in playlist.indices())
+            async for media in playlist_media:
+                progress += 1
+                # The total may be an estimate, while the pages are coming in
+                self.playlist_tasks[task] = max(0, self.playlist_tasks[task] - 1)
+                progress_reporter.update(progress, total)
+                if media is None:
+                    n_failed += 1
+                    PLAYLIST_TRACKS.labels("failed").inc()
+                    continue
+                PLAYLIST_TRACKS.labels("added").inc()
+                entry = self.make_entry(media, message)
+                self.media_deque.append(entry)
+                logging.info("Added song '%s' from playlist", entry.title)
+                n_added += 1
+                if len(shown) < self.N_PLAYLIST_SHOW:
+                    shown.append(entry)
+                if n_added == 1 or self.current_media is None:
+                    # Songs are only looked up when they play, so the first ones
+                    # may turn out to be unavailable and be skipped
+                    await self.start_playlist()
+                    started.set()
+                elif len(self.media_deque) <= self.prefetcher.depth:
+                    self.schedule_prefetch()
+        except asyncio.CancelledError:
+            logging.info("Adding playlist cancelled by user")
+        except Exception as err:  # pylint: disable=broad-except
+            # Nobody awaits this task, so the songs added so far are still reported
+            logging.error("Adding playlist failed: %s", err)
+        finally:
+            if resolution is not None:
+                resolution.cancel()
+            self.playlist_tasks[task] = 0
+            started.set()
+        logging.info("%d items added to queue, %d failed", n_added, n_failed)
+
+        final_status = self.format_playlist_summary(shown, n_added, n_failed)
+        logging.debug("final status message: \n%s", final_status)
+
+        await progress_reporter.finish(final_status)
+
+    async def start_playlist(self):
+        """Start playing the first song of a playlist, unless something is playing"""
+        async with self.command_lock:
+            if self.voice_client is not None and not self.voice_client.is_playing():
                 await self.next_in_queue()
-        logging.info("%d items added to queue, %d failed", len(added), n_failed)
 
+    def format_playlist_summary(self, shown, n_added, n_failed):
+        """
+        Format the message shown after a playlist has been added to the queue
+
+        Arguments:
+          shown: The first songs which were added, N_PLAYLIST_SHOW at most.
+          n_added: Number of songs which were added.
+          n_failed: Number of songs which couldn't be found.
+        """
         final_status = ""
-        final_status += f":clipboard: Added {len(added)} of "
-        final_status += f"{len(added)+n_failed} songs to queue :notes:\n"
+        final_status += f":clipboard: Added {n_added} of "
+        final_status += f"{n_added+n_failed} songs to queue :notes:\n"
         final_status += f"```{self.SYNTAX_LANGUAGE}"
         final_status += "\n"
-        for media in added[: self.N_PLAYLIST_SHOW]:
-            title = media.title
-            titlewidth = self.TEXTWIDTH - 10
-            if len(title) > titlewidth:
-                title = title[: titlewidth - 3] + "..."
-
-            duration_m = int(media.duration[:2]) * 60 + int(media.duration[3:5])
-            duration_s = int(media.duration[6:])
-            duration = f"({duration_m}:{duration_s:0>2})"
-            # Time: 5-6 char + () + buffer = 10
-            final_status += f"{title:<{titlewidth}}{duration:>10}"
+        for entry in shown:
+            final_status += entry.line(self.TEXTWIDTH)
             final_status += "\n"
-        if len(added) >= self.N_PLAYLIST_SHOW:
+        if n_added >= self.N_PLAYLIST_SHOW:
             final_status += "...\n"
         final_status += "```"
-
-        logging.debug("final status message: \n%s", final_status)
-
-        await reply.edit(content=final_status)
+        return final_status
 
     async def play_empty(self, message, command_content):
         """
@@ -761,10 +1672,12 @@ class MusicBot:
         if re.search(self.spotify_track_regex, command_content):
             # Since _get_spotify_tracks returns a list of all songs in the spotify link
             # the list will be 1-long, and only contain the requested song.
-            media = self._get_spotify_tracks(command_content)[0]
+            tracks = await self.resolve_media(self._get_spotify_tracks, command_content)
         else:
             # Same here, but for youtube tracks.
-            media = self._get_youtube_tracks(command_content)[0]
+            tracks = self._get_youtube_tracks(command_content)
+        if tracks:
+            media = await self.resolve_media(tracks.__getitem__, 0)
 
         if media is None:
             await message.channel.send(":robot: Error getting media data :robot:")
@@ -772,14 +1685,16 @@ class MusicBot:
 
         logging.debug("Media found:\n%s", media)
 
+        entry = self.make_entry(media, message)
         if playnext:
-            self.media_deque.appendleft((media, message))
+            self.media_deque.appendleft(entry)
         else:
-            self.media_deque.append((media, message))
+            self.media_deque.append(entry)
 
         voice_client = await self.create_or_get_voice_client(message)
         if voice_client.is_playing():
             logging.info("Added '%s' to queue", media.title)
+            self.schedule_prefetch()
             await message.channel.send(
                 f":clipboard: Added to Queue\n```\n{media.title}\n```"
             )
@@ -829,8 +1744,9 @@ class MusicBot:
             return
 
         self._stop()
+        self.prefetcher.invalidate()
         logging.info("Stopped media for user %s", message.author)
-        self.loop.create_task(self.attempt_disconnect())
+        self.schedule_disconnect()
         await message.add_reaction(MusicBot.REACTION_EMOJI)
 
     async def pause(self, message, _command_content):
@@ -849,8 +1765,10 @@ class MusicBot:
             return
 
         self.voice_client.pause()
+        # A warmed up audio source would go stale while paused
+        self.prefetcher.invalidate()
         logging.info("Paused media for user %s", message.author)
-        self.loop.create_task(self.attempt_disconnect())
+        self.schedule_disconnect()
         await message.add_reaction(MusicBot.REACTION_EMOJI)
 
     async def resume(self, message, _command_content):
@@ -878,6 +1796,7 @@ class MusicBot:
         if self.voice_client.is_paused():
             logging.info("Resuming for user %s", message.author)
             self.voice_client.resume()
+            self.schedule_prefetch()
         elif not self.voice_client.is_playing():
             logging.info("Resuming for user %s (next_in_queue)", message.author)
             await self.next_in_queue()
@@ -904,6 +1823,7 @@ class MusicBot:
         while len(self.media_deque) != 0:
             self.media_deque.popleft()
 
+        self.prefetcher.invalidate()
         self._stop()
         await message.add_reaction(MusicBot.REACTION_EMOJI)
 
@@ -922,31 +1842,110 @@ class MusicBot:
         reply += "```"
         await message.channel.send(reply)
 
-    async def show_queue(self, message, _command_content):
+    async def show_queue(self, message, command_content):
         """
-        Displays media that has been queued
+        Displays a page of the media that has been queued
         """
-        await self.show_current(message, _command_content)
+        try:
+            page = int(command_content) if command_content else 1
+        except ValueError:
+            await message.channel.send(":robot: Page must be a number")
+            return
+        await self.show_current(message, command_content)
 
-        reply = "```\n"
+        n_pages = self.media_deque.n_pages(self.QUEUE_PAGE_SIZE)
+        page = min(max(page, 1), n_pages)
+        lines = []
         if len(self.media_deque) == 0:
-            reply += " -- No audio in queue --\n"
+            lines.append(" -- No audio in queue --")
         else:
-            reply += " -- Queue --\n"
+            lines.append(f" -- Queue, page {page}/{n_pages} --")
+            for position, entry in self.media_deque.page(page, self.QUEUE_PAGE_SIZE):
+                lines.append(f"{position:>3}: {entry.line(self.TEXTWIDTH)}")
+            lines.append(
+                f" -- {len(self.media_deque)} songs, "
+                f"{format_duration(self.media_deque.total_length)} --"
+            )
+        if self.playlist_remaining > 0:
+            lines.append(f" -- {self.playlist_remaining} more loading --")
 
-        for index, item in enumerate(self.media_deque):
-            media, _ = item  # we only care about the media metadata
-            reply += str(index + 1) + ": " + media.title
-            reply += "\n"
-        reply += "```"
+        await message.channel.send("```\n" + "\n".join(lines) + "\n```")
 
-        await message.channel.send(reply)
+    async def parse_queue_positions(self, message, command_content, count):
+        """
+        Parse `count` queue positions, as shown by -queue, from command_content.
+        Returns them as indices into media_deque, or None after telling the user
+        what is wrong with them.
+        """
+        try:
+            positions = [int(word) for word in command_content.split()]
+        except ValueError:
+            positions = []
+        if len(positions) != count:
+            await message.channel.send(
+                f":robot: Please enter {count} position(s) in the queue"
+            )
+            return None
+        if not all(1 <= position <= len(self.media_deque) for position in positions):
+            await message.channel.send(
+                f":robot: The queue only has {len(self.media_deque)} songs"
+            )
+            return None
+        return [position - 1 for position in positions]
 
-    async def move(self, message, _command_content):
+    async def remove(self, message, command_content):
+        """
+        Remove the song at the given position from the queue
+        """
+        indices = await self.parse_queue_positions(message, command_content, 1)
+        if indices is None:
+            return
+        entry = self.media_deque.pop(indices[0])
+        self.schedule_prefetch()
+        logging.info("User %s removed '%s'", message.author, entry.title)
+        await message.channel.send(f":wastebasket: Removed\n```\n{entry.title}\n```")
+
+    async def move_in_queue(self, message, command_content):
+        """
+        Move the song at one position in the queue to another
+        """
+        indices = await self.parse_queue_positions(message, command_content, 2)
+        if indices is None:
+            return
+        self.media_deque.move(*indices)
+        self.schedule_prefetch()
+        await message.add_reaction(MusicBot.REACTION_EMOJI)
+
+    async def skip_to(self, message, command_content):
+        """
+        Skip the songs in the queue before the given position and play it
+        """
+        if await self.notify_if_voice_client_is_missing(message):
+            return
+        indices = await self.parse_queue_positions(message, command_content, 1)
+        if indices is None:
+            return
+        self.media_deque.drop_front(indices[0])
+        await self.next_in_queue()
+        await message.add_reaction(MusicBot.REACTION_EMOJI)
+
+    async def shuffle(self, message, _command_content):
+        """
+        Shuffle the songs in the queue
+        """
+        self.media_deque.shuffle()
+        self.schedule_prefetch()
+        await message.add_reaction(MusicBot.REACTION_EMOJI)
+
+    async def move(self, message, command_content):
         """
         Moves the bot to the voice channel that the message author is currently
-        connected to.
+        connected to, or a song in the queue if given two positions.
         """
+        if command_content:
+            await self.move_in_queue(message, command_content)
+            return
+
         if await self.notify_if_voice_client_is_missing(message):
             return
 
@@ -987,6 +1986,7 @@ class MusicBot:
         """Disconnects the bot from the voice channel its connected to, if any."""
         if self.voice_client:
             self._stop()
+            self.prefetcher.invalidate()
             await self.voice_client.disconnect()
             self.voice_client = None
         await message.add_reaction(MusicBot.REACTION_EMOJI)
@@ -1105,6 +2105,27 @@ class MusicBot:
             await message.channel.send(joke["delivery"])
 
 
+MusicBot.register_commands()
+metrics.REGISTRY.gauge(
+    "bot_ffmpeg_processes",
+    "FFmpeg processes which are running",
+    MusicBot.count_ffmpeg_processes,
+)
+
+
+def run_shard(shard_id, shard_count, metrics_queue, bot_token, options):
+    """
+    Run a single shard of the bot. Used as the target of the shard processes.
+    """
+    logging.info("Starting shard %d of %d", shard_id, shard_count)
+    BotDispatcher(
+        shard_id=shard_id,
+        shard_count=shard_count,
+        metrics_queue=metrics_queue,
+        **options,
+    ).run(bot_token)
+
+
 def parse():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description="This is The Lone Dancer")
@@ -1130,6 +2151,101 @@ def parse():
         "--token",
         help="Discord token for bot; use --env-file if possible instead",
     )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Number of shard processes to run the bot as; each shard serves a "
+        "part of the guilds (default: 1)",
+    )
+    parser.add_argument(
+        "--resolver-workers",
+        type=int,
+        default=MediaResolver.DEFAULT_WORKERS,
+        help="Number of worker threads used for looking up media "
+        f"(default: {MediaResolver.DEFAULT_WORKERS})",
+    )
+    parser.add_argument(
+        "--resolve-timeout",
+        type=float,
+        default=MediaResolver.DEFAULT_TIMEOUT_SECONDS,
+        help="Seconds to wait for a single media lookup, 0 to wait forever "
+        f"(default: {MediaResolver.DEFAULT_TIMEOUT_SECONDS})",
+    )
+    parser.add_argument(
+        "--playlist-concurrency",
+        type=int,
+        default=MediaResolver.DEFAULT_CONCURRENCY,
+        help="Number of playlist tracks looked up at the same time "
+        f"(default: {MediaResolver.DEFAULT_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "--guild-lookup-limit",
+        type=int,
+        default=MediaResolver.DEFAULT_GUILD_LIMIT,
+        help="Maximum number of resolver workers used by one guild's playlists "
+        f"(default: {MediaResolver.DEFAULT_GUILD_LIMIT})",
+    )
+    parser.add_argument(
+        "--cache-db",
+        default="media_cache.sqlite3",
+        help="SQLite database for caching media metadata between restarts; pass an "
+        "empty string to only cache in memory (default: media_cache.sqlite3)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        help="Serve metrics in the Prometheus text format on "
+        "http://127.0.0.1:PORT/metrics, shards use PORT + shard id; 0 disables "
+        "the endpoint (default: 0)",
+    )
+    parser.add_argument(
+        "--queue-db",
+        default="queues.sqlite3",
+        help="SQLite database the queues are saved in, so that they are restored "
+        "after a restart; pass an empty string to disable (default: queues.sqlite3)",
+    )
+    parser.add_argument(
+        "--prefetch-depth",
+        type=int,
+        default=Prefetcher.DEFAULT_DEPTH,
+        help="Number of queued songs to prepare while the current song is playing "
+        f"(default: {Prefetcher.DEFAULT_DEPTH})",
+    )
+    parser.add_argument(
+        "--prefetch-warm",
+        action="store_true",
+        help="Also start FFmpeg for the next song shortly before the current one ends",
+    )
+    parser.add_argument(
+        "--audio-cache-dir",
+        default="",
+        help="Directory to keep the audio of frequently played songs in, so that "
+        "replays don't stream them again; empty to disable (default: disabled)",
+    )
+    parser.add_argument(
+        "--audio-cache-size",
+        type=int,
+        default=AudioFileCache.DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="Size budget of the audio cache of each shard in MiB "
+        f"(default: {AudioFileCache.DEFAULT_MAX_BYTES // (1024 * 1024)})",
+    )
+    parser.add_argument(
+        "--audio-cache-min-plays",
+        type=int,
+        default=AudioFileCache.DEFAULT_MIN_PLAYS,
+        help="Number of plays after which a song's audio is cached "
+        f"(default: {AudioFileCache.DEFAULT_MIN_PLAYS})",
+    )
+    parser.add_argument(
+        "--idle-eviction",
+        type=float,
+        default=BotDispatcher.DEFAULT_IDLE_EVICTION_SECONDS,
+        help="Seconds without voice connection or commands before a guild's state "
+        "is dropped, 0 to keep it forever "
+        f"(default: {BotDispatcher.DEFAULT_IDLE_EVICTION_SECONDS})",
+    )
     return parser.parse_args()
 
 
@@ -1158,5 +2274,24 @@ if __name__ == "__main__":
                     token = match.group(1).strip()
     assert token is not None
 
+    dispatcher_options = {
+        "resolver_workers": cli.resolver_workers,
+        "resolve_timeout": cli.resolve_timeout,
+        "playlist_concurrency": cli.playlist_concurrency,
+        "guild_lookup_limit": cli.guild_lookup_limit,
+        "cache_db": cli.cache_db,
+        "prefetch_depth": cli.prefetch_depth,
+        "prefetch_warm": cli.prefetch_warm,
+        "idle_eviction_seconds": cli.idle_eviction,
+        "queue_db": cli.queue_db,
+        "metrics_port": cli.metrics_port,
+        "audio_cache_dir": cli.audio_cache_dir,
+        "audio_cache_bytes": cli.audio_cache_size * 1024 * 1024,
+        "audio_cache_min_plays": cli.audio_cache_min_plays,
+    }
+
     logging.info("Starting bot")
-    BotDispatcher().run(token)
+    if cli.shards > 1:
+        ShardSupervisor(run_shard, cli.shards, args=(token, dispatcher_options)).run()
+    else:
+        BotDispatcher(**dispatcher_options).run(token)
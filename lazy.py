@@ -0,0 +1,38 @@
+"""
+Defers importing heavy modules until they are first used.
+"""
+
+import importlib
+
+
+class LazyModule:
+    """
+    Stands in for a module, which is imported the first time one of its attributes
+    is accessed.
+
+    Used for integrations which take long to import, such as youtube-dl with all
+    of its extractors, so that they don't slow down starting the bot and are only
+    loaded if they are actually needed. Importing is thread-safe, as the import
+    system takes a lock per module.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        # Only called for attributes which aren't set on the instance itself
+        if attribute in ("_name", "_module"):
+            raise AttributeError(attribute)
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+    @property
+    def loaded(self):
+        """Whether the module has been imported yet"""
+        return self._module is not None
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
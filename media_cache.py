@@ -0,0 +1,325 @@
+"""
+Caches for media metadata, so replaying a song doesn't have to hit YouTube.
+"""
+# pylint: disable=too-many-instance-attributes
+
+import collections
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+
+class CachedMedia:
+    """
+    Stand-in for a pafy media object, built from cached metadata.
+
+    Only the metadata needed for queueing is stored. The full pafy object, with the
+    stream information, is fetched the first time a stream is asked for.
+    """
+
+    __slots__ = ("videoid", "title", "length", "_fetch", "_media")
+
+    def __init__(self, videoid, title, length, fetch):
+        """
+        Arguments:
+          videoid: YouTube video id.
+          title: Title of the video.
+          length: Length of the video in seconds.
+          fetch: Function taking a video id and returning the full pafy object.
+        """
+        self.videoid = videoid
+        self.title = title
+        self.length = length
+        self._fetch = fetch
+        self._media = None
+
+    def __repr__(self):
+        return f"CachedMedia({self.videoid!r}, {self.title!r}, {self.length!r})"
+
+    @property
+    def duration(self):
+        """Duration formatted like pafy does it, as HH:MM:SS"""
+        return time.strftime("%H:%M:%S", time.gmtime(self.length))
+
+    @property
+    def expiry(self):
+        """Time when the stream URLs of the fetched media expire, if fetched"""
+        if self._media is None:
+            return None
+        return self._media.expiry
+
+    def getbestaudio(self, *args, **kwargs):
+        """Fetch the full media if needed and return its best audio stream"""
+        if self._media is None:
+            self._media = self._fetch(self.videoid)
+        return self._media.getbestaudio(*args, **kwargs)
+
+
+class MetadataCache:
+    """
+    Two tier cache mapping search terms to video ids and video ids to metadata.
+
+    The first tier is an in-memory LRU, the second an SQLite database which
+    survives restarts. Entries expire after a TTL in both tiers. All methods are
+    thread-safe, as the cache is used from the resolver workers. The database is
+    in WAL mode, so that the processes of a sharded bot can share it, and writes
+    to it are best-effort: an entry which can't be stored is only kept in memory.
+    """
+
+    DEFAULT_MAX_ENTRIES = 4096
+    DEFAULT_METADATA_TTL_SECONDS = 60 * 60 * 24 * 7
+    # Search results drift faster than the metadata of a video does
+    DEFAULT_SEARCH_TTL_SECONDS = 60 * 60 * 24
+
+    def __init__(
+        self,
+        path=None,
+        max_entries=DEFAULT_MAX_ENTRIES,
+        metadata_ttl=DEFAULT_METADATA_TTL_SECONDS,
+        search_ttl=DEFAULT_SEARCH_TTL_SECONDS,
+    ):
+        """
+        Arguments:
+          path: Path to the SQLite database. If None, only the in-memory tier is
+            used.
+          max_entries: Number of entries kept in each in-memory LRU.
+          metadata_ttl: Seconds before video metadata expires.
+          search_ttl: Seconds before a search term to video id mapping expires.
+        """
+        self.max_entries = max_entries
+        self.metadata_ttl = metadata_ttl
+        self.search_ttl = search_ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._searches = collections.OrderedDict()  # term -> (video id, expires)
+        self._metadata = collections.OrderedDict()  # id -> (title, length, expires)
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS searches (
+                    term TEXT PRIMARY KEY,
+                    video_id TEXT NOT NULL,
+                    expires REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS metadata (
+                    video_id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    length INTEGER NOT NULL,
+                    expires REAL NOT NULL
+                );
+                """
+            )
+            self.purge_expired()
+
+    @staticmethod
+    def normalize(search_term):
+        """Normalize a search term so trivially different searches share entries"""
+        return re.sub(r"\s+", " ", search_term).strip().lower()
+
+    def _lru_get(self, lru, key, now):
+        value = lru.get(key)
+        if value is None:
+            return None
+        if value[-1] < now:
+            del lru[key]
+            return None
+        lru.move_to_end(key)
+        return value
+
+    def _lru_put(self, lru, key, value):
+        lru[key] = value
+        lru.move_to_end(key)
+        while len(lru) > self.max_entries:
+            lru.popitem(last=False)
+
+    def _count(self, value):
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def get_video_id(self, search_term):
+        """Returns the cached video id for search_term, or None"""
+        term = self.normalize(search_term)
+        now = time.time()
+        with self._lock:
+            value = self._lru_get(self._searches, term, now)
+            if value is None and self._db is not None:
+                value = self._db.execute(
+                    "SELECT video_id, expires FROM searches "
+                    "WHERE term = ? AND expires >= ?",
+                    (term, now),
+                ).fetchone()
+                if value is not None:
+                    self._lru_put(self._searches, term, tuple(value))
+            return self._count(value and value[0])
+
+    def put_video_id(self, search_term, video_id):
+        """Remember that search_term resolves to video_id"""
+        term = self.normalize(search_term)
+        value = (video_id, time.time() + self.search_ttl)
+        with self._lock:
+            self._lru_put(self._searches, term, value)
+            self._write(
+                "INSERT OR REPLACE INTO searches VALUES (?, ?, ?)", (term, *value)
+            )
+
+    def get_metadata(self, video_id, fetch):
+        """
+        Returns a CachedMedia for video_id, or None if it isn't cached.
+
+        `fetch` is used by the CachedMedia to fetch the full media object when its
+        stream is needed.
+        """
+        now = time.time()
+        with self._lock:
+            value = self._lru_get(self._metadata, video_id, now)
+            if value is None and self._db is not None:
+                value = self._db.execute(
+                    "SELECT title, length, expires FROM metadata "
+                    "WHERE video_id = ? AND expires >= ?",
+                    (video_id, now),
+                ).fetchone()
+                if value is not None:
+                    self._lru_put(self._metadata, video_id, tuple(value))
+            if self._count(value) is None:
+                return None
+        title, length, _ = value
+        return CachedMedia(video_id, title, length, fetch)
+
+    def put_metadata(self, media):
+        """Store the metadata of a pafy media object"""
+        value = (media.title, media.length, time.time() + self.metadata_ttl)
+        with self._lock:
+            self._lru_put(self._metadata, media.videoid, value)
+            self._write(
+                "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?)",
+                (media.videoid, *value),
+            )
+
+    def _write(self, sql, parameters):
+        """Run a write on the database, if there is one. Call with the lock held."""
+        if self._db is None:
+            return
+        try:
+            with self._db:
+                self._db.execute(sql, parameters)
+        except sqlite3.Error as err:
+            # E.g. the database is locked by another shard; a lookup is only lost
+            logging.warning("Unable to write to metadata cache: %s", err)
+
+    def purge_expired(self):
+        """Remove expired entries from the database"""
+        if self._db is None:
+            return
+        now = time.time()
+        with self._lock, self._db:
+            n_searches = self._db.execute(
+                "DELETE FROM searches WHERE expires < ?", (now,)
+            ).rowcount
+            n_metadata = self._db.execute(
+                "DELETE FROM metadata WHERE expires < ?", (now,)
+            ).rowcount
+        logging.info(
+            "Purged %d searches and %d videos from metadata cache",
+            n_searches,
+            n_metadata,
+        )
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+AudioStream = collections.namedtuple("AudioStream", ["url", "codec"])
+
+
+class StreamUrlCache:
+    """
+    Cache of audio stream URLs per video id, aware of when the URLs expire.
+
+    YouTube stream URLs are only valid for a few hours. An entry is only handed out
+    while it is further than `refresh_margin` seconds from expiring, so a song
+    never starts playing from a URL which dies halfway through it.
+    """
+
+    DEFAULT_MAX_ENTRIES = 1024
+    DEFAULT_REFRESH_MARGIN_SECONDS = 60 * 30
+    # Used when the media doesn't say when its URLs expire, same as pafy's lifespan
+    DEFAULT_LIFESPAN_SECONDS = 60 * 60 * 5
+
+    def __init__(
+        self,
+        max_entries=DEFAULT_MAX_ENTRIES,
+        refresh_margin=DEFAULT_REFRESH_MARGIN_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._urls = collections.OrderedDict()  # video id -> (AudioStream, expiry)
+
+    def get(self, video_id):
+        """
+        Returns the cached AudioStream for video_id if it isn't about to expire,
+        otherwise None
+        """
+        with self._lock:
+            value = self._urls.get(video_id)
+            if value is None:
+                return None
+            audio_stream, expiry = value
+            if expiry - self.refresh_margin < time.time():
+                del self._urls[video_id]
+                return None
+            self._urls.move_to_end(video_id)
+            return audio_stream
+
+    def put(self, video_id, audio_stream, expiry):
+        """Cache audio_stream for video_id until the time `expiry`"""
+        with self._lock:
+            self._urls[video_id] = (audio_stream, expiry)
+            self._urls.move_to_end(video_id)
+            while len(self._urls) > self.max_entries:
+                self._urls.popitem(last=False)
+
+    def invalidate(self, video_id):
+        """Forget the URL for video_id, e.g. because it stopped working"""
+        with self._lock:
+            self._urls.pop(video_id, None)
+
+    def get_or_resolve(self, media):
+        """
+        Returns the best AudioStream for a pafy media object, resolving it only if
+        it isn't cached or is close to expiring. May block, so call it from a worker.
+
+        WebM streams are preferred, as they are Opus encoded and can be sent to
+        Discord without re-encoding. The codec of other streams is left as None.
+        """
+        audio_stream = self.get(media.videoid)
+        if audio_stream is not None:
+            return audio_stream
+
+        stream = media.getbestaudio(preftype="webm")
+        if stream is None:
+            # pafy returns None if there is no audio stream of the preferred type
+            stream = media.getbestaudio()
+        codec = "opus" if stream.extension == "webm" else None
+        audio_stream = AudioStream(stream.url, codec)
+        try:
+            expiry = float(media.expiry)
+        except (AttributeError, TypeError, ValueError):
+            expiry = time.time() + self.DEFAULT_LIFESPAN_SECONDS
+        self.put(media.videoid, audio_stream, expiry)
+        return audio_stream
@@ -0,0 +1,240 @@
+"""
+The queue of songs waiting to be played in a guild.
+"""
+
+import itertools
+import random
+import time
+
+
+def format_duration(seconds):
+    """Format a number of seconds as M:SS, or H:MM:SS if it is an hour or more"""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:0>2}:{seconds:0>2}"
+    return f"{minutes}:{seconds:0>2}"
+
+
+class QueueEntry:
+    """
+    A song in the queue.
+
+    Only what is needed to show the song and to find it again is kept. The pafy
+    object, with youtube-dl's full info dictionary, is dropped once the entry has
+    been made, and the stream is resolved from the video id shortly before the song
+    plays. The requester and channel are kept as ids rather than Discord objects.
+    """
+
+    __slots__ = ("videoid", "title", "length", "requester_id", "channel_id", "_line")
+
+    def __init__(self, videoid, title, length, requester_id, channel_id):
+        """
+        Arguments:
+          videoid: YouTube video id.
+          title: Title of the video.
+          length: Length of the video in seconds, 0 for livestreams.
+          requester_id: Id of the user who queued the song.
+          channel_id: Id of the text channel the song was queued from.
+        """
+        self.videoid = videoid
+        self.title = title
+        self.length = length
+        self.requester_id = requester_id
+        self.channel_id = channel_id
+        self._line = None
+
+    @classmethod
+    def from_media(cls, media, message):
+        """Make an entry for a pafy media object queued by a Discord message"""
+        return cls(
+            media.videoid,
+            media.title,
+            # pafy has no length for some livestreams and premieres
+            media.length or 0,
+            message.author.id,
+            message.channel.id,
+        )
+
+    def __repr__(self):
+        return f"QueueEntry({self.videoid!r}, {self.title!r}, {self.length!r})"
+
+    @property
+    def duration(self):
+        """Duration formatted like pafy does it, as HH:MM:SS"""
+        return time.strftime("%H:%M:%S", time.gmtime(self.length))
+
+    def line(self, width):
+        """
+        The entry formatted as a line `width` characters wide, with the title on
+        the left and the duration on the right. Formatted once and then cached.
+        """
+        if self._line is None or len(self._line) != width:
+            duration = f"({format_duration(self.length)})"
+            titlewidth = width - 10
+            title = self.title
+            if len(title) > titlewidth:
+                title = title[: titlewidth - 3] + "..."
+            # Time: 5-6 char + () + buffer = 10
+            self._line = f"{title:<{titlewidth}}{duration:>10}"
+        return self._line
+
+
+class MediaQueue:
+    """
+    Queue of QueueEntry objects supporting positional operations on long queues.
+
+    The entries are kept in a blocked list: a list of blocks of at most
+    2 * LOAD entries each. Finding a position only walks the block lengths, and
+    inserting or deleting only shifts the entries of one block, so every
+    positional operation is O(n / LOAD + LOAD) rather than O(n). A running total of
+    the entries' lengths is kept, so the length of the whole queue never has to be
+    summed up.
+
+    Positions are indices counting from 0, and negative positions count from the
+    end, like for lists. `version` is increased by every change, so that others can
+    tell whether the queue changed since they last looked at it.
+    """
+
+    LOAD = 256
+
+    def __init__(self, entries=()):
+        self.blocks = []
+        self.size = 0
+        self.total_length = 0
+        self.version = 0
+        self.extend(entries)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.blocks)
+
+    def __getitem__(self, index):
+        block, position = self._locate(index)
+        return self.blocks[block][position]
+
+    def _locate(self, index):
+        """Returns (block index, index in block) of the entry at `index`"""
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("queue index out of range")
+        for block_index, block in enumerate(self.blocks):
+            if index < len(block):
+                return block_index, index
+            index -= len(block)
+        raise AssertionError("block lengths out of sync with queue size")
+
+    def insert(self, index, entry):
+        """Insert an entry before position `index`"""
+        if index < 0:
+            index = max(0, index + self.size)
+        index = min(index, self.size)
+        self.version += 1
+        self.size += 1
+        self.total_length += entry.length
+
+        if not self.blocks:
+            self.blocks.append([entry])
+            return
+        if index == self.size - 1:
+            block_index, position = len(self.blocks) - 1, len(self.blocks[-1])
+        else:
+            block_index, position = self._locate(index)
+        block = self.blocks[block_index]
+        block.insert(position, entry)
+        if len(block) > 2 * self.LOAD:
+            self.blocks[block_index : block_index + 1] = [
+                block[: self.LOAD],
+                block[self.LOAD :],
+            ]
+
+    def append(self, entry):
+        """Add an entry to the end of the queue"""
+        self.insert(self.size, entry)
+
+    def appendleft(self, entry):
+        """Add an entry to the front of the queue"""
+        self.insert(0, entry)
+
+    def extend(self, entries):
+        """Add entries to the end of the queue"""
+        for entry in entries:
+            self.append(entry)
+
+    def pop(self, index=-1):
+        """Remove and return the entry at position `index`"""
+        block_index, position = self._locate(index)
+        block = self.blocks[block_index]
+        entry = block.pop(position)
+        if not block:
+            del self.blocks[block_index]
+        elif (
+            len(block) < self.LOAD // 2
+            and block_index + 1 < len(self.blocks)
+            and len(block) + len(self.blocks[block_index + 1]) <= self.LOAD
+        ):
+            # Merge small neighbours so that the number of blocks stays small
+            block.extend(self.blocks.pop(block_index + 1))
+        self.version += 1
+        self.size -= 1
+        self.total_length -= entry.length
+        return entry
+
+    def popleft(self):
+        """Remove and return the entry at the front of the queue"""
+        return self.pop(0)
+
+    def move(self, source, destination):
+        """Move the entry at position `source` to position `destination`"""
+        self.insert(destination, self.pop(source))
+
+    def drop_front(self, count):
+        """Remove the first `count` entries"""
+        count = min(count, self.size)
+        self.version += 1
+        while count > 0:
+            block = self.blocks[0]
+            dropped = block[:count]
+            if len(dropped) == len(block):
+                del self.blocks[0]
+            else:
+                del block[:count]
+            count -= len(dropped)
+            self.size -= len(dropped)
+            self.total_length -= sum(entry.length for entry in dropped)
+
+    def shuffle(self):
+        """Put the entries in a random order"""
+        entries = list(self)
+        random.shuffle(entries)
+        self.clear()
+        self.extend(entries)
+
+    def clear(self):
+        """Remove every entry"""
+        self.blocks = []
+        self.size = 0
+        self.total_length = 0
+        self.version += 1
+
+    def n_pages(self, page_size):
+        """Number of pages of `page_size` entries, at least 1"""
+        return max(1, -(-self.size // page_size))
+
+    def page(self, page, page_size):
+        """
+        Returns the entries on page number `page`, counting from 1, as a list of
+        (position, entry) where the front of the queue is at position 1
+        """
+        start = (page - 1) * page_size
+        if start >= self.size:
+            return []
+        block_index, position = self._locate(start)
+        entries = itertools.chain(
+            self.blocks[block_index][position:],
+            itertools.chain.from_iterable(self.blocks[block_index + 1 :]),
+        )
+        return list(enumerate(itertools.islice(entries, page_size), start + 1))
@@ -0,0 +1,233 @@
+"""
+Counters and histograms for the hot paths of the bot, served in the Prometheus text
+format over HTTP.
+"""
+# pylint: disable=import-error
+
+import asyncio
+import bisect
+import functools
+import logging
+import threading
+import time
+
+from aiohttp import web
+
+
+class Metric:
+    """
+    Base class of the metric types.
+
+    A metric with label names has one child per combination of label values, which
+    is created on first use by labels(). Metrics are updated from the event loop as
+    well as from the resolver workers, so every update takes a lock. The lock is
+    uncontended nearly always, which keeps an update in the order of a microsecond.
+    """
+
+    TYPE = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *values):
+        """Returns the child metric for the given label values"""
+        assert len(values) == len(self.labelnames)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise TypeError(f"{self.TYPE} {self.name} doesn't support labels")
+
+    def _label_string(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        labels = ",".join(f'{name}="{value}"' for name, value in pairs)
+        return "{" + labels + "}"
+
+    def render(self):
+        """Returns the metric in the Prometheus text format"""
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} {self.TYPE}",
+        ]
+        children = [((), self)] if not self.labelnames else list(self._children.items())
+        for values, child in children:
+            lines.extend(child._samples(values))  # pylint: disable=protected-access
+        return "\n".join(lines)
+
+    def _samples(self, values):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """A value which only goes up"""
+
+    TYPE = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.value = 0
+
+    def _new_child(self):
+        return Counter(self.name, self.help_text, self.labelnames)
+
+    def inc(self, amount=1):
+        """Increase the counter by `amount`"""
+        with self._lock:
+            self.value += amount
+
+    def _samples(self, values):
+        yield f"{self.name}{self._label_string(values)} {self.value}"
+
+
+class Gauge(Metric):
+    """A value which is read from a function whenever the metrics are rendered"""
+
+    TYPE = "gauge"
+
+    def __init__(self, name, help_text, func):
+        super().__init__(name, help_text)
+        self.func = func
+
+    def _samples(self, values):
+        try:
+            value = self.func()
+        except Exception as err:  # pylint: disable=broad-except
+            logging.warning("Unable to read gauge %s: %s", self.name, err)
+            return
+        yield f"{self.name}{self._label_string(values)} {value}"
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, counted in buckets. Used for durations in
+    seconds.
+    """
+
+    TYPE = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.sum = 0
+
+    def _new_child(self):
+        return Histogram(self.name, self.help_text, self.labelnames, self.buckets)
+
+    def observe(self, value):
+        """Count a value"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @property
+    def count(self):
+        """Number of observed values"""
+        return sum(self.counts)
+
+    def _samples(self, values):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += count
+            labels = self._label_string(values, [("le", bound)])
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        yield f"{self.name}_sum{self._label_string(values)} {total}"
+        yield f"{self.name}_count{self._label_string(values)} {cumulative}"
+
+
+def timed(histogram):
+    """
+    Decorator observing the duration of each call of a function or coroutine
+    function in `histogram`
+    """
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class Registry:
+    """
+    Collection of metrics, rendered together. Registering a metric with the name of
+    an existing one replaces it.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        """Add a metric and return it"""
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        """Create and register a Counter"""
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, func):
+        """Create and register a Gauge reading its value from func()"""
+        return self.register(Gauge(name, help_text, func))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=None):
+        """Create and register a Histogram"""
+        buckets = buckets or Histogram.DEFAULT_BUCKETS
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self):
+        """Returns every metric in the Prometheus text format"""
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+    async def start_server(self, port, host="127.0.0.1"):
+        """
+        Serve the metrics on http://host:port/metrics. Only listens locally by
+        default. Returns the aiohttp AppRunner, call its cleanup() to stop.
+        """
+
+        async def handle(_request):
+            return web.Response(text=self.render())
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logging.info("Serving metrics on http://%s:%d/metrics", host, port)
+        return runner
+
+
+REGISTRY = Registry()
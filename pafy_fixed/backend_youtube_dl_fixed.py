@@ -6,6 +6,8 @@ import time
 import logging
 import os
 import subprocess
+import threading
+import contextlib
 
 if sys.version_info[:2] >= (3, 0):
     # pylint: disable=E0611,F0401,I0011
@@ -18,26 +20,111 @@ import youtube_dl
 import pafy.g as g
 from pafy.backend_shared import BasePafy, BaseStream, remux, get_status_string, get_size_done
 
-from pafy.backend_youtube_dl import YtdlPafy
+from pafy.backend_youtube_dl import YtdlPafy, YtdlStream
+
+
+class YdlPool:
+    """
+    Pool of long-lived YoutubeDL instances, one set per distinct options dict.
+
+    Creating a YoutubeDL sets up its extractor registry, cookie jar and URL
+    opener, and the YouTube extractor caches the signature functions of the
+    player per instance. Reusing instances keeps all of that across lookups.
+    YoutubeDL isn't thread-safe, so an instance is only used by the thread which
+    checked it out. The pool holds at most as many instances as were ever in use
+    at the same time, i.e. the number of resolver workers.
+
+    Note that youtube-dl fetches pages with urllib, which closes the connection
+    after each request, so HTTP connections are not kept alive between lookups.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = {}  # options key -> list of idle YoutubeDL instances
+        self.created = 0
+
+    @staticmethod
+    def _key(ydl_opts):
+        return repr(sorted(ydl_opts.items()))
+
+    @contextlib.contextmanager
+    def checkout(self, ydl_opts):
+        """ Context manager lending a YoutubeDL created with ydl_opts. """
+        key = self._key(ydl_opts)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            ydl = idle.pop() if idle else None
+        if ydl is None:
+            ydl = youtube_dl.YoutubeDL(dict(ydl_opts))
+            with self._lock:
+                self.created += 1
+        try:
+            yield ydl
+        finally:
+            with self._lock:
+                idle.append(ydl)
+
+
+ydl_pool = YdlPool()
+
+# Options of the playback-only profile. No thumbnails or subtitles are written,
+# multi-camera videos aren't expanded and the DASH manifest, an extra request which
+# only adds video formats for most videos, isn't fetched.
+PLAYBACK_YDL_OPTS = {
+    'skip_download': True,
+    'writethumbnail': False,
+    'writesubtitles': False,
+    'writeautomaticsub': False,
+    'noplaylist': True,
+    'youtube_include_dash_manifest': False,
+}
+
+# The keys of a format which YtdlStream reads
+STREAM_KEYS = ('format_id', 'acodec', 'vcodec', 'format_note', 'abr', 'height',
+               'width', 'ext', 'url', 'filesize')
+
 
 class YtdlPafyFixed(YtdlPafy):
     """
     Modified version of pafy.backend_youtube_dl.YtdlPafy
+
+    With playback_only, only the id, title, duration and audio formats of the
+    video are kept. youtube-dl parses the whole watch page in one go either way,
+    but the result isn't post-processed (format selection, thumbnail sorting,
+    subtitle listing), and the raw info dictionary, which is dominated by the
+    formats and caption tracks, is dropped once parsed. The other attributes,
+    like rating, likes and thumbnails, are None then.
     """
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, playback_only=False, **kwargs):
+        self.playback_only = playback_only
+        self._formats = None
         super(YtdlPafyFixed, self).__init__(*args, **kwargs)
 
+    def _extract_info(self):
+        """ Returns the info dictionary of the video from youtube-dl. """
+        ydl_opts = self._ydl_opts
+        if self.playback_only:
+            ydl_opts = dict(ydl_opts, **PLAYBACK_YDL_OPTS)
+        with ydl_pool.checkout(ydl_opts) as ydl:
+            try:
+                info = ydl.extract_info(self.videoid, download=False,
+                                        process=not self.playback_only)
+                if info.get('_type', 'video') != 'video':
+                    info = ydl.process_ie_result(info, download=False)
+                return info
+            # Turn into an IOError since that is what pafy previously raised
+            except youtube_dl.utils.DownloadError as e:
+                raise IOError(str(e).replace('YouTube said', 'Youtube says'))
+
     def _fetch_basic(self):
         """ Fetch basic data and streams. """
         if self._have_basic:
             return
 
-        with youtube_dl.YoutubeDL(self._ydl_opts) as ydl:
-            try:
-                self._ydl_info = ydl.extract_info(self.videoid, download=False)
-            # Turn into an IOError since that is what pafy previously raised
-            except youtube_dl.utils.DownloadError as e:
-                raise IOError(str(e).replace('YouTube said', 'Youtube says'))
+        if self.playback_only:
+            self._fetch_playback()
+            return
+
+        self._ydl_info = self._extract_info()
 
         if self.callback:
             self.callback("Fetched video info")
@@ -58,3 +145,35 @@ class YtdlPafyFixed(YtdlPafy):
         self.expiry = time.time() + g.lifespan
 
         self._have_basic = True
+
+    def _fetch_playback(self):
+        """ Fetch what is needed to play the video, and nothing else. """
+        info = self._extract_info()
+
+        if self.callback:
+            self.callback("Fetched video info")
+
+        self._title = info['title']
+        self._length = info['duration']
+        self._formats = [
+            {key: fmt[key] for key in STREAM_KEYS if key in fmt}
+            for fmt in info.get('formats') or ()
+            if fmt.get('acodec') != 'none' and fmt.get('vcodec') == 'none'
+        ]
+        self.expiry = time.time() + g.lifespan
+
+        self._have_basic = True
+
+    def _process_streams(self):
+        """ Create Stream object lists from internal stream maps. """
+        if not self.playback_only:
+            super(YtdlPafyFixed, self)._process_streams()
+            return
+
+        if not self._have_basic:
+            self._fetch_basic()
+
+        self._audiostreams = [YtdlStream(fmt, self) for fmt in self._formats]
+        self._allstreams = list(self._audiostreams)
+        self._m4astreams = [i for i in self._audiostreams if i.extension == 'm4a']
+        self._oggstreams = [i for i in self._audiostreams if i.extension == 'ogg']
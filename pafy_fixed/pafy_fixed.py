@@ -2,13 +2,17 @@
 # fmt: off
 
 from pafy.pafy import *
+from pafy.backend_shared import extract_video_id
 
 Pafy = None
 
 def new(url, basic=True, gdata=False, size=False,
-        callback=None, ydl_opts=None):
+        callback=None, ydl_opts=None, playback_only=False):
     """
     Modified version of pafy.new()
+
+    With playback_only, only what is needed to play the video is fetched and
+    kept: its id, title, duration and audio streams.
     """
     global Pafy
     if Pafy is None:
@@ -18,4 +22,7 @@ def new(url, basic=True, gdata=False, size=False,
             # changed this line
            from pafy_fixed.backend_youtube_dl_fixed import YtdlPafyFixed as Pafy
 
-    return Pafy(url, basic, gdata, size, callback, ydl_opts=ydl_opts)
+    if backend == "internal":
+        return Pafy(url, basic, gdata, size, callback, ydl_opts=ydl_opts)
+    return Pafy(url, basic, gdata, size, callback, ydl_opts=ydl_opts,
+                playback_only=playback_only)
@@ -0,0 +1,134 @@
+"""
+Prepares the next songs in the queue while the current one is playing.
+"""
+
+import asyncio
+import logging
+
+
+class Prefetcher:
+    """
+    Resolves the audio streams of the first `depth` entries in a queue ahead of time.
+
+    Optionally the audio source of the first entry is created ahead of time as well,
+    which starts its FFmpeg process so that it is ready once the current song ends.
+    Entries are identified by the queue entries themselves, so a song which is
+    queued twice is prefetched twice.
+    """
+
+    DEFAULT_DEPTH = 1
+    # Seconds before the current song ends that the next audio source is created.
+    # FFmpeg can't be started much earlier, as YouTube drops idle connections.
+    WARM_AHEAD_SECONDS = 10
+
+    def __init__(self, loop, resolve, create_source=None, depth=DEFAULT_DEPTH):
+        """
+        Arguments:
+          loop: The asyncio event loop to run prefetches in.
+          resolve: Coroutine function taking a queue entry and returning its audio
+            stream, or None if it couldn't be resolved.
+          create_source: Function creating an audio source from an audio stream. If
+            given, the source for the first entry is created ahead of time.
+          depth: Number of queue entries to prefetch.
+        """
+        self.loop = loop
+        self.resolve = resolve
+        self.create_source = create_source
+        self.depth = depth
+        self.prefetched = {}  # id(item) -> (item, stream task, warm task or None)
+
+    def schedule(self, upcoming, warm_delay=0):
+        """
+        Make sure the first `depth` items of `upcoming` are being prefetched, and
+        drop everything else which was prefetched before.
+
+        Arguments:
+          upcoming: The next entries in the queue.
+          warm_delay: Seconds to wait before creating the audio source of the first
+            item, e.g. until shortly before the current song ends.
+        """
+        upcoming = list(upcoming)[: self.depth]
+        wanted = {id(item) for item in upcoming}
+        for key in list(self.prefetched):
+            if key not in wanted:
+                self._discard(key)
+
+        for position, item in enumerate(upcoming):
+            _, stream_task, warm_task = self.prefetched.get(
+                id(item), (None, None, None)
+            )
+            if stream_task is None:
+                stream_task = self.loop.create_task(self.resolve(item))
+            if position > 0 and warm_task is not None:
+                # Only the first entry is warmed up, e.g. when playnext pushed
+                # this one back
+                self._drop_source(warm_task)
+                warm_task = None
+            elif position == 0 and warm_task is None and self.create_source:
+                warm_task = self.loop.create_task(
+                    self._warm(item, stream_task, warm_delay)
+                )
+            self.prefetched[id(item)] = (item, stream_task, warm_task)
+
+    async def _warm(self, item, stream_task, warm_delay):
+        await asyncio.sleep(warm_delay)
+        audio_stream = await stream_task
+        if audio_stream is None:
+            return None
+        logging.info("Warming up audio source for '%s'", item.title)
+        return self.create_source(audio_stream)
+
+    async def take(self, item):
+        """
+        Returns (audio_stream, audio_source) prepared for `item`. The audio source
+        is None if it wasn't created ahead of time. Waits for the stream if it is
+        still being resolved. Returns None if `item` wasn't prefetched, or if
+        resolving it failed.
+        """
+        if id(item) not in self.prefetched:
+            return None
+        _, stream_task, warm_task = self.prefetched.pop(id(item))
+
+        audio_source = None
+        if warm_task is not None:
+            if (
+                warm_task.done()
+                and not warm_task.cancelled()
+                and warm_task.exception() is None
+            ):
+                audio_source = warm_task.result()
+            else:
+                # Not warmed up yet, no point in waiting for it
+                warm_task.cancel()
+
+        try:
+            audio_stream = await stream_task
+        except asyncio.CancelledError:
+            return None
+        except Exception as err:  # pylint: disable=broad-except
+            # Resolved again by the caller, which handles the failure
+            logging.warning("Prefetching '%s' failed: %s", item.title, err)
+            return None
+        return audio_stream, audio_source
+
+    def _discard(self, key):
+        _, stream_task, warm_task = self.prefetched.pop(key)
+        stream_task.cancel()
+        if warm_task is not None:
+            self._drop_source(warm_task)
+
+    @staticmethod
+    def _drop_source(warm_task):
+        if not warm_task.done():
+            warm_task.cancel()
+        elif (
+            not warm_task.cancelled()
+            and warm_task.exception() is None
+            and warm_task.result() is not None
+        ):
+            warm_task.result().cleanup()
+
+    def invalidate(self):
+        """Drop everything prefetched, e.g. when the queue is cleared"""
+        for key in list(self.prefetched):
+            self._discard(key)
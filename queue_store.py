@@ -0,0 +1,115 @@
+"""
+Stores the queues of guilds on disk, so they survive restarts of the bot.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+
+from media_queue import QueueEntry
+
+
+class QueueStore:
+    """
+    SQLite database holding the queue of each guild, along with the voice channel
+    the bot was playing in.
+
+    Only the compact queue entries are stored; streams are resolved again once the
+    songs play. save() writes the changes of any number of guilds in a single
+    transaction, so a burst of queue changes costs one commit rather than one per
+    change. The database is in WAL mode, so that the processes of a sharded bot can
+    share it.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS queues (
+                guild_id INTEGER PRIMARY KEY,
+                voice_channel_id INTEGER,
+                saved REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                guild_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                video_id TEXT NOT NULL,
+                title TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                requester_id INTEGER,
+                channel_id INTEGER,
+                PRIMARY KEY (guild_id, position)
+            );
+            """
+        )
+
+    def save(self, snapshots):
+        """
+        Replace the stored queues of the guilds in `snapshots`.
+
+        Arguments:
+          snapshots: Dictionary of guild id -> (voice channel id, entries), where
+            the voice channel id is None if the bot wasn't in a voice channel. A
+            snapshot of None, or one without entries, removes the guild's queue.
+        """
+        if not snapshots:
+            return
+        now = time.time()
+        with self._lock, self._db:
+            for guild_id, snapshot in snapshots.items():
+                self._db.execute("DELETE FROM queues WHERE guild_id = ?", (guild_id,))
+                self._db.execute("DELETE FROM entries WHERE guild_id = ?", (guild_id,))
+                if snapshot is None or not snapshot[1]:
+                    continue
+                voice_channel_id, entries = snapshot
+                self._db.execute(
+                    "INSERT INTO queues VALUES (?, ?, ?)",
+                    (guild_id, voice_channel_id, now),
+                )
+                self._db.executemany(
+                    "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (
+                            guild_id,
+                            position,
+                            entry.videoid,
+                            entry.title,
+                            entry.length,
+                            entry.requester_id,
+                            entry.channel_id,
+                        )
+                        for position, entry in enumerate(entries)
+                    ),
+                )
+        logging.debug("Saved the queues of %d guilds", len(snapshots))
+
+    def load(self):
+        """
+        Returns a dictionary of guild id -> (voice channel id, entries) of every
+        stored queue
+        """
+        with self._lock:
+            queues = {
+                guild_id: (voice_channel_id, [])
+                for guild_id, voice_channel_id in self._db.execute(
+                    "SELECT guild_id, voice_channel_id FROM queues"
+                )
+            }
+            rows = self._db.execute(
+                "SELECT guild_id, video_id, title, length, requester_id, channel_id "
+                "FROM entries ORDER BY guild_id, position"
+            ).fetchall()
+        for guild_id, *entry in rows:
+            if guild_id in queues:
+                queues[guild_id][1].append(QueueEntry(*entry))
+        return queues
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,235 @@
+"""
+Runs blocking media lookups (youtube-dl, YouTube search, Spotify) off the event loop.
+"""
+# pylint: disable=import-error
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import threading
+
+
+class MediaResolver:
+    """
+    Bounded pool of worker threads for blocking metadata lookups.
+
+    A single resolver is shared by every guild served by a dispatcher, so a slow
+    lookup only ever occupies one worker instead of the whole event loop.
+    """
+
+    DEFAULT_WORKERS = 8
+    DEFAULT_TIMEOUT_SECONDS = 30
+    DEFAULT_CONCURRENCY = 8
+    DEFAULT_GUILD_LIMIT = 4
+
+    def __init__(
+        self, loop, max_workers=None, timeout=None, concurrency=None, guild_limit=None
+    ):
+        """
+        Arguments:
+          loop: The asyncio event loop the results are delivered to.
+          max_workers: Number of worker threads. Defaults to DEFAULT_WORKERS.
+          timeout: Default number of seconds to wait for a single lookup. None
+            means DEFAULT_TIMEOUT_SECONDS, 0 disables the timeout.
+          concurrency: Number of lookups a single map_ordered() keeps in flight.
+            Defaults to DEFAULT_CONCURRENCY.
+          guild_limit: Maximum number of workers a single guild may occupy with
+            map_ordered() lookups at once. Defaults to DEFAULT_GUILD_LIMIT.
+        """
+        self.loop = loop
+        self.max_workers = max_workers or self.DEFAULT_WORKERS
+        if timeout is None:
+            timeout = self.DEFAULT_TIMEOUT_SECONDS
+        self.timeout = timeout or None
+        self.concurrency = concurrency or self.DEFAULT_CONCURRENCY
+        self.guild_limit = guild_limit or self.DEFAULT_GUILD_LIMIT
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="resolver"
+        )
+        # Identical lookups running at the same time, in any guild, share one call
+        self.single_flight = SingleFlight(timeout=self.timeout)
+
+    async def run(self, func, *args, timeout=None):
+        """
+        Run func(*args) on a worker thread and return its result.
+
+        Raises asyncio.TimeoutError if the call takes longer than `timeout`
+        seconds (or the resolver's default timeout). The worker keeps running
+        the call to completion in the background, but nobody waits for it.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        future = self.loop.run_in_executor(
+            self.executor, functools.partial(func, *args)
+        )
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            logging.warning(
+                "Lookup %s%s timed out after %s seconds",
+                getattr(func, "__name__", func),
+                args,
+                timeout,
+            )
+            raise
+
+    def guild_limiter(self):
+        """
+        Create the semaphore a guild passes to map_ordered() so that it never holds
+        more than `guild_limit` workers, however many playlists it is loading.
+        """
+        return asyncio.Semaphore(self.guild_limit)
+
+    def map_ordered(self, func, items, limiter=None):
+        """
+        Run func(item) for every item with up to `concurrency` lookups in flight.
+
+        Returns an OrderedResolution, which yields the results in the order of
+        `items`. Lookups which time out yield None. `items` may be an iterable or an
+        async iterable.
+        """
+        return OrderedResolution(self, func, items, self.concurrency, limiter)
+
+    def shutdown(self):
+        """Stop accepting new lookups and release the worker threads"""
+        self.executor.shutdown(wait=False)
+
+
+class SingleFlight:
+    """
+    Coalesces identical blocking calls which run at the same time.
+
+    The first caller of run() for a key makes the call, and everyone else asking
+    for the same key while it is in flight waits for it and gets the same result,
+    or the same exception. Nothing is cached once the call has finished, that is
+    left to the caches of the callers. Meant for the resolver workers, so waiting
+    blocks the calling thread, for at most `timeout` seconds if given.
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> concurrent.futures.Future of the call in flight
+        self.coalesced = 0  # Number of calls which were shared rather than made
+
+    def run(self, key, func, *args):
+        """
+        Return func(*args), sharing the call with others running for key. Raises
+        concurrent.futures.TimeoutError if the shared call takes longer than the
+        timeout, so a hanging call doesn't hold on to the threads of its waiters.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = concurrent.futures.Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result(timeout=self.timeout)
+
+        try:
+            result = func(*args)
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+        future.set_result(result)
+        return result
+
+
+class OrderedResolution:
+    """
+    Async iterator resolving a sequence of items concurrently, in order.
+
+    At most `window` items are being looked up at any time. The lookups are started
+    as soon as the iterator is created, and a new one is started whenever a result
+    is handed out, so the consumer only ever waits for the head of the window.
+
+    `items` may be an async iterable, e.g. pages of a playlist which are still being
+    fetched. Items are then looked up as soon as they arrive.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, resolver, func, items, window, limiter=None):
+        self.resolver = resolver
+        self.func = func
+        self.window = max(1, window)
+        self.limiter = limiter
+        self.slots = asyncio.Semaphore(self.window)
+        self.pending = asyncio.Queue()  # Lookup tasks, None once items run out
+        self.error = None
+        self.cancelled = False
+        self.feeder = resolver.loop.create_task(self._feed(items))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.cancelled:
+            raise StopAsyncIteration
+        task = await self.pending.get()
+        if task is None:
+            # Leave the marker for any further calls
+            self.pending.put_nowait(None)
+            if self.error is not None:
+                raise self.error
+            raise StopAsyncIteration
+        try:
+            return await task
+        finally:
+            self.slots.release()
+
+    async def _feed(self, items):
+        try:
+            if hasattr(items, "__aiter__"):
+                async for item in items:
+                    await self._start(item)
+            else:
+                for item in items:
+                    await self._start(item)
+        except Exception as error:  # pylint: disable=broad-except
+            # Handed to the consumer once the items before it are resolved
+            self.error = error
+        finally:
+            self.pending.put_nowait(None)
+
+    async def _start(self, item):
+        await self.slots.acquire()
+        self.pending.put_nowait(self.resolver.loop.create_task(self._resolve(item)))
+
+    async def _resolve(self, item):
+        if self.limiter is None:
+            return await self._run(item)
+        async with self.limiter:
+            return await self._run(item)
+
+    async def _run(self, item):
+        try:
+            return await self.resolver.run(self.func, item)
+        except asyncio.TimeoutError:
+            return None
+        except Exception as err:  # pylint: disable=broad-except
+            # One broken item shouldn't take the rest of the playlist down with it
+            logging.warning("Lookup of %s failed: %s", item, err)
+            return None
+
+    def cancel(self):
+        """Stop resolving, e.g. when the user cancels adding a playlist"""
+        self.cancelled = True
+        self.feeder.cancel()
+        while not self.pending.empty():
+            task = self.pending.get_nowait()
+            if task is None:
+                continue
+            if task.done() and not task.cancelled():
+                # Nobody is going to look at this result, retrieve the exception so
+                # asyncio doesn't complain about it
+                task.exception()
+            task.cancel()
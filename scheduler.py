@@ -0,0 +1,84 @@
+"""
+Schedules idle timeouts for many guilds with a single timer.
+"""
+
+import heapq
+import itertools
+
+
+class IdleScheduler:
+    """
+    Runs a callback for a key once its deadline has passed.
+
+    Each key has at most one deadline, and scheduling a key again replaces its
+    deadline. The deadlines are kept in a heap and only one timer, for the earliest
+    deadline, is armed on the event loop. Replaced deadlines are left in the heap
+    and skipped once they come up, so rescheduling is O(log n) and never wakes the
+    loop up on its own.
+    """
+
+    # Rebuild the heap once stale entries outnumber live ones by this factor
+    COMPACT_FACTOR = 2
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.deadlines = {}  # key -> (deadline, callback)
+        self.heap = []  # (deadline, sequence number, key)
+        self.counter = itertools.count()
+        self.timer = None
+        self.timer_deadline = None
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def schedule(self, key, delay, callback):
+        """
+        Run the coroutine function `callback` in `delay` seconds, unless `key` is
+        scheduled again or cancelled before then.
+        """
+        deadline = self.loop.time() + delay
+        self.deadlines[key] = (deadline, callback)
+        heapq.heappush(self.heap, (deadline, next(self.counter), key))
+        if len(self.heap) > self.COMPACT_FACTOR * len(self.deadlines) + 64:
+            self._compact()
+        if self.timer_deadline is None or deadline < self.timer_deadline:
+            self._arm(deadline)
+
+    def cancel(self, key):
+        """Forget the deadline of `key`, if any"""
+        self.deadlines.pop(key, None)
+
+    def _compact(self):
+        self.heap = [
+            (deadline, next(self.counter), key)
+            for key, (deadline, _) in self.deadlines.items()
+        ]
+        heapq.heapify(self.heap)
+
+    def _arm(self, deadline):
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = self.loop.call_at(deadline, self._fire)
+        self.timer_deadline = deadline
+
+    def _fire(self):
+        self.timer = None
+        self.timer_deadline = None
+        now = self.loop.time()
+        while self.heap and self.heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(self.heap)
+            current = self.deadlines.get(key)
+            if current is None or current[0] != deadline:
+                # Rescheduled or cancelled since
+                continue
+            del self.deadlines[key]
+            self.loop.create_task(current[1]())
+
+        # Drop stale entries so that the timer is armed for a live deadline
+        while self.heap:
+            deadline, _, key = self.heap[0]
+            current = self.deadlines.get(key)
+            if current is not None and current[0] == deadline:
+                self._arm(deadline)
+                break
+            heapq.heappop(self.heap)
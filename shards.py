@@ -0,0 +1,147 @@
+"""
+Runs the bot as several shard processes, so a single host can use all of its cores.
+"""
+
+import logging
+import multiprocessing
+import queue
+import time
+
+
+class Shard:
+    """
+    Bookkeeping for a single shard process
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, shard_id):
+        self.shard_id = shard_id
+        self.process = None
+        self.started = None
+        self.restarts = 0
+        self.failures = 0  # Failures in a row, reset once the shard has been stable
+        self.next_start = 0
+        self.metrics = {}
+
+
+class ShardSupervisor:
+    """
+    Launches one process per shard and restarts shards which exit.
+
+    Each shard process runs `target(shard_id, shard_count, metrics_queue, *args)`.
+    Shards report their metrics by putting dictionaries on metrics_queue, and the
+    supervisor keeps the latest report of each shard.
+    """
+
+    RESTART_DELAY_SECONDS = 5
+    MAX_RESTART_DELAY_SECONDS = 300
+    # A shard which has run for this long is considered healthy again
+    STABLE_SECONDS = 600
+    POLL_INTERVAL_SECONDS = 1
+    METRICS_LOG_INTERVAL_SECONDS = 60
+
+    def __init__(self, target, shard_count, args=()):
+        assert shard_count > 0
+        self.target = target
+        self.shard_count = shard_count
+        self.args = args
+        self.metrics_queue = multiprocessing.Queue()
+        self.shards = [Shard(shard_id) for shard_id in range(shard_count)]
+        self.last_metrics_log = time.time()
+
+    def start_shard(self, shard):
+        """Start the process for a shard"""
+        shard.process = multiprocessing.Process(
+            target=self.target,
+            args=(shard.shard_id, self.shard_count, self.metrics_queue, *self.args),
+            name=f"shard-{shard.shard_id}",
+            daemon=True,
+        )
+        shard.process.start()
+        shard.started = time.time()
+        logging.info("Started shard %d (pid %d)", shard.shard_id, shard.process.pid)
+
+    def poll(self):
+        """
+        Collect metrics and restart shards which have exited. Should be called
+        periodically.
+        """
+        self.collect_metrics()
+        now = time.time()
+        for shard in self.shards:
+            if shard.process is not None and shard.process.is_alive():
+                continue
+
+            if shard.process is not None:
+                logging.error(
+                    "Shard %d exited with code %s",
+                    shard.shard_id,
+                    shard.process.exitcode,
+                )
+                if now - shard.started >= self.STABLE_SECONDS:
+                    shard.failures = 0
+                delay = min(
+                    self.RESTART_DELAY_SECONDS * 2 ** shard.failures,
+                    self.MAX_RESTART_DELAY_SECONDS,
+                )
+                shard.failures += 1
+                shard.restarts += 1
+                shard.process = None
+                shard.next_start = now + delay
+                logging.info("Restarting shard %d in %d seconds", shard.shard_id, delay)
+
+            if now >= shard.next_start:
+                self.start_shard(shard)
+
+    def collect_metrics(self):
+        """Store the metrics reported by the shards since the last call"""
+        while True:
+            try:
+                report = self.metrics_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.shards[report["shard_id"]].metrics = report
+
+        if time.time() - self.last_metrics_log >= self.METRICS_LOG_INTERVAL_SECONDS:
+            self.last_metrics_log = time.time()
+            for shard_id, metrics in self.metrics().items():
+                logging.info("Shard %d: %s", shard_id, metrics)
+
+    def metrics(self):
+        """
+        Returns a dictionary of shard id -> metrics for every shard. Contains the
+        latest metrics reported by the shard as well as the supervisor's own.
+        """
+        now = time.time()
+        result = {}
+        for shard in self.shards:
+            alive = shard.process is not None and shard.process.is_alive()
+            result[shard.shard_id] = {
+                **shard.metrics,
+                "alive": alive,
+                "restarts": shard.restarts,
+                "uptime": now - shard.started if alive else 0,
+            }
+        return result
+
+    def stop(self):
+        """Terminate all shard processes"""
+        for shard in self.shards:
+            if shard.process is not None and shard.process.is_alive():
+                shard.process.terminate()
+        for shard in self.shards:
+            if shard.process is not None:
+                shard.process.join()
+
+    def run(self):
+        """Run the shards until interrupted"""
+        logging.info("Starting %d shards", self.shard_count)
+        try:
+            while True:
+                self.poll()
+                time.sleep(self.POLL_INTERVAL_SECONDS)
+        except KeyboardInterrupt:
+            logging.info("Stopping shards")
+        finally:
+            self.stop()
@@ -0,0 +1,120 @@
+"""
+Fetches the tracks behind Spotify links, following the pagination of the Web API.
+"""
+# pylint: disable=import-error
+
+import logging
+
+from lazy import LazyModule
+
+spotipy = LazyModule("spotipy")
+requests = LazyModule("requests")
+
+
+class SpotifyIngest:
+    """
+    Lists the tracks of a Spotify track, album or playlist.
+
+    Albums and playlists are read with the largest page size the API allows. The
+    first page tells how many tracks there are, after which the remaining pages are
+    fetched concurrently on the resolver and handed out in order as they arrive.
+    Tracks are trimmed down to what the bot uses: the name, the first artist and the
+    duration.
+    """
+
+    PLAYLIST_PAGE_SIZE = 100
+    ALBUM_PAGE_SIZE = 50
+    # The album tracks endpoint doesn't support a fields filter
+    PLAYLIST_FIELDS = "total,items(track(name,duration_ms,artists(name)))"
+
+    def __init__(self, spotify, kind, url):
+        """
+        Arguments:
+          spotify: The spotipy client.
+          kind: What the url points to, "track", "album" or "playlist".
+          url: Spotify URL, URI or id.
+        """
+        assert kind in ("track", "album", "playlist")
+        self.spotify = spotify
+        self.kind = kind
+        self.url = url
+        self.total = None
+
+    @property
+    def page_size(self):
+        """Number of tracks fetched per request"""
+        if self.kind == "playlist":
+            return self.PLAYLIST_PAGE_SIZE
+        return self.ALBUM_PAGE_SIZE
+
+    @staticmethod
+    def compact(track):
+        """Keep only the fields of a track which the bot uses"""
+        return {
+            "name": track["name"],
+            "artists": track["artists"][:1],
+            "duration_ms": track.get("duration_ms"),
+        }
+
+    def first_page(self):
+        """
+        Fetch the first page of tracks and the total number of tracks. Blocking, so
+        call it from a worker.
+        """
+        if self.kind == "track":
+            self.total = 1
+            return [self.compact(self.spotify.track(self.url))]
+
+        page = self._request(0)
+        self.total = page["total"]
+        return self._tracks(page)
+
+    def fetch_page(self, offset):
+        """
+        Fetch the page of tracks starting at `offset`. Returns None if the request
+        fails. Blocking, so call it from a worker.
+        """
+        try:
+            return self._tracks(self._request(offset))
+        except (
+            spotipy.SpotifyException,
+            requests.exceptions.RequestException,
+        ) as err:
+            logging.error("Failed to fetch Spotify page at %d: %s", offset, err)
+            return None
+
+    def _request(self, offset):
+        if self.kind == "playlist":
+            return self.spotify.playlist_items(
+                self.url,
+                fields=self.PLAYLIST_FIELDS,
+                limit=self.PLAYLIST_PAGE_SIZE,
+                offset=offset,
+                additional_types=("track",),
+            )
+        return self.spotify.album_tracks(
+            self.url, limit=self.ALBUM_PAGE_SIZE, offset=offset
+        )
+
+    def _tracks(self, page):
+        items = page["items"]
+        if self.kind == "playlist":
+            # Removed tracks and podcast episodes come back without a track
+            items = [item["track"] for item in items if item.get("track")]
+        return [self.compact(track) for track in items]
+
+    async def pages(self, resolver):
+        """
+        Async generator yielding the pages after the first one, in order. The pages
+        are fetched concurrently on `resolver`. Call first_page() first.
+        """
+        offsets = range(self.page_size, self.total or 0, self.page_size)
+        resolution = resolver.map_ordered(self.fetch_page, offsets)
+        try:
+            async for page in resolution:
+                if page is None:
+                    logging.warning("Skipping Spotify page of %s", self.url)
+                    continue
+                yield page
+        finally:
+            resolution.cancel()
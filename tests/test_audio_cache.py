@@ -0,0 +1,201 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+
+import concurrent.futures
+import os
+import pathlib
+import tempfile
+import threading
+import unittest
+
+from audio_cache import AudioFileCache  # pylint: disable=import-error
+from media_cache import AudioStream  # pylint: disable=import-error
+
+
+class ImmediateExecutor(concurrent.futures.Executor):
+    """Executor running every function right away, on the calling thread"""
+
+    def submit(self, fn, *args, **kwargs):  # pylint: disable=arguments-differ
+        future = concurrent.futures.Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+class AudioFileCacheTest(unittest.TestCase):
+    """AudioFileCache test suite"""
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.tmpdir_ = tempfile.TemporaryDirectory()
+        self.directory_ = os.path.join(self.tmpdir_.name, "audio")
+        self.streams_ = {}
+
+    def tearDown(self):
+        self.tmpdir_.cleanup()
+
+    def create_stream(self, video_id, size=100, codec="opus"):
+        """An AudioStream of `size` bytes, served from a file URL"""
+        path = pathlib.Path(self.tmpdir_.name, video_id + ".stream")
+        path.write_bytes(video_id.encode()[-1:] * size)
+        self.streams_[video_id] = AudioStream(path.as_uri(), codec)
+        return self.streams_[video_id]
+
+    def create_cache(self, **kwargs):
+        return AudioFileCache(self.directory_, executor=ImmediateExecutor(), **kwargs)
+
+    def play(self, cache, video_id, times=1):
+        for _ in range(times):
+            cache.played(video_id, self.streams_[video_id])
+
+    def test_cached_after_min_plays(self):
+        cache = self.create_cache(min_plays=2)
+        self.create_stream("xxxxxxxxxx1")
+
+        self.play(cache, "xxxxxxxxxx1")
+        self.assertIsNone(cache.get("xxxxxxxxxx1"))
+        self.play(cache, "xxxxxxxxxx1")
+        audio_stream = cache.get("xxxxxxxxxx1")
+
+        self.assertEqual(audio_stream, AudioStream(cache.path("xxxxxxxxxx1"), "opus"))
+        self.assertEqual(pathlib.Path(audio_stream.url).read_bytes(), b"1" * 100)
+        self.assertEqual((cache.size, cache.downloads), (100, 1))
+        self.assertEqual(os.listdir(self.directory_), ["xxxxxxxxxx1.webm"])
+
+    def test_only_opus_streams_are_cached(self):
+        cache = self.create_cache(min_plays=1)
+        self.create_stream("xxxxxxxxxx1", codec=None)
+
+        self.play(cache, "xxxxxxxxxx1", times=3)
+
+        self.assertIsNone(cache.get("xxxxxxxxxx1"))
+
+    def test_least_played_file_is_evicted(self):
+        cache = self.create_cache(min_plays=1, max_bytes=250)
+        for video_id in ("xxxxxxxxxx1", "xxxxxxxxxx2", "xxxxxxxxxx3"):
+            self.create_stream(video_id)
+        self.play(cache, "xxxxxxxxxx1", times=3)
+        self.play(cache, "xxxxxxxxxx2")
+
+        self.play(cache, "xxxxxxxxxx3")
+
+        self.assertIsNotNone(cache.get("xxxxxxxxxx1"))
+        self.assertIsNone(cache.get("xxxxxxxxxx2"))
+        self.assertIsNotNone(cache.get("xxxxxxxxxx3"))
+        self.assertEqual(cache.size, 200)
+        self.assertFalse(os.path.exists(cache.path("xxxxxxxxxx2")))
+
+    def test_least_recently_played_is_evicted_on_ties(self):
+        cache = self.create_cache(min_plays=1, max_bytes=250)
+        for video_id in ("xxxxxxxxxx1", "xxxxxxxxxx2", "xxxxxxxxxx3"):
+            self.create_stream(video_id)
+        self.play(cache, "xxxxxxxxxx1")
+        self.play(cache, "xxxxxxxxxx2")
+        cache.get("xxxxxxxxxx1")
+
+        self.play(cache, "xxxxxxxxxx3")
+
+        self.assertIsNotNone(cache.get("xxxxxxxxxx1"))
+        self.assertIsNone(cache.get("xxxxxxxxxx2"))
+
+    def test_stale_popular_file_is_evicted_eventually(self):
+        cache = self.create_cache(min_plays=1, max_bytes=250)
+        self.create_stream("xxxxxxxxxx0")
+        self.play(cache, "xxxxxxxxxx0", times=3)
+
+        for index in range(1, 7):
+            self.create_stream(f"xxxxxxxxxx{index}")
+            self.play(cache, f"xxxxxxxxxx{index}")
+
+        self.assertIsNone(cache.get("xxxxxxxxxx0"))
+        self.assertIsNotNone(cache.get("xxxxxxxxxx6"))
+
+    def test_evicted_file_keeps_its_plays(self):
+        cache = self.create_cache(min_plays=2, max_bytes=150)
+        for video_id in ("xxxxxxxxxx1", "xxxxxxxxxx2"):
+            self.create_stream(video_id)
+            self.play(cache, video_id, times=2)
+        self.assertIsNone(cache.get("xxxxxxxxxx1"))
+
+        self.play(cache, "xxxxxxxxxx1")
+
+        self.assertIsNotNone(cache.get("xxxxxxxxxx1"))
+        self.assertEqual(cache.downloads, 3)
+
+    def test_pinned_file_is_not_evicted(self):
+        cache = self.create_cache(min_plays=1, max_bytes=150)
+        for video_id in ("xxxxxxxxxx1", "xxxxxxxxxx2", "xxxxxxxxxx3"):
+            self.create_stream(video_id)
+        self.play(cache, "xxxxxxxxxx1")
+        cache.pin("guild", ["xxxxxxxxxx1"])
+
+        self.play(cache, "xxxxxxxxxx2")
+        self.assertIsNotNone(cache.get("xxxxxxxxxx1"))
+        self.assertIsNone(cache.get("xxxxxxxxxx2"))
+
+        cache.pin("guild", [])
+        self.play(cache, "xxxxxxxxxx3")
+        self.assertIsNone(cache.get("xxxxxxxxxx1"))
+        self.assertIsNotNone(cache.get("xxxxxxxxxx3"))
+
+    def test_too_big_file_is_discarded(self):
+        cache = self.create_cache(min_plays=1, max_bytes=50)
+        self.create_stream("xxxxxxxxxx1")
+
+        self.play(cache, "xxxxxxxxxx1")
+
+        self.assertIsNone(cache.get("xxxxxxxxxx1"))
+        self.assertEqual(os.listdir(self.directory_), [])
+
+    def test_failed_download_leaves_no_file(self):
+        cache = self.create_cache(min_plays=1)
+        self.streams_["xxxxxxxxxx1"] = AudioStream(
+            pathlib.Path(self.tmpdir_.name, "missing").as_uri(), "opus"
+        )
+
+        self.play(cache, "xxxxxxxxxx1")
+
+        self.assertIsNone(cache.get("xxxxxxxxxx1"))
+        self.assertEqual(os.listdir(self.directory_), [])
+
+    def test_files_survive_restart(self):
+        cache = self.create_cache(min_plays=1)
+        self.create_stream("xxxxxxxxxx1")
+        self.play(cache, "xxxxxxxxxx1")
+        partial = pathlib.Path(self.directory_, "xxxxxxxxxx2abc.part")
+        partial.write_bytes(b"2" * 10)
+
+        cache = self.create_cache(min_plays=1)
+
+        self.assertIsNotNone(cache.get("xxxxxxxxxx1"))
+        self.assertEqual(cache.size, 100)
+        self.assertFalse(partial.exists())
+
+    def test_shutdown_cancels_waiting_downloads(self):
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        cache = AudioFileCache(self.directory_, min_plays=1, executor=executor)
+        for video_id in ("xxxxxxxxxx1", "xxxxxxxxxx2"):
+            self.create_stream(video_id)
+        blocker = threading.Event()
+        executor.submit(blocker.wait)
+
+        downloads = [
+            cache.played(video_id, self.streams_[video_id])
+            for video_id in ("xxxxxxxxxx1", "xxxxxxxxxx2")
+        ]
+        cache.shutdown()
+        blocker.set()
+        executor.shutdown(wait=True)
+
+        self.assertTrue(all(download.cancelled() for download in downloads))
+        self.assertEqual(cache.downloads, 0)
+
+    def test_invalid_video_id_is_not_cached(self):
+        cache = self.create_cache(min_plays=1)
+        audio_stream = self.create_stream("xxxxxxxxxx1")
+
+        self.assertIsNone(cache.played("../../x/xxxx", audio_stream))
+        self.assertEqual(os.listdir(self.directory_), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
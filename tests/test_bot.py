@@ -1,11 +1,19 @@
 # pylint: disable=missing-function-docstring
 # pylint: disable=missing-module-docstring
+# pylint: disable=too-many-public-methods
+# pylint: disable=too-many-lines
 
 from unittest import mock
 import warnings
 import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
 import bot  # pylint: disable=import-error
+import media_cache  # pylint: disable=import-error
 
 
 class MockVoiceClient:
@@ -14,7 +22,9 @@ class MockVoiceClient:
     def __init__(self):
         self.after_callback = None
         self.current_audio_source = None
+        self.paused = False
         self.guild = mock.AsyncMock()
+        self.channel = None
 
     def is_playing(self):
         return self.current_audio_source is not None
@@ -31,6 +41,12 @@ class MockVoiceClient:
             self.after_callback(None)
         self.after_callback = None
 
+    def pause(self):
+        self.paused = True
+
+    async def disconnect(self):
+        pass
+
     def finish_audio_source(self, exception=None):
         """Call this to signal that the audio source has finished"""
         if self.after_callback is not None:
@@ -42,6 +58,7 @@ def create_mock_voice_channel():
     voice_client = MockVoiceClient()
     voice_channel = mock.Mock()
     voice_channel.connect = mock.AsyncMock(return_value=voice_client)
+    voice_client.channel = voice_channel
 
     return voice_channel
 
@@ -116,28 +133,49 @@ def create_mock_track(name="Mock Track", artists="Mock Artist"):
 
 def create_mock_spotify(_self):
     spotify = mock.Mock()
-    spotify.album = mock.Mock(return_value={"tracks": {"items": [create_mock_track()]}})
-    spotify.playlist = mock.Mock(
+    spotify.album_tracks = mock.Mock(
+        return_value={"items": [create_mock_track()], "total": 1}
+    )
+    spotify.playlist_items = mock.Mock(
         return_value={
-            "tracks": {
-                "items": [
-                    {"track": create_mock_track("track1")},
-                    {"track": create_mock_track("track2")},
-                    {"track": create_mock_track("track3")},
-                ]
-            }
+            "items": [
+                {"track": create_mock_track("track1")},
+                {"track": create_mock_track("track2")},
+                {"track": create_mock_track("track3")},
+            ],
+            "total": 3,
         }
     )
     spotify.track = mock.Mock(return_value=create_mock_track())
     return spotify
 
 
-def mock_pytube_playlist(_self, _url):
-    return [
-        "https://www.youtube.com/watch?v=xxxxxxxxxx1",
-        "https://www.youtube.com/watch?v=xxxxxxxxxx2",
-        "https://www.youtube.com/watch?v=xxxxxxxxxx3",
-    ]
+class MockYouTubeIngest:
+    """
+    Stand-in for YouTubeIngest, listing a playlist of n_tracks videos in pages of
+    page_size, each taking page_delay seconds to arrive after the first one
+    """
+
+    def __init__(self, n_tracks=3, page_size=1, page_delay=0):
+        self.tracks = [
+            {"videoid": f"xxxxxxxxxx{index}", "title": f"video{index}", "length": 60}
+            for index in range(1, n_tracks + 1)
+        ]
+        self.page_size = page_size
+        self.page_delay = page_delay
+        self.total = n_tracks
+
+    def first_page(self):
+        return self.tracks[: self.page_size]
+
+    async def pages(self, _resolver):
+        for start in range(self.page_size, len(self.tracks), self.page_size):
+            await asyncio.sleep(self.page_delay)
+            yield self.tracks[start : start + self.page_size]
+
+
+def mock_youtube_ingest(_self, _url):
+    return MockYouTubeIngest()
 
 
 class MusicBotTest(unittest.IsolatedAsyncioTestCase):
@@ -153,12 +191,12 @@ class MusicBotTest(unittest.IsolatedAsyncioTestCase):
         self.guild_ = mock.Mock()
 
         bot.MusicBot.get_spotify_client = create_mock_spotify
-        bot.MusicBot.pytube_playlist = mock_pytube_playlist
+        bot.MusicBot.youtube_ingest = mock_youtube_ingest
 
         self.music_bot_ = bot.MusicBot(
             self.guild_, self.dispatcher_.loop, self.dispatcher_.user
         )
-        self.music_bot_.pafy_search = mock.Mock()
+        self.music_bot_.pafy_search = mock.Mock(return_value=mock.Mock(length=60))
         self.music_bot_.youtube_search = mock.MagicMock()
         self.mock_audio_source_ = mock.Mock()
         self.music_bot_.create_audio_source = mock.Mock(
@@ -209,6 +247,52 @@ class MusicBotTest(unittest.IsolatedAsyncioTestCase):
 
         hello_message.channel.send.assert_awaited_with(":wave: Hello! default_user")
 
+    async def test_commands_are_timed(self):
+        histogram = bot.COMMAND_SECONDS.labels("hello")
+        count = histogram.count
+
+        await self.music_bot_.handle_message(create_mock_message(contents="-hello"))
+
+        self.assertEqual(histogram.count, count + 1)
+        self.assertIn(
+            'bot_command_seconds_count{handler="hello"}', bot.metrics.REGISTRY.render()
+        )
+
+    def test_ffmpeg_processes_are_counted(self):
+        # pylint: disable=protected-access
+        running = mock.Mock()
+        running._process.poll.return_value = None
+        finished = mock.Mock()
+        finished._process.poll.return_value = 0
+
+        with mock.patch.object(bot.MusicBot, "audio_sources", [running, finished]):
+            rendered = bot.metrics.REGISTRY.render()
+
+        self.assertIn("bot_ffmpeg_processes 1", rendered.splitlines())
+
+    @async_assert_no_warnings_wrapper
+    async def test_command_table_is_shared_between_guilds(self):
+        other_bot = bot.MusicBot(
+            mock.Mock(), self.dispatcher_.loop, self.dispatcher_.user
+        )
+
+        self.assertIs(other_bot.commands, self.music_bot_.commands)
+        self.assertIs(other_bot.url_regex, self.music_bot_.url_regex)
+        handler, command_content, _ = other_bot.get_command_handler("-hello there")
+        self.assertEqual(handler, other_bot.hello)
+        self.assertEqual(command_content, "there")
+
+    @async_assert_no_warnings_wrapper
+    async def test_guarded_commands_hold_command_lock(self):
+        handler, _, _ = self.music_bot_.get_command_handler("-clear")
+        self.music_bot_.voice_client = MockVoiceClient()
+
+        async with self.music_bot_.command_lock:
+            clear = asyncio.ensure_future(handler(create_mock_message(), ""))
+            await asyncio.sleep(0.01)
+            self.assertFalse(clear.done())
+        await clear
+
     @async_assert_no_warnings_wrapper
     async def test_play_fails_when_user_not_in_voice_channel(self):
         play_message = create_mock_message(
@@ -231,7 +315,7 @@ class MusicBotTest(unittest.IsolatedAsyncioTestCase):
             ),
         )
 
-        mock_media = mock.Mock()
+        mock_media = mock.Mock(length=60)
         mock_media.title.__repr__ = lambda self: "song"
 
         self.music_bot_.pafy_search = mock.Mock(return_value=mock_media)
@@ -261,7 +345,7 @@ class MusicBotTest(unittest.IsolatedAsyncioTestCase):
         play_message1 = create_mock_message(contents="-play song1", author=author)
         play_message2 = create_mock_message(contents="-play song2", author=author)
 
-        mock_media = mock.Mock()
+        mock_media = mock.Mock(length=60)
         self.music_bot_.pafy_search = mock.Mock(return_value=mock_media)
         mock_media.title.__repr__ = lambda _: "song1"
 
@@ -286,6 +370,28 @@ class MusicBotTest(unittest.IsolatedAsyncioTestCase):
             ":notes: Now Playing :notes:\n```\nsong2\n```"
         )
 
+    async def test_song_finished_on_audio_thread_plays_next(self):
+        author = create_mock_author(
+            voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+        )
+        play_message = create_mock_message(contents="-play song1", author=author)
+        self.music_bot_.pafy_search = mock.Mock(return_value=mock.Mock(length=60))
+        await self.music_bot_.handle_message(play_message)
+        await self.music_bot_.handle_message(
+            create_mock_message(contents="-play song2", author=author)
+        )
+
+        # discord.py calls the after callback from its audio player thread
+        player = threading.Thread(
+            target=self.music_bot_.voice_client.finish_audio_source
+        )
+        player.start()
+        player.join()
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(len(self.music_bot_.media_deque), 0)
+        self.assertTrue(self.music_bot_.voice_client.is_playing())
+
     @async_assert_no_warnings_wrapper
     async def test_play_livestream_informs_user_unable_to_play(self):
         mock_author = create_mock_author(
@@ -297,6 +403,7 @@ class MusicBotTest(unittest.IsolatedAsyncioTestCase):
         mock_media = mock.Mock()
         mock_media.title.__repr__ = lambda self: "livestream"
         mock_media.duration = "00:00:00"
+        mock_media.length = 0
         self.music_bot_.pafy_search = mock.Mock(return_value=mock_media)
 
         await self.music_bot_.handle_message(play_message)
@@ -308,6 +415,261 @@ class MusicBotTest(unittest.IsolatedAsyncioTestCase):
         )
         self.music_bot_.voice_client.finish_audio_source()
 
+    @async_assert_no_warnings_wrapper
+    async def test_play_slow_lookup_times_out(self):
+        play_message = create_mock_message(
+            contents="-play slow song",
+            author=create_mock_author(
+                voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+            ),
+        )
+
+        def slow_search(_search_term):
+            time.sleep(0.2)
+            return mock.Mock()
+
+        self.music_bot_.resolver.timeout = 0.05
+        self.music_bot_.pafy_search = mock.Mock(side_effect=slow_search)
+
+        await self.music_bot_.handle_message(play_message)
+
+        play_message.channel.send.assert_awaited_with(
+            ":robot: Error getting media data :robot:"
+        )
+        self.assertEqual(len(self.music_bot_.media_deque), 0)
+
+    @async_assert_no_warnings_wrapper
+    async def test_replaying_search_term_uses_metadata_cache(self):
+        author = create_mock_author(
+            voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+        )
+        self.music_bot_.metadata_cache = media_cache.MetadataCache()
+        mock_media = mock.Mock()
+        mock_media.videoid = "xxxxxxxxxx1"
+        mock_media.title = "song"
+        mock_media.length = 60
+        self.music_bot_.pafy_search = mock.Mock(return_value=mock_media)
+        self.music_bot_.youtube_search = mock.Mock(
+            return_value={"result": [{"id": "xxxxxxxxxx1"}]}
+        )
+
+        await self.music_bot_.handle_message(
+            create_mock_message(contents="-play song", author=author)
+        )
+        play_message = create_mock_message(contents="-play  Song", author=author)
+        await self.music_bot_.handle_message(play_message)
+
+        self.music_bot_.youtube_search.assert_called_once()
+        self.music_bot_.pafy_search.assert_called_once_with("xxxxxxxxxx1")
+        play_message.channel.send.assert_awaited_with(
+            ":clipboard: Added to Queue\n```\nsong\n```"
+        )
+
+    @async_assert_no_warnings_wrapper
+    async def test_concurrent_identical_requests_share_lookups(self):
+        other_bot = bot.MusicBot(
+            mock.Mock(),
+            self.dispatcher_.loop,
+            self.dispatcher_.user,
+            resolver=self.music_bot_.resolver,
+        )
+        other_bot.create_audio_source = self.music_bot_.create_audio_source
+
+        def slow_search(_search_str):
+            time.sleep(0.1)
+            return {"result": [{"id": "xxxxxxxxxx1"}]}
+
+        def slow_pafy_search(_video_id):
+            time.sleep(0.1)
+            return mock.Mock(length=60)
+
+        messages = []
+        for music_bot, contents in (
+            (self.music_bot_, "-play Some Song"),
+            (other_bot, "-play some  song"),
+        ):
+            music_bot.youtube_search = mock.Mock(side_effect=slow_search)
+            music_bot.pafy_search = mock.Mock(side_effect=slow_pafy_search)
+            author = create_mock_author(
+                voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+            )
+            messages.append(create_mock_message(contents=contents, author=author))
+
+        await asyncio.gather(
+            self.music_bot_.handle_message(messages[0]),
+            other_bot.handle_message(messages[1]),
+        )
+
+        for lookup in ("youtube_search", "pafy_search"):
+            self.assertEqual(
+                getattr(self.music_bot_, lookup).call_count
+                + getattr(other_bot, lookup).call_count,
+                1,
+            )
+        self.assertTrue(other_bot.voice_client.is_playing())
+
+    @async_assert_no_warnings_wrapper
+    async def test_queued_song_is_prefetched_while_playing(self):
+        author = create_mock_author(
+            voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+        )
+        media1 = mock.Mock(length=60)
+        media2 = mock.Mock(length=60)
+        self.music_bot_.pafy_search = mock.Mock(side_effect=[media1, media2])
+
+        await self.music_bot_.handle_message(
+            create_mock_message(contents="-play song1", author=author)
+        )
+        await self.music_bot_.handle_message(
+            create_mock_message(contents="-play song2", author=author)
+        )
+        await asyncio.sleep(0.1)
+
+        # The second song's stream is resolved before the first one has finished
+        media2.getbestaudio.assert_called_once()
+        self.music_bot_.voice_client.finish_audio_source()
+        await asyncio.sleep(0.1)
+
+        media2.getbestaudio.assert_called_once()
+        self.music_bot_.create_audio_source.assert_called_with(
+            media2.getbestaudio.return_value.url, codec=None
+        )
+
+    def test_opus_streams_are_passed_through(self):
+        with mock.patch("bot.discord") as discord:
+            bot.MusicBot.create_audio_source(
+                self.music_bot_, "https://stream/1", codec="opus"
+            )
+            bot.MusicBot.create_audio_source(self.music_bot_, "https://stream/2")
+
+        discord.FFmpegOpusAudio.assert_called_once_with(
+            "https://stream/1", codec="opus"
+        )
+        discord.FFmpegPCMAudio.assert_called_once_with("https://stream/2")
+
+    @async_assert_no_warnings_wrapper
+    async def test_deleted_text_channel_falls_back(self):
+        author = create_mock_author(
+            voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+        )
+        await self.music_bot_.handle_message(
+            create_mock_message(contents="-play song1", author=author)
+        )
+        # Restored entry whose text channel was deleted while the bot was down
+        self.music_bot_.media_deque.append(bot.QueueEntry("song2", "song2", 60, 1, 99))
+        self.guild_.get_channel = mock.Mock(return_value=None)
+        fallback = create_mock_message().channel
+        self.guild_.text_channels = [fallback]
+
+        self.music_bot_.voice_client.finish_audio_source()
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(self.music_bot_.current_media.title, "song2")
+        fallback.send.assert_awaited_with(
+            ":notes: Now Playing :notes:\n```\nsong2\n```"
+        )
+
+        self.guild_.text_channels = []
+        self.music_bot_.media_deque.append(bot.QueueEntry("song3", "song3", 60, 1, 99))
+        self.music_bot_.voice_client.finish_audio_source()
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(self.music_bot_.current_media.title, "song3")
+
+    @async_assert_no_warnings_wrapper
+    async def test_unavailable_song_is_skipped(self):
+        author = create_mock_author(
+            voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+        )
+        medias = {
+            f"xxxxxxxxxx{index}": mock.Mock(videoid=f"xxxxxxxxxx{index}", length=60)
+            for index in range(1, 4)
+        }
+        medias["xxxxxxxxxx2"].title = "song2"
+        self.music_bot_.pafy_search = mock.Mock(side_effect=medias.get)
+        self.music_bot_.youtube_search = mock.Mock(
+            side_effect=lambda term: {"result": [{"id": f"xxxxxxxxxx{term[-1]}"}]}
+        )
+        messages = [
+            create_mock_message(contents=f"-play song{index}", author=author)
+            for index in range(1, 4)
+        ]
+        for message in messages:
+            await self.music_bot_.handle_message(message)
+        # The video is taken down while song1 is playing
+        medias["xxxxxxxxxx2"].getbestaudio.side_effect = OSError("Video unavailable")
+        self.music_bot_.stream_cache.invalidate("xxxxxxxxxx2")
+        self.music_bot_.prefetcher.invalidate()
+
+        self.music_bot_.voice_client.finish_audio_source()
+        await asyncio.sleep(0.1)
+
+        self.assertTrue(self.music_bot_.voice_client.is_playing())
+        self.assertEqual(self.music_bot_.current_media.videoid, "xxxxxxxxxx3")
+        self.assertEqual(len(self.music_bot_.media_deque), 0)
+        messages[1].channel.send.assert_any_await(
+            ":robot: Unable to play song2 :worried:"
+        )
+
+    @async_assert_no_warnings_wrapper
+    async def test_cached_audio_is_played_from_file(self):
+        author = create_mock_author(
+            voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+        )
+        media1 = mock.Mock(videoid="xxxxxxxxxx1", length=60)
+        media2 = mock.Mock(videoid="xxxxxxxxxx2", length=60)
+        self.music_bot_.pafy_search = mock.Mock(side_effect=[media1, media2])
+        self.music_bot_.youtube_search = mock.Mock(
+            side_effect=lambda term: {"result": [{"id": f"xxxxxxxxxx{term[-1]}"}]}
+        )
+        self.music_bot_.audio_cache = mock.Mock()
+        self.music_bot_.audio_cache.get.side_effect = lambda video_id: (
+            media_cache.AudioStream("/cache/xxxxxxxxxx2.webm", "opus")
+            if video_id == "xxxxxxxxxx2"
+            else None
+        )
+
+        await self.music_bot_.handle_message(
+            create_mock_message(contents="-play song1", author=author)
+        )
+        await self.music_bot_.handle_message(
+            create_mock_message(contents="-play song2", author=author)
+        )
+        self.music_bot_.voice_client.finish_audio_source()
+        await asyncio.sleep(0.1)
+
+        self.music_bot_.create_audio_source.assert_called_with(
+            "/cache/xxxxxxxxxx2.webm", codec="opus"
+        )
+        self.assertEqual(
+            [call[0][0] for call in self.music_bot_.audio_cache.played.call_args_list],
+            ["xxxxxxxxxx1", "xxxxxxxxxx2"],
+        )
+        self.music_bot_.audio_cache.pin.assert_called_with(
+            self.music_bot_, ["xxxxxxxxxx2"]
+        )
+
+    @async_assert_no_warnings_wrapper
+    async def test_pausing_schedules_single_disconnect(self):
+        play_message = create_mock_message(
+            contents="-play song",
+            author=create_mock_author(
+                voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+            ),
+        )
+        await self.music_bot_.handle_message(play_message)
+
+        with mock.patch.object(bot.MusicBot, "DISCONNECT_TIMER_SECONDS", 0.05):
+            for _ in range(5):
+                await self.music_bot_.handle_message(
+                    create_mock_message(contents="-pause", author=play_message.author)
+                )
+            self.assertEqual(len(self.music_bot_.idle_scheduler), 1)
+
+            self.music_bot_.voice_client.stop()
+            await asyncio.sleep(0.1)
+        self.assertIsNone(self.music_bot_.voice_client)
+
     async def test_playlist_youtube(self):
         url = "https://www.youtube.com/playlist?list=xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx"
         mock_author = create_mock_author(
@@ -317,6 +679,7 @@ class MusicBotTest(unittest.IsolatedAsyncioTestCase):
         mock_media = mock.Mock()
         mock_media.title = "playlist item"
         mock_media.duration = "00:01:00"
+        mock_media.length = 60
         self.music_bot_.pafy_search = mock.Mock(return_value=mock_media)
 
         await self.music_bot_.handle_message(play_message)
@@ -331,6 +694,198 @@ class MusicBotTest(unittest.IsolatedAsyncioTestCase):
             )
         )
 
+    async def test_playlist_with_unavailable_first_video(self):
+        url = "https://www.youtube.com/playlist?list=xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx"
+        mock_author = create_mock_author(
+            voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+        )
+        play_message = create_mock_message(contents=f"-play {url}", author=mock_author)
+        reply = play_message.channel.send.return_value
+        reply.edit = mock.AsyncMock()
+        self.music_bot_.youtube_ingest = mock.Mock(
+            return_value=MockYouTubeIngest(page_delay=0.05)
+        )
+
+        def pafy_search(video_id):
+            if video_id == "xxxxxxxxxx1":
+                raise OSError("Video unavailable")
+            return mock.Mock(videoid=video_id, length=60)
+
+        self.music_bot_.pafy_search = mock.Mock(side_effect=pafy_search)
+
+        await self.music_bot_.handle_message(play_message)
+        await asyncio.sleep(0.2)
+
+        self.assertTrue(self.music_bot_.voice_client.is_playing())
+        self.assertEqual(self.music_bot_.current_media.title, "video2")
+        play_message.channel.send.assert_any_await(
+            ":robot: Unable to play video1 :worried:"
+        )
+        self.assertIn("Added 3 of 3 songs", reply.edit.await_args[1]["content"])
+
+    async def test_playlist_error_still_sends_summary(self):
+        url = "https://www.youtube.com/playlist?list=xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx"
+        mock_author = create_mock_author(
+            voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+        )
+        play_message = create_mock_message(contents=f"-play {url}", author=mock_author)
+        reply = play_message.channel.send.return_value
+        reply.edit = mock.AsyncMock()
+        ingest = MockYouTubeIngest()
+
+        async def pages(_resolver):
+            yield ingest.tracks[1:2]
+            raise RuntimeError("malformed page")
+
+        ingest.pages = pages
+        self.music_bot_.youtube_ingest = mock.Mock(return_value=ingest)
+
+        await self.music_bot_.handle_message(play_message)
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(self.music_bot_.current_media.title, "video1")
+        self.assertEqual(self.music_bot_.playlist_remaining, 0)
+        self.assertIn("Added 2 of 2 songs", reply.edit.await_args[1]["content"])
+
+    async def test_playlist_returns_after_first_song(self):
+        url = "https://www.youtube.com/playlist?list=xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx"
+        mock_author = create_mock_author(
+            voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+        )
+        play_message = create_mock_message(contents=f"-play {url}", author=mock_author)
+        self.music_bot_.youtube_ingest = mock.Mock(
+            return_value=MockYouTubeIngest(page_delay=0.1)
+        )
+
+        await self.music_bot_.handle_message(play_message)
+
+        self.assertEqual(self.music_bot_.playlist_remaining, 2)
+        self.assertEqual(self.music_bot_.current_media.title, "video1")
+        queue_message = create_mock_message(contents="-queue", author=mock_author)
+        await self.music_bot_.handle_message(queue_message)
+        self.assertIn("2 more loading", queue_message.channel.send.await_args[0][0])
+
+        await asyncio.sleep(0.3)
+        self.assertEqual(self.music_bot_.playlist_remaining, 0)
+        self.assertEqual(len(self.music_bot_.media_deque), 2)
+
+    async def test_playlist_videos_are_looked_up_when_played(self):
+        url = "https://www.youtube.com/playlist?list=xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx"
+        mock_author = create_mock_author(
+            voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+        )
+        self.music_bot_.youtube_ingest = mock.Mock(
+            return_value=MockYouTubeIngest(n_tracks=250, page_size=100)
+        )
+
+        await self.music_bot_.handle_message(
+            create_mock_message(contents=f"-play {url}", author=mock_author)
+        )
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(len(self.music_bot_.media_deque), 249)
+        self.assertEqual(self.music_bot_.media_deque[-1].title, "video250")
+        # Only the song which is playing and the prefetched one are looked up
+        self.assertEqual(
+            [call[0][0] for call in self.music_bot_.pafy_search.call_args_list],
+            ["xxxxxxxxxx1", "xxxxxxxxxx2"],
+        )
+
+    async def test_cancel_stops_adding_playlist(self):
+        url = "https://www.youtube.com/playlist?list=xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx"
+        mock_author = create_mock_author(
+            voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+        )
+        play_message = create_mock_message(contents=f"-play {url}", author=mock_author)
+        self.music_bot_.youtube_ingest = mock.Mock(
+            return_value=MockYouTubeIngest(page_delay=0.1)
+        )
+
+        await self.music_bot_.handle_message(play_message)
+        await self.music_bot_.handle_message(
+            create_mock_message(contents="-cancel", author=mock_author)
+        )
+        await asyncio.sleep(0.2)
+
+        self.assertEqual(self.music_bot_.playlist_tasks, {})
+        self.assertEqual(len(self.music_bot_.media_deque), 0)
+
+    async def test_queue_shows_requested_page(self):
+        author = create_mock_author(
+            voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+        )
+        self.music_bot_.current_media = mock.Mock(title="current song")
+        for index in range(40):
+            self.music_bot_.media_deque.append(
+                bot.QueueEntry(str(index), f"song{index}", 90, 1, 2)
+            )
+
+        queue_message = create_mock_message(contents="-queue 3", author=author)
+        await self.music_bot_.handle_message(queue_message)
+
+        reply = queue_message.channel.send.await_args[0][0]
+        self.assertIn("page 3/3", reply)
+        self.assertIn(" 31: song30", reply)
+        self.assertNotIn("song29 ", reply)
+        self.assertIn("40 songs, 1:00:00", reply)
+
+    async def queue_songs(self, n_songs):
+        author = create_mock_author(
+            voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+        )
+        await self.music_bot_.create_or_get_voice_client(
+            create_mock_message(author=author)
+        )
+        for index in range(n_songs):
+            self.music_bot_.media_deque.append(
+                bot.QueueEntry(str(index), f"song{index}", 90, 1, 2)
+            )
+        return author
+
+    def queued_titles(self):
+        return [entry.title for entry in self.music_bot_.media_deque]
+
+    async def test_remove_and_move_songs_in_queue(self):
+        author = await self.queue_songs(5)
+
+        await self.music_bot_.handle_message(
+            create_mock_message(contents="-remove 2", author=author)
+        )
+        await self.music_bot_.handle_message(
+            create_mock_message(contents="-move 4 1", author=author)
+        )
+
+        self.assertEqual(self.queued_titles(), ["song4", "song0", "song2", "song3"])
+
+    async def test_remove_rejects_invalid_position(self):
+        author = await self.queue_songs(2)
+        message = create_mock_message(contents="-remove 3", author=author)
+
+        await self.music_bot_.handle_message(message)
+
+        message.channel.send.assert_awaited_with(":robot: The queue only has 2 songs")
+        self.assertEqual(len(self.music_bot_.media_deque), 2)
+
+    async def test_skipto_plays_song(self):
+        author = await self.queue_songs(5)
+        self.music_bot_.text_channels[2] = create_mock_message().channel
+
+        await self.music_bot_.handle_message(
+            create_mock_message(contents="-skipto 3", author=author)
+        )
+
+        self.assertEqual(self.music_bot_.current_media.title, "song2")
+        self.assertEqual(self.queued_titles(), ["song3", "song4"])
+
+    async def test_shuffle(self):
+        author = await self.queue_songs(20)
+
+        await self.music_bot_.handle_message(
+            create_mock_message(contents="-shuffle", author=author)
+        )
+
+        self.assertCountEqual(self.queued_titles(), [f"song{i}" for i in range(20)])
+
     async def test_playlist_spotify(self):
         url = "https://open.spotify.com/playlist/xxxxxxxxxxxxxxxxxxxxxx"
         mock_author = create_mock_author(
@@ -340,6 +895,7 @@ class MusicBotTest(unittest.IsolatedAsyncioTestCase):
         mock_media = mock.Mock()
         mock_media.title = "playlist item"
         mock_media.duration = "00:01:00"
+        mock_media.length = 60
         self.music_bot_.pafy_search = mock.Mock(return_value=mock_media)
 
         await self.music_bot_.handle_message(play_message)
@@ -354,6 +910,217 @@ class MusicBotTest(unittest.IsolatedAsyncioTestCase):
             )
         )
 
+    async def test_playlist_spotify_failed_lookup_is_skipped(self):
+        url = "https://open.spotify.com/playlist/xxxxxxxxxxxxxxxxxxxxxx"
+        mock_author = create_mock_author(
+            voice_state=create_mock_voice_state(channel=create_mock_voice_channel())
+        )
+        play_message = create_mock_message(contents=f"-play {url}", author=mock_author)
+        reply = play_message.channel.send.return_value
+        reply.edit = mock.AsyncMock()
+
+        def youtube_search(term):
+            if term.startswith("track2"):
+                raise RuntimeError("search failed")
+            return {"result": [{"id": f"xxxxxxxxxx{term[5]}"}]}
+
+        self.music_bot_.youtube_search = mock.Mock(side_effect=youtube_search)
+        self.music_bot_.pafy_search = mock.Mock(
+            side_effect=lambda video_id: mock.Mock(
+                videoid=video_id, title=f"video{video_id[-1]}", length=60
+            )
+        )
+
+        await self.music_bot_.handle_message(play_message)
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(self.music_bot_.current_media.title, "video1")
+        self.assertEqual(self.queued_titles(), ["video3"])
+        self.assertIn("Added 2 of 3 songs", reply.edit.await_args[1]["content"])
+
+
+class ProgressReporterTest(unittest.IsolatedAsyncioTestCase):
+    """ProgressReporter test suite"""
+
+    async def test_coalesces_edits(self):
+        reply = create_mock_message()
+        reporter = bot.ProgressReporter(
+            asyncio.get_running_loop(), reply, "Fetching playlist... {}", min_step=0.1
+        )
+
+        for done in range(1, 501):
+            reporter.update(done, 500)
+        await asyncio.sleep(0)
+        await reporter.finish("Done")
+
+        self.assertEqual(reply.edit.await_count, 2)
+        reply.edit.assert_any_await(content="Fetching playlist... 10%")
+        reply.edit.assert_awaited_with(content="Done")
+
+    async def test_summary_survives_failed_edits(self):
+        reply = create_mock_message()
+        reply.edit.side_effect = [bot.discord.DiscordException("Unknown Message")] * 2
+        reporter = bot.ProgressReporter(
+            asyncio.get_running_loop(), reply, "{}", min_step=0
+        )
+
+        reporter.update(1, 10)
+        await asyncio.sleep(0)
+        await reporter.finish("Done")
+
+        reply.channel.send.assert_awaited_once_with("Done")
+
+    async def test_progress_is_clamped(self):
+        reply = create_mock_message()
+        reporter = bot.ProgressReporter(
+            asyncio.get_running_loop(), reply, "{}", min_step=0
+        )
+
+        reporter.update(120, 100)
+        await asyncio.sleep(0)
+
+        reply.edit.assert_awaited_once_with(content="100%")
+
+    async def test_waits_for_interval_between_edits(self):
+        reply = create_mock_message()
+        reporter = bot.ProgressReporter(
+            asyncio.get_running_loop(), reply, "{}", min_interval=60, min_step=0
+        )
+
+        reporter.update(1, 10)
+        await asyncio.sleep(0)
+        reporter.update(5, 10)
+        await asyncio.sleep(0)
+
+        reply.edit.assert_awaited_once_with(content="10%")
+
+
+class BotDispatcherTest(unittest.IsolatedAsyncioTestCase):
+    """BotDispatcher test suite"""
+
+    async def asyncSetUp(self):
+        # pylint: disable=attribute-defined-outside-init
+        bot.MusicBot.get_spotify_client = create_mock_spotify
+        self.dispatcher_ = bot.BotDispatcher(idle_eviction_seconds=60)
+        user_patch = mock.patch.object(
+            bot.BotDispatcher,
+            "user",
+            new_callable=mock.PropertyMock,
+            return_value=create_mock_author(name="test_bot"),
+        )
+        user_patch.start()
+        self.addCleanup(user_patch.stop)
+
+    async def asyncTearDown(self):
+        self.dispatcher_.resolver.shutdown()
+
+    async def test_creates_music_bot_per_guild(self):
+        message = create_mock_message(contents="-hello")
+        message.guild = "guild1"
+
+        await self.dispatcher_.on_message(message)
+        await self.dispatcher_.on_message(message)
+
+        self.assertEqual(list(self.dispatcher_.clients), ["guild1"])
+
+    async def test_evicts_idle_music_bots(self):
+        for guild in ("idle", "connected", "active"):
+            message = create_mock_message(contents="-hello")
+            message.guild = guild
+            await self.dispatcher_.on_message(message)
+        self.dispatcher_.clients["idle"].last_command_time -= 120
+        self.dispatcher_.clients["connected"].last_command_time -= 120
+        self.dispatcher_.clients["connected"].voice_client = MockVoiceClient()
+
+        self.assertEqual(self.dispatcher_.evict_idle_clients(), 1)
+        self.assertEqual(sorted(self.dispatcher_.clients), ["active", "connected"])
+
+    async def test_restores_saved_queues(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "queues.sqlite3")
+            dispatcher = bot.BotDispatcher(queue_db=path)
+            guild = mock.Mock(id=1)
+            music_bot = dispatcher.get_music_bot(guild)
+            voice_channel = create_mock_voice_channel()
+            voice_channel.id = 10
+            await music_bot.connect(voice_channel)
+            music_bot.current_media = bot.QueueEntry("song0", "song0", 60, 1, 2)
+            for index in range(1, 4):
+                music_bot.media_deque.append(
+                    bot.QueueEntry(f"song{index}", f"song{index}", 60, 1, 2)
+                )
+            await dispatcher.save_queues()
+            self.assertEqual(dispatcher.snapshot_queues(), ({}, {}))
+            await dispatcher.close()
+
+            restarted = bot.BotDispatcher(queue_db=path)
+            self.addCleanup(restarted.resolver.shutdown)
+            self.addCleanup(restarted.queue_store.close)
+            new_voice_channel = create_mock_voice_channel()
+            text_channel = create_mock_message().channel
+            channels = {10: new_voice_channel, 2: text_channel}
+            guild.get_channel = mock.Mock(side_effect=channels.get)
+            restarted.get_guild = mock.Mock(side_effect={1: guild}.get)
+            restarted.stream_cache.put(
+                "song0", media_cache.AudioStream("https://stream", None), 2 ** 40
+            )
+            with mock.patch.object(bot.MusicBot, "create_audio_source"):
+                await restarted.restore_queues()
+
+            music_bot = restarted.clients[guild]
+            new_voice_channel.connect.assert_awaited_once()
+            self.assertEqual(music_bot.current_media.title, "song0")
+            self.assertEqual(
+                [entry.title for entry in music_bot.media_deque],
+                ["song1", "song2", "song3"],
+            )
+            text_channel.send.assert_awaited_with(
+                ":notes: Now Playing :notes:\n```\nsong0\n```"
+            )
+            self.assertIn(1, restarted.snapshot_queues()[0])
+
+    async def test_failed_queue_save_is_retried(self):
+        self.dispatcher_.queue_store = mock.Mock()
+        self.dispatcher_.queue_store.save.side_effect = [
+            sqlite3.OperationalError("database is locked"),
+            None,
+        ]
+        music_bot = self.dispatcher_.get_music_bot(mock.Mock(id=1))
+        music_bot.media_deque.append(bot.QueueEntry("song1", "song1", 60, 1, 2))
+
+        with self.assertRaises(sqlite3.OperationalError):
+            await self.dispatcher_.save_queues()
+        await self.dispatcher_.save_queues()
+
+        self.assertEqual(self.dispatcher_.queue_store.save.call_count, 2)
+        self.assertEqual(self.dispatcher_.snapshot_queues(), ({}, {}))
+
+    async def test_failed_queue_save_does_not_stop_close(self):
+        self.dispatcher_.queue_store = mock.Mock()
+        self.dispatcher_.queue_store.save.side_effect = sqlite3.OperationalError(
+            "database is locked"
+        )
+
+        await self.dispatcher_.close()
+
+        self.dispatcher_.queue_store.close.assert_called_once()
+        self.assertTrue(self.dispatcher_.is_closed())
+
+    async def test_failed_restore_does_not_stop_other_guilds(self):
+        guilds = {guild_id: mock.Mock(id=guild_id) for guild_id in (1, 2)}
+        self.dispatcher_.get_guild = mock.Mock(side_effect=guilds.get)
+        self.dispatcher_.queue_store = mock.Mock()
+        self.dispatcher_.queue_store.load.return_value = {
+            1: (None, [bot.QueueEntry("song1", "song1", 60, 1, 2)]),
+            2: (None, [bot.QueueEntry("song2", "song2", 60, 2, 2)]),
+        }
+        restore_queue = mock.AsyncMock(side_effect=[OSError("Video unavailable"), None])
+
+        with mock.patch.object(bot.MusicBot, "restore_queue", restore_queue):
+            await self.dispatcher_.restore_queues()
+
+        self.assertEqual(restore_queue.await_count, 2)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,53 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+from lazy import LazyModule  # pylint: disable=import-error
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class LazyModuleTest(unittest.TestCase):
+    """LazyModule test suite"""
+
+    def test_imports_on_first_attribute_access(self):
+        with mock.patch("importlib.import_module") as import_module:
+            module = LazyModule("some.module")
+            self.assertFalse(module.loaded)
+            import_module.assert_not_called()
+
+            self.assertIs(module.function, import_module.return_value.function)
+            self.assertIs(module.other, import_module.return_value.other)
+
+        import_module.assert_called_once_with("some.module")
+        self.assertTrue(module.loaded)
+
+    def test_missing_attribute(self):
+        module = LazyModule("json")
+
+        self.assertIs(module.loads, json.loads)
+        with self.assertRaises(AttributeError):
+            module.not_in_json  # pylint: disable=pointless-statement
+
+    def test_bot_doesnt_import_integrations(self):
+        integrations = ["youtube_dl", "pytube", "spotipy", "jokeapi", "requests"]
+        code = (
+            "import sys, bot; "
+            f"print([name for name in {integrations} if name in sys.modules])"
+        )
+
+        output = subprocess.check_output(
+            [sys.executable, "-c", code], cwd=ROOT, text=True
+        )
+
+        self.assertEqual(output.strip(), "[]")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+
+import contextlib
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import media_cache  # pylint: disable=import-error
+
+
+def create_mock_media(videoid="xxxxxxxxxx1", title="Mock Song", length=61):
+    media = mock.Mock()
+    media.videoid = videoid
+    media.title = title
+    media.length = length
+    return media
+
+
+class MetadataCacheTest(unittest.TestCase):
+    """MetadataCache test suite"""
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.tmpdir_ = tempfile.TemporaryDirectory()
+        self.path_ = os.path.join(self.tmpdir_.name, "cache.sqlite3")
+
+    def tearDown(self):
+        self.tmpdir_.cleanup()
+
+    def test_search_term_is_normalized(self):
+        cache = media_cache.MetadataCache()
+        cache.put_video_id("Some  Song - Artist ", "xxxxxxxxxx1")
+
+        self.assertEqual(cache.get_video_id("some song - artist"), "xxxxxxxxxx1")
+        self.assertIsNone(cache.get_video_id("other song"))
+
+    def test_metadata_survives_restart(self):
+        cache = media_cache.MetadataCache(path=self.path_)
+        cache.put_video_id("mock song", "xxxxxxxxxx1")
+        cache.put_metadata(create_mock_media())
+        cache.close()
+
+        cache = media_cache.MetadataCache(path=self.path_)
+        fetch = mock.Mock()
+        media = cache.get_metadata(cache.get_video_id("mock song"), fetch)
+        cache.close()
+
+        self.assertEqual(media.videoid, "xxxxxxxxxx1")
+        self.assertEqual(media.title, "Mock Song")
+        self.assertEqual(media.duration, "00:01:01")
+        fetch.assert_not_called()
+
+    def test_database_is_in_wal_mode(self):
+        cache = media_cache.MetadataCache(path=self.path_)
+        cache.close()
+
+        with contextlib.closing(sqlite3.connect(self.path_)) as database:
+            journal_mode = database.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(journal_mode, "wal")
+
+    def test_failed_database_write_keeps_memory_entry(self):
+        cache = media_cache.MetadataCache(path=self.path_)
+        with contextlib.closing(sqlite3.connect(self.path_)) as database:
+            database.execute("DROP TABLE searches")
+            database.execute("DROP TABLE metadata")
+
+        cache.put_video_id("mock song", "xxxxxxxxxx1")
+        cache.put_metadata(create_mock_media())
+
+        self.assertEqual(cache.get_video_id("mock song"), "xxxxxxxxxx1")
+        self.assertIsNotNone(cache.get_metadata("xxxxxxxxxx1", mock.Mock()))
+        cache.close()
+
+    def test_expired_entries_are_ignored(self):
+        cache = media_cache.MetadataCache(path=self.path_, metadata_ttl=-1)
+        cache.put_metadata(create_mock_media())
+
+        self.assertIsNone(cache.get_metadata("xxxxxxxxxx1", mock.Mock()))
+        cache.close()
+
+    def test_memory_tier_is_bounded(self):
+        cache = media_cache.MetadataCache(max_entries=2)
+        for index in range(3):
+            cache.put_metadata(create_mock_media(videoid=f"xxxxxxxxxx{index}"))
+
+        self.assertIsNone(cache.get_metadata("xxxxxxxxxx0", mock.Mock()))
+        self.assertIsNotNone(cache.get_metadata("xxxxxxxxxx2", mock.Mock()))
+
+    def test_cached_media_fetches_stream_lazily(self):
+        full_media = mock.Mock()
+        fetch = mock.Mock(return_value=full_media)
+        media = media_cache.CachedMedia("xxxxxxxxxx1", "Mock Song", 61, fetch)
+
+        fetch.assert_not_called()
+        self.assertEqual(media.getbestaudio(), full_media.getbestaudio.return_value)
+        media.getbestaudio()
+        fetch.assert_called_once_with("xxxxxxxxxx1")
+
+
+class StreamUrlCacheTest(unittest.TestCase):
+    """StreamUrlCache test suite"""
+
+    def test_url_is_resolved_once(self):
+        cache = media_cache.StreamUrlCache()
+        media = create_mock_media()
+        media.expiry = time.time() + 60 * 60 * 5
+        media.getbestaudio.return_value.url = "https://stream/1"
+
+        self.assertEqual(cache.get_or_resolve(media).url, "https://stream/1")
+        self.assertEqual(cache.get_or_resolve(media).url, "https://stream/1")
+        media.getbestaudio.assert_called_once()
+
+    def test_url_close_to_expiry_is_refreshed(self):
+        cache = media_cache.StreamUrlCache(refresh_margin=60)
+        media = create_mock_media()
+        media.expiry = time.time() + 30
+        media.getbestaudio.return_value.url = "https://stream/1"
+        cache.get_or_resolve(media)
+
+        media.expiry = time.time() + 60 * 60 * 5
+        media.getbestaudio.return_value.url = "https://stream/2"
+
+        self.assertEqual(cache.get_or_resolve(media).url, "https://stream/2")
+        self.assertEqual(media.getbestaudio.call_count, 2)
+
+    def test_media_without_expiry_uses_default_lifespan(self):
+        cache = media_cache.StreamUrlCache()
+        media = create_mock_media()
+        media.expiry = None
+        media.getbestaudio.return_value.url = "https://stream/1"
+        cache.get_or_resolve(media)
+
+        self.assertEqual(cache.get("xxxxxxxxxx1").url, "https://stream/1")
+
+    def test_webm_streams_are_marked_as_opus(self):
+        cache = media_cache.StreamUrlCache()
+        media = create_mock_media()
+        media.getbestaudio.return_value.extension = "webm"
+
+        self.assertEqual(cache.get_or_resolve(media).codec, "opus")
+        media.getbestaudio.assert_called_once_with(preftype="webm")
+
+    def test_other_streams_have_no_codec(self):
+        cache = media_cache.StreamUrlCache()
+        media = create_mock_media()
+        media.getbestaudio.return_value.extension = "m4a"
+
+        self.assertIsNone(cache.get_or_resolve(media).codec)
+
+    def test_media_without_webm_falls_back_to_other_streams(self):
+        cache = media_cache.StreamUrlCache()
+        media = create_mock_media()
+        m4a_stream = mock.Mock(url="https://stream/1", extension="m4a")
+        # Like pafy, None unless a stream of the preferred type exists
+        media.getbestaudio.side_effect = lambda preftype="any": (
+            None if preftype == "webm" else m4a_stream
+        )
+
+        self.assertEqual(
+            cache.get_or_resolve(media),
+            media_cache.AudioStream("https://stream/1", None),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+
+import random
+import unittest
+from unittest import mock
+
+from media_queue import MediaQueue, QueueEntry  # pylint: disable=import-error
+
+
+class QueueEntryTest(unittest.TestCase):
+    """QueueEntry test suite"""
+
+    def test_from_media_keeps_only_ids(self):
+        media = mock.Mock(videoid="xxxxxxxxxx1", title="song", length=200)
+        message = mock.Mock()
+        message.author.id = 1
+        message.channel.id = 2
+
+        entry = QueueEntry.from_media(media, message)
+
+        self.assertEqual(
+            (entry.videoid, entry.title, entry.length), ("xxxxxxxxxx1", "song", 200)
+        )
+        self.assertEqual((entry.requester_id, entry.channel_id), (1, 2))
+        self.assertFalse(hasattr(entry, "__dict__"))
+
+    def test_from_media_without_length(self):
+        media = mock.Mock(videoid="xxxxxxxxxx1", title="live", length=None)
+
+        entry = QueueEntry.from_media(media, mock.Mock())
+
+        self.assertEqual(entry.length, 0)
+        self.assertEqual(entry.line(30), "live                    (0:00)")
+
+    def test_duration(self):
+        entry = QueueEntry("xxxxxxxxxx1", "song", 3723, 1, 2)
+
+        self.assertEqual(entry.duration, "01:02:03")
+
+    def test_line_is_cached(self):
+        entry = QueueEntry("xxxxxxxxxx1", "a very long song title" * 5, 200, 1, 2)
+
+        line = entry.line(40)
+
+        self.assertEqual(len(line), 40)
+        self.assertTrue(line.endswith("(3:20)"))
+        self.assertIs(entry.line(40), line)
+
+
+class MediaQueueTest(unittest.TestCase):
+    """MediaQueue test suite"""
+
+    def setUp(self):
+        # pylint: disable=attribute-defined-outside-init
+        self.queue_ = MediaQueue()
+        for index in range(25):
+            self.queue_.append(QueueEntry(str(index), f"song{index}", 10, 1, 2))
+
+    def test_keeps_total_length(self):
+        self.queue_.appendleft(QueueEntry("first", "first", 100, 1, 2))
+        self.queue_.popleft()
+        self.queue_.popleft()
+
+        self.assertEqual(len(self.queue_), 24)
+        self.assertEqual(self.queue_.total_length, 240)
+
+        self.queue_.clear()
+        self.assertEqual(self.queue_.total_length, 0)
+
+    def test_page(self):
+        self.assertEqual(self.queue_.n_pages(10), 3)
+
+        page = self.queue_.page(3, 10)
+
+        self.assertEqual(
+            [(position, entry.title) for position, entry in page],
+            [
+                (21, "song20"),
+                (22, "song21"),
+                (23, "song22"),
+                (24, "song23"),
+                (25, "song24"),
+            ],
+        )
+
+    def test_positional_operations_match_list(self):
+        rng = random.Random(1)
+        with mock.patch.object(MediaQueue, "LOAD", 4):
+            queue = MediaQueue()
+            expected = []
+            for step in range(2000):
+                operation = rng.choice(["insert", "pop", "move", "drop_front"])
+                if operation == "insert" or not expected:
+                    index = rng.randint(-len(expected) - 1, len(expected) + 1)
+                    entry = QueueEntry(str(step), str(step), step % 7, 1, 2)
+                    queue.insert(index, entry)
+                    expected.insert(index, entry)
+                elif operation == "pop":
+                    index = rng.randrange(len(expected))
+                    self.assertIs(queue.pop(index), expected.pop(index))
+                elif operation == "move":
+                    source = rng.randrange(len(expected))
+                    destination = rng.randrange(len(expected))
+                    queue.move(source, destination)
+                    expected.insert(destination, expected.pop(source))
+                elif rng.random() < 0.1:
+                    count = rng.randint(0, 3)
+                    queue.drop_front(count)
+                    del expected[:count]
+
+                self.assertEqual(list(queue), expected)
+                self.assertEqual(len(queue), len(expected))
+                self.assertLessEqual(max(map(len, queue.blocks), default=0), 8)
+                self.assertEqual(
+                    queue.total_length, sum(entry.length for entry in expected)
+                )
+
+        if expected:
+            self.assertIs(queue[-1], expected[-1])
+
+    def test_shuffle_keeps_entries(self):
+        entries = list(self.queue_)
+
+        self.queue_.shuffle()
+
+        self.assertCountEqual(list(self.queue_), entries)
+        self.assertEqual(self.queue_.total_length, 250)
+
+    def test_index_out_of_range(self):
+        with self.assertRaises(IndexError):
+            self.queue_.pop(25)
+
+    def test_empty_queue_has_one_page(self):
+        self.assertEqual(MediaQueue().n_pages(10), 1)
+        self.assertEqual(MediaQueue().page(1, 10), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
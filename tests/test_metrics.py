@@ -0,0 +1,93 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+
+import asyncio
+import unittest
+
+import aiohttp  # pylint: disable=import-error
+
+import metrics  # pylint: disable=import-error
+
+
+class MetricsTest(unittest.IsolatedAsyncioTestCase):
+    """Metrics test suite"""
+
+    async def asyncSetUp(self):
+        # pylint: disable=attribute-defined-outside-init
+        self.registry_ = metrics.Registry()
+
+    async def test_counter_with_labels(self):
+        counter = self.registry_.counter(
+            "tracks_total", "Tracks", labelnames=("result",)
+        )
+        counter.labels("added").inc()
+        counter.labels("added").inc(2)
+        counter.labels("failed").inc()
+
+        self.assertEqual(
+            counter.render(),
+            "# HELP tracks_total Tracks\n"
+            "# TYPE tracks_total counter\n"
+            'tracks_total{result="added"} 3\n'
+            'tracks_total{result="failed"} 1',
+        )
+
+    async def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry_.histogram("seconds", "Time", buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.observe(value)
+
+        rendered = histogram.render().splitlines()
+
+        self.assertEqual(
+            rendered[2:],
+            [
+                'seconds_bucket{le="0.1"} 1',
+                'seconds_bucket{le="1"} 3',
+                'seconds_bucket{le="+Inf"} 4',
+                "seconds_sum 6.05",
+                "seconds_count 4",
+            ],
+        )
+
+    async def test_timed(self):
+        histogram = self.registry_.histogram("seconds", "Time")
+
+        @metrics.timed(histogram)
+        def function():
+            return 1
+
+        @metrics.timed(histogram)
+        async def coroutine_function():
+            await asyncio.sleep(0.01)
+            return 2
+
+        self.assertEqual(function(), 1)
+        self.assertEqual(await coroutine_function(), 2)
+        self.assertEqual(histogram.count, 2)
+        self.assertGreaterEqual(histogram.sum, 0.01)
+        self.assertEqual(coroutine_function.__name__, "coroutine_function")
+
+    async def test_gauge_reads_function(self):
+        values = [3]
+        gauge = self.registry_.gauge("bots", "Bots", lambda: values[0])
+        values[0] = 4
+
+        self.assertEqual(gauge.render().splitlines()[-1], "bots 4")
+
+    async def test_serves_metrics_over_http(self):
+        self.registry_.counter("requests_total", "Requests").inc()
+        runner = await self.registry_.start_server(0)
+        self.addAsyncCleanup(runner.cleanup)
+        host, port = runner.addresses[0][:2]
+
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://{host}:{port}/metrics") as response:
+                text = await response.text()
+
+        self.assertEqual(text, self.registry_.render())
+        self.assertIn("requests_total 1\n", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+
+import unittest
+from unittest import mock
+
+# pylint: disable=import-error
+from pafy_fixed import backend_youtube_dl_fixed, pafy_fixed
+
+
+class YdlPoolTest(unittest.TestCase):
+    """YdlPool test suite"""
+
+    def setUp(self):
+        # pylint: disable=attribute-defined-outside-init
+        patcher = mock.patch.object(
+            backend_youtube_dl_fixed.youtube_dl,
+            "YoutubeDL",
+            side_effect=lambda _opts: mock.Mock(),
+        )
+        self.youtube_dl_ = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool_ = backend_youtube_dl_fixed.YdlPool()
+
+    def test_reuses_instances(self):
+        with self.pool_.checkout({"quiet": True}) as first:
+            pass
+        with self.pool_.checkout({"quiet": True}) as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(self.pool_.created, 1)
+
+    def test_concurrent_checkouts_get_own_instance(self):
+        with self.pool_.checkout({"quiet": True}) as first:
+            with self.pool_.checkout({"quiet": True}) as second:
+                self.assertIsNot(first, second)
+        with self.pool_.checkout({"quiet": True}) as third:
+            self.assertIn(third, (first, second))
+
+        self.assertEqual(self.pool_.created, 2)
+
+    def test_instances_are_per_options(self):
+        with self.pool_.checkout({"quiet": True}) as first:
+            pass
+        with self.pool_.checkout({"quiet": False}) as second:
+            pass
+
+        self.assertIsNot(first, second)
+        self.youtube_dl_.assert_called_with({"quiet": False})
+
+    def test_instance_is_returned_after_error(self):
+        with self.assertRaises(IOError):
+            with self.pool_.checkout({}) as first:
+                raise IOError("Video unavailable")
+        with self.pool_.checkout({}) as second:
+            pass
+
+        self.assertIs(first, second)
+
+
+def create_info():
+    return {
+        "id": "xxxxxxxxxx1",
+        "title": "song",
+        "duration": 200,
+        "uploader": "artist",
+        "uploader_id": "artist",
+        "average_rating": 4.9,
+        "view_count": 1000,
+        "like_count": 10,
+        "categories": ["Music"],
+        "thumbnails": [{"url": "https://thumbnail"}],
+        "subtitles": {"en": [{"ext": "vtt", "url": "https://subtitles"}]},
+        "formats": [
+            {
+                "format_id": "251",
+                "ext": "webm",
+                "acodec": "opus",
+                "vcodec": "none",
+                "abr": 160,
+                "url": "https://stream/251",
+                "http_headers": {"User-Agent": "Mozilla/5.0"},
+            },
+            {
+                "format_id": "140",
+                "ext": "m4a",
+                "acodec": "mp4a.40.2",
+                "vcodec": "none",
+                "abr": 128,
+                "url": "https://stream/140",
+            },
+            {
+                "format_id": "18",
+                "ext": "mp4",
+                "acodec": "mp4a.40.2",
+                "vcodec": "avc1",
+                "url": "https://stream/18",
+            },
+        ],
+    }
+
+
+class PlaybackOnlyTest(unittest.TestCase):
+    """Playback-only extraction test suite"""
+
+    def setUp(self):
+        # pylint: disable=attribute-defined-outside-init
+        self.ydl_ = mock.Mock()
+        self.ydl_.extract_info.return_value = create_info()
+        patcher = mock.patch.object(
+            backend_youtube_dl_fixed.youtube_dl, "YoutubeDL", return_value=self.ydl_
+        )
+        self.youtube_dl_ = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(
+            backend_youtube_dl_fixed, "ydl_pool", backend_youtube_dl_fixed.YdlPool()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_keeps_only_playback_data(self):
+        # pylint: disable=protected-access
+        media = pafy_fixed.new("xxxxxxxxxx1", playback_only=True)
+
+        self.assertEqual((media.title, media.length), ("song", 200))
+        self.assertIsNone(media._ydl_info)
+        self.assertEqual(
+            [stream.url for stream in media.audiostreams],
+            ["https://stream/251", "https://stream/140"],
+        )
+        self.assertNotIn("http_headers", media.audiostreams[0]._info)
+        self.assertEqual(media.getbestaudio(preftype="webm").extension, "webm")
+
+    def test_skips_processing(self):
+        pafy_fixed.new("xxxxxxxxxx1", playback_only=True)
+
+        self.ydl_.extract_info.assert_called_once_with(
+            "xxxxxxxxxx1", download=False, process=False
+        )
+        options = self.youtube_dl_.call_args[0][0]
+        self.assertFalse(options["youtube_include_dash_manifest"])
+        self.assertTrue(options["noplaylist"])
+
+    def test_full_extraction_by_default(self):
+        media = pafy_fixed.new("xxxxxxxxxx1")
+
+        self.assertEqual(media.author, "artist")
+        self.assertEqual(len(media.allstreams), 3)
+        self.ydl_.extract_info.assert_called_once_with(
+            "xxxxxxxxxx1", download=False, process=True
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+
+import asyncio
+import unittest
+from unittest import mock
+
+import prefetch  # pylint: disable=import-error
+
+
+def create_mock_item(title="Mock Song"):
+    entry = mock.Mock()
+    entry.title = title
+    return entry
+
+
+class PrefetcherTest(unittest.IsolatedAsyncioTestCase):
+    """Prefetcher test suite"""
+
+    async def asyncSetUp(self):
+        # pylint: disable=attribute-defined-outside-init
+        async def resolve(entry):
+            return f"https://stream/{entry.title}"
+
+        self.resolve_ = mock.AsyncMock(side_effect=resolve)
+        self.sources_ = []
+
+        def create_source(url):
+            self.sources_.append(mock.Mock(url=url))
+            return self.sources_[-1]
+
+        self.create_source_ = mock.Mock(side_effect=create_source)
+        self.prefetcher_ = prefetch.Prefetcher(
+            asyncio.get_running_loop(),
+            self.resolve_,
+            create_source=self.create_source_,
+            depth=2,
+        )
+
+    async def test_take_returns_prefetched_url_and_source(self):
+        item = create_mock_item("song1")
+        self.prefetcher_.schedule([item])
+        await asyncio.sleep(0.01)
+
+        audio_url, audio_source = await self.prefetcher_.take(item)
+
+        self.assertEqual(audio_url, "https://stream/song1")
+        self.assertEqual(audio_source.url, "https://stream/song1")
+        self.resolve_.assert_awaited_once()
+
+    async def test_failed_prefetch_is_not_taken(self):
+        item = create_mock_item("song1")
+        self.resolve_.side_effect = OSError("Video unavailable")
+        self.prefetcher_.schedule([item])
+        await asyncio.sleep(0.01)
+
+        self.assertIsNone(await self.prefetcher_.take(item))
+        self.create_source_.assert_not_called()
+
+    async def test_only_first_entries_are_prefetched(self):
+        items = [create_mock_item(f"song{index}") for index in range(4)]
+        self.prefetcher_.schedule(items)
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(self.resolve_.await_count, 2)
+        self.create_source_.assert_called_once_with("https://stream/song0")
+        self.assertIsNone(await self.prefetcher_.take(items[3]))
+
+    async def test_take_does_not_wait_for_warm_up(self):
+        item = create_mock_item("song1")
+        self.prefetcher_.schedule([item], warm_delay=60)
+        await asyncio.sleep(0.01)
+
+        audio_url, audio_source = await self.prefetcher_.take(item)
+
+        self.assertEqual(audio_url, "https://stream/song1")
+        self.assertIsNone(audio_source)
+        self.create_source_.assert_not_called()
+
+    async def test_rescheduling_cleans_up_dropped_sources(self):
+        old_head = create_mock_item("song1")
+        self.prefetcher_.schedule([old_head])
+        await asyncio.sleep(0.01)
+
+        # e.g. playnext put a new song in front of the queue
+        new_head = create_mock_item("song2")
+        self.prefetcher_.schedule([new_head, old_head])
+        await asyncio.sleep(0.01)
+
+        self.sources_[0].cleanup.assert_called_once()
+        _, audio_source = await self.prefetcher_.take(new_head)
+        self.assertEqual(audio_source, self.sources_[1])
+
+    async def test_invalidate_cleans_up_warm_sources(self):
+        item = create_mock_item("song1")
+        self.prefetcher_.schedule([item])
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.create_source_.call_count, 1)
+
+        self.prefetcher_.invalidate()
+
+        self.sources_[0].cleanup.assert_called_once()
+        self.assertIsNone(await self.prefetcher_.take(item))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+
+import os
+import tempfile
+import unittest
+
+from media_queue import QueueEntry  # pylint: disable=import-error
+from queue_store import QueueStore  # pylint: disable=import-error
+
+
+def create_entries(*titles):
+    return [QueueEntry(title, title, 60, 1, 2) for title in titles]
+
+
+class QueueStoreTest(unittest.TestCase):
+    """QueueStore test suite"""
+
+    def setUp(self):
+        # pylint: disable=consider-using-with
+        self.tmpdir_ = tempfile.TemporaryDirectory()
+        self.path_ = os.path.join(self.tmpdir_.name, "queues.sqlite3")
+        self.store_ = QueueStore(self.path_)
+
+    def tearDown(self):
+        self.store_.close()
+        self.tmpdir_.cleanup()
+
+    def loaded_titles(self, store=None):
+        queues = (store or self.store_).load()
+        return {
+            guild_id: (voice_channel_id, [entry.title for entry in entries])
+            for guild_id, (voice_channel_id, entries) in queues.items()
+        }
+
+    def test_queues_survive_reopening(self):
+        self.store_.save(
+            {
+                1: (10, create_entries("a", "b", "c")),
+                2: (None, create_entries("d")),
+            }
+        )
+        self.store_.close()
+
+        reopened = QueueStore(self.path_)
+        self.addCleanup(reopened.close)
+
+        self.assertEqual(
+            self.loaded_titles(reopened),
+            {1: (10, ["a", "b", "c"]), 2: (None, ["d"])},
+        )
+
+    def test_save_replaces_queue(self):
+        self.store_.save({1: (10, create_entries("a", "b", "c"))})
+        self.store_.save({1: (10, create_entries("c", "b"))})
+
+        self.assertEqual(self.loaded_titles(), {1: (10, ["c", "b"])})
+
+    def test_empty_and_removed_queues_are_deleted(self):
+        self.store_.save(
+            {
+                1: (10, create_entries("a")),
+                2: (10, create_entries("b")),
+                3: (10, create_entries("c")),
+            }
+        )
+        self.store_.save({1: None, 2: (10, [])})
+
+        self.assertEqual(self.loaded_titles(), {3: (10, ["c"])})
+
+    def test_restored_entries_are_complete(self):
+        self.store_.save({1: (None, [QueueEntry("id", "title", 123, 4, 5)])})
+
+        entry = self.store_.load()[1][1][0]
+
+        self.assertEqual(repr(entry), "QueueEntry('id', 'title', 123)")
+        self.assertEqual((entry.requester_id, entry.channel_id), (4, 5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,241 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+import unittest
+
+import resolver  # pylint: disable=import-error
+
+
+class MediaResolverTest(unittest.IsolatedAsyncioTestCase):
+    """MediaResolver test suite"""
+
+    async def asyncSetUp(self):
+        # pylint: disable=attribute-defined-outside-init
+        self.resolver_ = resolver.MediaResolver(
+            asyncio.get_running_loop(), max_workers=2, timeout=1
+        )
+
+    async def asyncTearDown(self):
+        self.resolver_.shutdown()
+
+    async def test_run_returns_result_from_worker_thread(self):
+        result = await self.resolver_.run(
+            lambda a, b: (a + b, threading.get_ident()), 1, 2
+        )
+
+        self.assertEqual(result[0], 3)
+        self.assertNotEqual(result[1], threading.get_ident())
+
+    async def test_run_times_out(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.resolver_.run(time.sleep, 0.5, timeout=0.05)
+
+    async def test_slow_lookup_does_not_block_event_loop(self):
+        slow = asyncio.ensure_future(self.resolver_.run(time.sleep, 0.3))
+        start = time.monotonic()
+        await asyncio.sleep(0.01)
+
+        self.assertLess(time.monotonic() - start, 0.2)
+        await slow
+
+    async def test_map_ordered_keeps_input_order(self):
+        self.resolver_.concurrency = 4
+        delays = [0.2, 0.0, 0.1, 0.0]
+
+        def lookup(index):
+            time.sleep(delays[index])
+            return index
+
+        results = [
+            result
+            async for result in self.resolver_.map_ordered(lookup, range(len(delays)))
+        ]
+
+        self.assertEqual(results, [0, 1, 2, 3])
+
+    async def test_map_ordered_respects_guild_limit(self):
+        self.resolver_ = resolver.MediaResolver(
+            asyncio.get_running_loop(), max_workers=8, concurrency=8, guild_limit=2
+        )
+        lock = threading.Lock()
+        running = [0]
+        max_running = [0]
+
+        def lookup(index):
+            with lock:
+                running[0] += 1
+                max_running[0] = max(max_running[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            return index
+
+        limiter = self.resolver_.guild_limiter()
+        results = [
+            result
+            async for result in self.resolver_.map_ordered(
+                lookup, range(8), limiter=limiter
+            )
+        ]
+
+        self.assertEqual(results, list(range(8)))
+        self.assertEqual(max_running[0], 2)
+
+    async def test_map_ordered_resolves_async_items_as_they_arrive(self):
+        async def pages():
+            for page in ([0, 1], [2, 3]):
+                yield page
+                await asyncio.sleep(0.1)
+
+        async def items():
+            async for page in pages():
+                for item in page:
+                    yield item
+
+        start = time.monotonic()
+        resolution = self.resolver_.map_ordered(lambda index: index, items())
+        self.assertEqual(await resolution.__anext__(), 0)
+        # Not held back until the second page has arrived
+        self.assertLess(time.monotonic() - start, 0.1)
+
+        results = [result async for result in resolution]
+        self.assertEqual(results, [1, 2, 3])
+
+    async def test_map_ordered_raises_error_of_items(self):
+        async def items():
+            yield 0
+            raise RuntimeError("page failed")
+
+        resolution = self.resolver_.map_ordered(lambda index: index, items())
+        self.assertEqual(await resolution.__anext__(), 0)
+        with self.assertRaises(RuntimeError):
+            await resolution.__anext__()
+
+    async def test_map_ordered_failed_lookup_yields_none(self):
+        def lookup(index):
+            if index == 1:
+                raise ValueError("video unavailable")
+            return index
+
+        resolution = self.resolver_.map_ordered(lookup, range(3))
+
+        results = [result async for result in resolution]
+        self.assertEqual(results, [0, None, 2])
+
+    async def test_map_ordered_cancel_stops_lookups(self):
+        self.resolver_.concurrency = 2
+        looked_up = []
+
+        def lookup(index):
+            looked_up.append(index)
+            return index
+
+        resolution = self.resolver_.map_ordered(lookup, range(100))
+        await resolution.__anext__()
+        resolution.cancel()
+        await asyncio.sleep(0.05)
+
+        with self.assertRaises(StopAsyncIteration):
+            await resolution.__anext__()
+        self.assertLess(len(looked_up), 10)
+
+    async def test_concurrent_identical_lookups_share_one_call(self):
+        calls = []
+
+        def lookup(key):
+            calls.append(key)
+            time.sleep(0.1)
+            return key.upper()
+
+        results = await asyncio.gather(
+            *(
+                self.resolver_.run(self.resolver_.single_flight.run, key, lookup, key)
+                for key in ("a", "a", "b")
+            )
+        )
+
+        self.assertEqual(results, ["A", "A", "B"])
+        self.assertCountEqual(calls, ["a", "b"])
+
+
+class SingleFlightTest(unittest.TestCase):
+    """SingleFlight test suite"""
+
+    def setUp(self):
+        # pylint: disable=attribute-defined-outside-init
+        self.single_flight_ = resolver.SingleFlight()
+        self.calls_ = 0
+        self.release_ = threading.Event()
+
+    def lookup(self, result):
+        self.calls_ += 1
+        self.release_.wait(1)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def run_in_threads(self, n_threads, result):
+        outcomes = []
+
+        def run():
+            try:
+                outcomes.append(self.single_flight_.run("key", self.lookup, result))
+            except ValueError as err:
+                outcomes.append(err)
+
+        threads = [threading.Thread(target=run) for _ in range(n_threads)]
+        for thread in threads:
+            thread.start()
+        while self.single_flight_.coalesced < n_threads - 1:
+            time.sleep(0.001)
+        self.release_.set()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_waiters_share_result(self):
+        outcomes = self.run_in_threads(4, "media")
+
+        self.assertEqual(outcomes, ["media"] * 4)
+        self.assertEqual(self.calls_, 1)
+
+    def test_waiters_share_exception(self):
+        error = ValueError("Video unavailable")
+
+        outcomes = self.run_in_threads(3, error)
+
+        self.assertEqual(outcomes, [error] * 3)
+        self.assertEqual(self.calls_, 1)
+
+    def test_waiters_time_out(self):
+        self.single_flight_.timeout = 0.01
+        leader = threading.Thread(
+            target=self.single_flight_.run, args=("key", self.lookup, "media")
+        )
+        leader.start()
+        while self.calls_ == 0:
+            time.sleep(0.001)
+
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            self.single_flight_.run("key", self.lookup, "media")
+        self.release_.set()
+        leader.join()
+
+        self.assertEqual(self.calls_, 1)
+
+    def test_finished_calls_are_not_cached(self):
+        self.release_.set()
+
+        self.single_flight_.run("key", self.lookup, 1)
+        self.single_flight_.run("key", self.lookup, 2)
+
+        self.assertEqual(self.calls_, 2)
+        self.assertEqual(self.single_flight_.coalesced, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+
+import asyncio
+import unittest
+from unittest import mock
+
+import scheduler  # pylint: disable=import-error
+
+
+class IdleSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    """IdleScheduler test suite"""
+
+    async def asyncSetUp(self):
+        # pylint: disable=attribute-defined-outside-init
+        self.scheduler_ = scheduler.IdleScheduler(asyncio.get_running_loop())
+
+    async def test_callback_runs_after_delay(self):
+        callback = mock.AsyncMock()
+        self.scheduler_.schedule("guild", 0.05, callback)
+
+        await asyncio.sleep(0.01)
+        callback.assert_not_awaited()
+        await asyncio.sleep(0.1)
+        callback.assert_awaited_once()
+        self.assertEqual(len(self.scheduler_), 0)
+
+    async def test_rescheduling_replaces_deadline(self):
+        callback = mock.AsyncMock()
+        self.scheduler_.schedule("guild", 0.05, callback)
+        await asyncio.sleep(0.03)
+        self.scheduler_.schedule("guild", 0.05, callback)
+
+        await asyncio.sleep(0.04)
+        callback.assert_not_awaited()
+        await asyncio.sleep(0.05)
+        callback.assert_awaited_once()
+
+    async def test_cancel(self):
+        callback = mock.AsyncMock()
+        self.scheduler_.schedule("guild", 0.01, callback)
+        self.scheduler_.cancel("guild")
+
+        await asyncio.sleep(0.05)
+        callback.assert_not_awaited()
+
+    async def test_many_reschedules_keep_heap_bounded(self):
+        callbacks = {guild: mock.AsyncMock() for guild in range(10)}
+        for _ in range(100):
+            for guild, callback in callbacks.items():
+                self.scheduler_.schedule(guild, 0.05, callback)
+
+        self.assertEqual(len(self.scheduler_), 10)
+        self.assertLess(len(self.scheduler_.heap), 100)
+        await asyncio.sleep(0.1)
+        for callback in callbacks.values():
+            callback.assert_awaited_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+
+import sys
+import time
+import unittest
+from unittest import mock
+
+import shards  # pylint: disable=import-error
+
+
+def report_and_exit(shard_id, shard_count, metrics_queue, exit_code):
+    metrics_queue.put({"shard_id": shard_id, "shard_count": shard_count})
+    sys.exit(exit_code)
+
+
+def wait_for_exit(supervisor):
+    for shard in supervisor.shards:
+        if shard.process is not None:
+            shard.process.join(5)
+
+
+class ShardSupervisorTest(unittest.TestCase):
+    """ShardSupervisor test suite"""
+
+    def setUp(self):
+        self.supervisor_ = shards.ShardSupervisor(report_and_exit, 2, args=(1,))
+        delay_patch = mock.patch.object(
+            shards.ShardSupervisor, "RESTART_DELAY_SECONDS", 0
+        )
+        delay_patch.start()
+        self.addCleanup(delay_patch.stop)
+
+    def tearDown(self):
+        self.supervisor_.stop()
+
+    def test_starts_one_process_per_shard(self):
+        self.supervisor_.poll()
+        wait_for_exit(self.supervisor_)
+        time.sleep(0.1)
+        self.supervisor_.collect_metrics()
+
+        metrics = self.supervisor_.metrics()
+        self.assertEqual(sorted(metrics), [0, 1])
+        self.assertEqual(metrics[1]["shard_id"], 1)
+        self.assertEqual(metrics[1]["shard_count"], 2)
+
+    def test_exited_shards_are_restarted(self):
+        self.supervisor_.poll()
+        wait_for_exit(self.supervisor_)
+        self.supervisor_.poll()
+
+        for shard in self.supervisor_.shards:
+            self.assertEqual(shard.restarts, 1)
+            self.assertIsNotNone(shard.process)
+
+    def test_restart_delay_backs_off(self):
+        with mock.patch.object(shards.ShardSupervisor, "RESTART_DELAY_SECONDS", 10):
+            self.supervisor_.poll()
+            wait_for_exit(self.supervisor_)
+            self.supervisor_.poll()
+
+            shard = self.supervisor_.shards[0]
+            self.assertIsNone(shard.process)
+            self.assertGreater(shard.next_start, time.time() + 5)
+
+            shard.next_start = 0
+            self.supervisor_.poll()
+            wait_for_exit(self.supervisor_)
+            self.supervisor_.poll()
+            self.assertGreater(shard.next_start, time.time() + 15)
+
+
+if __name__ == "__main__":
+    unittest.main()
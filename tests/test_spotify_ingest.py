@@ -0,0 +1,135 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+
+import asyncio
+import unittest
+from unittest import mock
+
+import requests  # pylint: disable=import-error
+import spotipy  # pylint: disable=import-error
+
+import resolver  # pylint: disable=import-error
+from spotify_ingest import SpotifyIngest  # pylint: disable=import-error
+
+
+def create_track(name):
+    return {
+        "name": name,
+        "duration_ms": 1000,
+        "artists": [{"name": "artist"}, {"name": "featuring"}],
+        "popularity": 50,
+    }
+
+
+def create_spotify(n_tracks):
+    tracks = [create_track(f"track{index}") for index in range(n_tracks)]
+
+    def playlist_items(_url, fields, limit, offset, additional_types):
+        # pylint: disable=unused-argument
+        items = [{"track": track} for track in tracks[offset : offset + limit]]
+        return {"items": items, "total": n_tracks}
+
+    def album_tracks(_url, limit, offset):
+        return {"items": tracks[offset : offset + limit], "total": n_tracks}
+
+    spotify = mock.Mock()
+    spotify.playlist_items = mock.Mock(side_effect=playlist_items)
+    spotify.album_tracks = mock.Mock(side_effect=album_tracks)
+    spotify.track = mock.Mock(side_effect=lambda _url: tracks[0])
+    return spotify
+
+
+class SpotifyIngestTest(unittest.IsolatedAsyncioTestCase):
+    """SpotifyIngest test suite"""
+
+    async def asyncSetUp(self):
+        # pylint: disable=attribute-defined-outside-init
+        self.resolver_ = resolver.MediaResolver(asyncio.get_running_loop())
+
+    async def asyncTearDown(self):
+        self.resolver_.shutdown()
+
+    async def ingest_all(self, ingest):
+        tracks = ingest.first_page()
+        async for page in ingest.pages(self.resolver_):
+            tracks += page
+        return tracks
+
+    async def test_follows_playlist_pagination(self):
+        spotify = create_spotify(250)
+        ingest = SpotifyIngest(spotify, "playlist", "playlist_url")
+
+        tracks = await self.ingest_all(ingest)
+
+        self.assertEqual(ingest.total, 250)
+        self.assertEqual(
+            [track["name"] for track in tracks], [f"track{i}" for i in range(250)]
+        )
+        self.assertEqual(spotify.playlist_items.call_count, 3)
+        _, kwargs = spotify.playlist_items.call_args
+        self.assertEqual(kwargs["limit"], SpotifyIngest.PLAYLIST_PAGE_SIZE)
+        self.assertEqual(kwargs["fields"], SpotifyIngest.PLAYLIST_FIELDS)
+
+    async def test_follows_album_pagination(self):
+        spotify = create_spotify(120)
+        ingest = SpotifyIngest(spotify, "album", "album_url")
+
+        tracks = await self.ingest_all(ingest)
+
+        self.assertEqual(len(tracks), 120)
+        self.assertEqual(spotify.album_tracks.call_count, 3)
+
+    async def test_keeps_only_used_fields(self):
+        ingest = SpotifyIngest(create_spotify(1), "track", "track_url")
+
+        self.assertEqual(
+            ingest.first_page(),
+            [
+                {
+                    "name": "track0",
+                    "artists": [{"name": "artist"}],
+                    "duration_ms": 1000,
+                }
+            ],
+        )
+
+    async def test_skips_missing_tracks(self):
+        spotify = create_spotify(0)
+        spotify.playlist_items = mock.Mock(
+            return_value={
+                "items": [{"track": None}, {"track": create_track("track")}],
+                "total": 2,
+            }
+        )
+        ingest = SpotifyIngest(spotify, "playlist", "playlist_url")
+
+        tracks = await self.ingest_all(ingest)
+
+        self.assertEqual([track["name"] for track in tracks], ["track"])
+
+    async def test_skips_failed_pages(self):
+        for error in (
+            spotipy.SpotifyException(500, -1, "error"),
+            requests.exceptions.ConnectionError("Connection reset by peer"),
+        ):
+            with self.subTest(error=error):
+                spotify = create_spotify(150)
+                playlist_items = spotify.playlist_items.side_effect
+
+                def failing_playlist_items(
+                    url, error=error, playlist_items=playlist_items, **kwargs
+                ):
+                    if kwargs["offset"] == 100:
+                        raise error
+                    return playlist_items(url, **kwargs)
+
+                spotify.playlist_items.side_effect = failing_playlist_items
+                ingest = SpotifyIngest(spotify, "playlist", "playlist_url")
+
+                tracks = await self.ingest_all(ingest)
+
+                self.assertEqual(len(tracks), 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-module-docstring
+
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+import resolver  # pylint: disable=import-error
+import youtube_ingest  # pylint: disable=import-error
+from youtube_ingest import YouTubeIngest  # pylint: disable=import-error
+
+
+def create_video(index, **fields):
+    video = {
+        "videoId": f"video{index:06d}",
+        "title": {"runs": [{"text": f"title{index}"}]},
+        "lengthSeconds": "200",
+        "isPlayable": True,
+    }
+    video.update(fields)
+    return {"playlistVideoRenderer": video}
+
+
+def with_continuation(items, token):
+    if token is None:
+        return items
+    continuation = {
+        "continuationItemRenderer": {
+            "continuationEndpoint": {"continuationCommand": {"token": token}}
+        }
+    }
+    return items + [continuation]
+
+
+def create_html_data(items, token=None):
+    playlist = {
+        "playlistVideoListRenderer": {"contents": with_continuation(items, token)}
+    }
+    return {
+        "contents": {
+            "twoColumnBrowseResultsRenderer": {
+                "tabs": [
+                    {
+                        "tabRenderer": {
+                            "content": {
+                                "sectionListRenderer": {
+                                    "contents": [
+                                        {
+                                            "itemSectionRenderer": {
+                                                "contents": [playlist]
+                                            }
+                                        }
+                                    ]
+                                }
+                            }
+                        }
+                    }
+                ]
+            }
+        }
+    }
+
+
+def create_continuation_data(items, token=None):
+    action = {
+        "appendContinuationItemsAction": {
+            "continuationItems": with_continuation(items, token)
+        }
+    }
+    return {"onResponseReceivedActions": [action]}
+
+
+def create_pytube(n_videos, page_size=100):
+    """Mocks of the pytube functions YouTubeIngest uses, serving n_videos videos"""
+    videos = [create_video(index) for index in range(n_videos)]
+
+    def page(start, create_data):
+        end = start + page_size
+        token = str(end) if end < n_videos else None
+        return create_data(videos[start:end], token)
+
+    pytube = mock.Mock()
+    pytube.extract.initial_data = mock.Mock(
+        side_effect=lambda _html: page(0, create_html_data)
+    )
+    pytube.request.post = mock.Mock(
+        side_effect=lambda _url, extra_headers, data: json.dumps(
+            page(int(data["continuation"]), create_continuation_data)
+        )
+    )
+    playlist = mock.Mock(length=n_videos)
+    playlist._build_continuation_url = mock.Mock(  # pylint: disable=protected-access
+        side_effect=lambda token: ("url", {}, {"continuation": token})
+    )
+    return pytube, playlist
+
+
+class YouTubeIngestTest(unittest.IsolatedAsyncioTestCase):
+    """YouTubeIngest test suite"""
+
+    async def asyncSetUp(self):
+        # pylint: disable=attribute-defined-outside-init
+        self.resolver_ = resolver.MediaResolver(asyncio.get_running_loop())
+
+    async def asyncTearDown(self):
+        self.resolver_.shutdown()
+
+    async def list_videos(self, ingest):
+        """All videos of the playlist, fetched page by page"""
+        pages = [ingest.first_page()]
+        pages += [page async for page in ingest.pages(self.resolver_)]
+        return [track for page in pages for track in page]
+
+    async def test_follows_continuations(self):
+        pytube, playlist = create_pytube(250)
+        ingest = YouTubeIngest("playlist_url", playlist)
+
+        with mock.patch.object(youtube_ingest, "pytube", pytube):
+            tracks = await self.list_videos(ingest)
+
+        self.assertEqual(ingest.total, 250)
+        self.assertEqual(
+            [track["title"] for track in tracks], [f"title{i}" for i in range(250)]
+        )
+        self.assertEqual(pytube.request.post.call_count, 2)
+
+    async def test_single_page_total_is_exact(self):
+        pytube, playlist = create_pytube(20)
+        playlist.length = 25  # Counting hidden videos
+        ingest = YouTubeIngest("playlist_url", playlist)
+
+        with mock.patch.object(youtube_ingest, "pytube", pytube):
+            tracks = await self.list_videos(ingest)
+
+        self.assertEqual((len(tracks), ingest.total), (20, 20))
+
+    async def test_failed_page_ends_playlist(self):
+        pytube, playlist = create_pytube(250)
+        pytube.request.post.side_effect = OSError("HTTP Error 500")
+        ingest = YouTubeIngest("playlist_url", playlist)
+
+        with mock.patch.object(youtube_ingest, "pytube", pytube):
+            tracks = await self.list_videos(ingest)
+
+        self.assertEqual(len(tracks), 100)
+
+    def test_parse_skips_unplayable_and_duplicate_videos(self):
+        data = create_html_data(
+            [
+                create_video(1),
+                create_video(2, isPlayable=False, title={"simpleText": "[Deleted]"}),
+                create_video(3, title={"simpleText": "simple"}),
+                create_video(1),
+                create_video(4, lengthSeconds=None),
+            ],
+            token="next",
+        )
+
+        tracks, continuation = YouTubeIngest.parse(data)
+
+        self.assertEqual(
+            tracks,
+            [
+                {"videoid": "video000001", "title": "title1", "length": 200},
+                {"videoid": "video000003", "title": "simple", "length": 200},
+                {"videoid": "video000004", "title": "title4", "length": 0},
+            ],
+        )
+        self.assertEqual(continuation, "next")
+
+    def test_parse_unknown_page(self):
+        self.assertEqual(YouTubeIngest.parse({"contents": {}}), ([], None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+"""
+Lists the videos of YouTube playlists from the playlist pages themselves.
+"""
+# pylint: disable=import-error
+
+import asyncio
+import json
+import logging
+
+from lazy import LazyModule
+
+pytube = LazyModule("pytube")
+
+
+class YouTubeIngest:
+    """
+    Lists the videos of a YouTube playlist.
+
+    Each page of a playlist lists the id, title and length of up to 100 videos,
+    which is all the bot needs to queue them, so no video is looked up on its own.
+    The first page comes with the HTML of the playlist, every page after that is
+    requested with the continuation token of the one before, so unlike Spotify
+    playlists the pages can only be fetched one at a time. pytube is used for
+    fetching the pages, the videos are read from them here.
+    """
+
+    def __init__(self, url, playlist=None):
+        """
+        Arguments:
+          url: URL of the playlist.
+          playlist: The pytube Playlist of url, created if not given.
+        """
+        self.url = url
+        self.playlist = playlist
+        self.total = None
+        self.continuation = None
+
+    @staticmethod
+    def compact(renderer):
+        """
+        Returns the video id, title and length in seconds of a video in the
+        listing, or None if the video can't be played, e.g. if it was deleted
+        """
+        if not renderer.get("isPlayable", True):
+            return None
+        title = renderer.get("title") or {}
+        if "runs" in title:
+            title = "".join(run["text"] for run in title["runs"])
+        else:
+            title = title.get("simpleText", "")
+        return {
+            "videoid": renderer["videoId"],
+            "title": title,
+            # Livestreams have no length, they are skipped when they come up
+            "length": int(renderer.get("lengthSeconds") or 0),
+        }
+
+    @classmethod
+    def parse(cls, data):
+        """
+        Returns the videos in a page of a playlist and the continuation token of
+        the next page, or None if it's the last one.
+
+        Arguments:
+          data: The initial data of the playlist's HTML, or the response to a
+            continuation request.
+        """
+        items = None
+        try:
+            sections = data["contents"]["twoColumnBrowseResultsRenderer"]["tabs"][0][
+                "tabRenderer"
+            ]["content"]["sectionListRenderer"]["contents"]
+        except (KeyError, IndexError, TypeError):
+            sections = []
+        # Playlists with submenus have the videos in the second section
+        for section in sections:
+            try:
+                items = section["itemSectionRenderer"]["contents"][0][
+                    "playlistVideoListRenderer"
+                ]["contents"]
+                break
+            except (KeyError, IndexError, TypeError):
+                continue
+        if items is None:
+            # Not the HTML of the playlist, but a continuation response
+            try:
+                items = data["onResponseReceivedActions"][0][
+                    "appendContinuationItemsAction"
+                ]["continuationItems"]
+            except (KeyError, IndexError, TypeError):
+                logging.warning("No videos found in YouTube playlist page")
+                return [], None
+
+        tracks = []
+        seen = set()
+        continuation = None
+        for item in items:
+            if "continuationItemRenderer" in item:
+                continuation = item["continuationItemRenderer"]["continuationEndpoint"][
+                    "continuationCommand"
+                ]["token"]
+                continue
+            renderer = item.get("playlistVideoRenderer")
+            if renderer is None:
+                continue
+            track = cls.compact(renderer)
+            if track is None or track["videoid"] in seen:
+                continue
+            seen.add(track["videoid"])
+            tracks.append(track)
+        return tracks, continuation
+
+    def first_page(self):
+        """
+        Fetch the first page of videos and the number of videos in the playlist,
+        if YouTube tells. Blocking, so call it from a worker.
+        """
+        if self.playlist is None:
+            self.playlist = pytube.Playlist(self.url)
+        tracks, self.continuation = self.parse(
+            pytube.extract.initial_data(self.playlist.html)
+        )
+        if self.continuation is None:
+            self.total = len(tracks)
+        else:
+            try:
+                self.total = max(self.playlist.length, len(tracks))
+            except (KeyError, IndexError, TypeError, ValueError):
+                self.total = None
+        return tracks
+
+    def fetch_page(self):
+        """
+        Fetch the page after the last one fetched. Returns None if the request
+        fails. Blocking, so call it from a worker.
+        """
+        # pylint: disable=protected-access
+        url, headers, data = self.playlist._build_continuation_url(self.continuation)
+        try:
+            response = pytube.request.post(url, extra_headers=headers, data=data)
+            tracks, self.continuation = self.parse(json.loads(response))
+        except (OSError, ValueError) as err:
+            logging.error("Failed to fetch page of %s: %s", self.url, err)
+            self.continuation = None
+            return None
+        return tracks
+
+    async def pages(self, resolver):
+        """
+        Async generator yielding the pages after the first one, in order. Call
+        first_page() first.
+        """
+        while self.continuation is not None:
+            try:
+                page = await resolver.run(self.fetch_page)
+            except asyncio.TimeoutError:
+                return
+            if page is None:
+                return
+            yield page